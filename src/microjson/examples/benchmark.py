@@ -0,0 +1,419 @@
+"""
+Benchmark of the tiling pipeline on synthetic datasets.
+
+Each case generates a dataset of polygons, points or lines with a fixed
+seed, using the polygon generator of microjson.polygen, and cuts it into
+JSON, PBF or Parquet tiles with TileWriter.microjson2tiles at a maxzoom and
+with a tolerance function. A case runs in a fresh process, so that its peak
+resident memory is its own, and records its throughput, output size and the
+time spent in each stage of microjson2vt, vt2pbf and TileWriter.
+
+By default, the cases cover every kind, format and tolerance function, at
+maxzooms 4 and 6 and with datasets of 10k features. With --full, they also
+cover datasets of 100k, 1M and 5M features, which take much longer and
+more disk space.
+
+The results are written to a JSON file, which can be compared with the file
+of another version of the package:
+
+    python -m microjson.examples.benchmark --full --output results.json
+    python -m microjson.examples.benchmark --full --output new.json \\
+        --compare results.json
+"""
+import argparse
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+import microjson
+from microjson.microjson2vt.instrumentation import Instrumentation
+from microjson.microjson2vt.microjson2vt import AVAILABLE_TOLERANCE_FUNCTIONS
+from microjson.polygen import (
+    assign_meta_types_and_values,
+    generate_convex_polygon,
+    generate_meta_values,
+)
+from microjson.tilemodel import TileLayer, TileModel
+from microjson.tilewriter import TileWriter
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+KINDS = ["polygons", "points", "lines"]
+FORMATS = ["json", "pbf", "parquet"]
+# size of the grid cell holding each generated feature
+CELL_SIZE = 100
+MIN_VERTICES = 5
+MAX_VERTICES = 32
+N_KEYS = 4
+N_VARIANTS = 10
+# numbers of features of the datasets, by default and with --full
+DEFAULT_SCALES = [10000]
+FULL_SCALES = [10000, 100000, 1000000, 5000000]
+DEFAULT_MAXZOOMS = [4, 6]
+
+
+def generate_geometry(kind, x0, y0, x1, y1):
+    """
+    Generates a random geometry of a kind within a grid cell.
+
+    Returns:
+        dict: The GeoJSON geometry
+    """
+    if kind == "polygons":
+        num_vertices = random.randint(MIN_VERTICES, MAX_VERTICES)
+        coordinates = generate_convex_polygon(x0, y0, x1, y1, num_vertices)
+        # the convex hull of few points can have too few vertices
+        while len(coordinates) < MIN_VERTICES:
+            num_vertices += 1
+            coordinates = generate_convex_polygon(x0, y0, x1, y1, num_vertices)
+        return {"type": "Polygon", "coordinates": [coordinates]}
+    if kind == "points":
+        return {
+            "type": "Point",
+            "coordinates": [random.uniform(x0, x1), random.uniform(y0, y1)],
+        }
+    if kind == "lines":
+        xs = sorted(
+            random.uniform(x0, x1) for _ in range(random.randint(2, MAX_VERTICES // 2))
+        )
+        return {
+            "type": "LineString",
+            "coordinates": [[x, random.uniform(y0, y1)] for x in xs],
+        }
+    raise ValueError(f"Unknown dataset kind {kind}, expected one of {KINDS}")
+
+
+def write_dataset(kind, n_features, seed, path):
+    """
+    Writes a MicroJSON FeatureCollection of n_features random features of a
+    kind, one per cell of a square grid, to a file. The features are
+    streamed to the file, so that large datasets need not fit in memory.
+
+    Args:
+        kind (str): "polygons", "points" or "lines"
+        n_features (int): The number of features
+        seed (int): The seed of the random generator
+        path (str): The path of the file to write
+
+    Returns:
+        dict: The number of features and vertices, the side of the grid
+        and the size of the file in bytes
+    """
+    random.seed(seed)
+    _, meta_values_options = assign_meta_types_and_values(N_KEYS, N_VARIANTS)
+    num_cells = math.ceil(math.sqrt(n_features))
+    vertices = 0
+    with open(path, "w") as f:
+        f.write('{"type": "FeatureCollection", "properties": {}, "features": [')
+        for n in range(n_features):
+            i, j = divmod(n, num_cells)
+            x0, y0 = i * CELL_SIZE, j * CELL_SIZE
+            geometry = generate_geometry(kind, x0, y0, x0 + CELL_SIZE, y0 + CELL_SIZE)
+            if kind == "polygons":
+                vertices += len(geometry["coordinates"][0])
+            elif kind == "lines":
+                vertices += len(geometry["coordinates"])
+            else:
+                vertices += 1
+            feature = {
+                "type": "Feature",
+                "id": n,
+                "geometry": geometry,
+                "properties": generate_meta_values(meta_values_options),
+            }
+            f.write(("," if n else "") + "\n" + json.dumps(feature))
+        f.write("\n]}\n")
+    return {
+        "features": n_features,
+        "vertices": vertices,
+        "side": num_cells * CELL_SIZE,
+        "bytes": os.path.getsize(path),
+    }
+
+
+def peak_rss():
+    """Returns the peak resident memory of the process in bytes, or None."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return rss if sys.platform == "darwin" else rss * 1024
+
+
+def run_case(case, dataset, workdir):
+    """
+    Cuts a generated dataset into tiles and measures the run.
+
+    Args:
+        case (dict): The kind, features, seed, format, maxzoom and
+            tolerance of the case
+        dataset (dict): The path and statistics of the dataset, as
+            returned by write_dataset
+        workdir (str): The directory the tiles are written to, and removed
+            from afterwards
+
+    Returns:
+        dict: The case with its measurements
+    """
+    name = "{kind}-{features}-{format}-z{maxzoom}-{tolerance}".format(**case)
+    tiles_dir = os.path.join(workdir, name)
+    extension = {"json": "json", "pbf": "pbf", "parquet": "parquet"}
+    side = dataset["side"]
+    tile_model = TileModel(
+        tilejson="3.0.0",
+        tiles=[Path(tiles_dir, f"{{z}}/{{x}}/{{y}}.{extension[case['format']]}")],
+        name=name,
+        minzoom=0,
+        maxzoom=case["maxzoom"],
+        bounds=[0, 0, side, side],
+        center=[0, side / 2, side / 2],
+        vector_layers=[
+            TileLayer(id=case["kind"], fields={}, minzoom=0, maxzoom=case["maxzoom"])
+        ],
+    )
+    writer = TileWriter(
+        tile_model,
+        pbf=case["format"] == "pbf",
+        parquet=case["format"] == "parquet",
+    )
+    timer = Instrumentation()
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    tiles = writer.microjson2tiles(
+        dataset["path"],
+        tolerance_key=case["tolerance"],
+        instrumentation=timer,
+    )
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    output_bytes = sum(os.path.getsize(tile) for tile in tiles)
+    shutil.rmtree(tiles_dir, ignore_errors=True)
+
+    stages = {
+        stage: {key: total[key] for key in ("calls", "wall", "cpu")}
+        for stage, total in timer.report().items()
+    }
+    return {
+        **case,
+        "name": name,
+        "vertices": dataset["vertices"],
+        "input_bytes": dataset["bytes"],
+        "tiles": len(tiles),
+        "output_bytes": output_bytes,
+        "duplicate_ratio": writer.tile_stats["duplicate_ratio"],
+        "wall": wall,
+        "cpu": cpu,
+        "features_per_second": case["features"] / wall,
+        "vertices_per_second": dataset["vertices"] / wall,
+        "peak_rss": peak_rss(),
+        "stages": stages,
+    }
+
+
+def run_benchmarks(
+    workdir,
+    scales=DEFAULT_SCALES,
+    kinds=KINDS,
+    formats=FORMATS,
+    maxzooms=DEFAULT_MAXZOOMS,
+    tolerances=tuple(AVAILABLE_TOLERANCE_FUNCTIONS),
+    seed=0,
+    isolate=True,
+):
+    """
+    Runs every combination of the given settings as one case.
+
+    Args:
+        workdir (str): The directory for the datasets and tiles
+        scales (list): The numbers of features of the datasets
+        kinds (list): The kinds of dataset, see KINDS
+        formats (list): The tile formats, see FORMATS
+        maxzooms (list): The maxzoom of the tilesets
+        tolerances (list): The keys of the tolerance functions
+        seed (int): The seed of the generated datasets
+        isolate (bool): Whether each case runs in a fresh process, for a
+            peak memory of its own
+
+    Returns:
+        dict: The environment and the results of the cases
+    """
+    for format_ in formats:
+        if format_ not in FORMATS:
+            raise ValueError(f"Unknown format {format_}, expected one of {FORMATS}")
+    for tolerance in tolerances:
+        if tolerance not in AVAILABLE_TOLERANCE_FUNCTIONS:
+            raise ValueError(
+                f"Unknown tolerance function {tolerance}, expected one of "
+                f"{list(AVAILABLE_TOLERANCE_FUNCTIONS)}"
+            )
+    os.makedirs(workdir, exist_ok=True)
+    executor = None
+    if isolate:
+        executor = ProcessPoolExecutor(
+            max_workers=1, mp_context=get_context("spawn"), max_tasks_per_child=1
+        )
+    results = []
+    try:
+        for kind, n_features in itertools.product(kinds, scales):
+            path = os.path.join(workdir, f"{kind}-{n_features}-{seed}.json")
+            dataset = {"path": path, **write_dataset(kind, n_features, seed, path)}
+            for format_, maxzoom, tolerance in itertools.product(
+                formats, maxzooms, tolerances
+            ):
+                case = {
+                    "kind": kind,
+                    "features": n_features,
+                    "seed": seed,
+                    "format": format_,
+                    "maxzoom": maxzoom,
+                    "tolerance": tolerance,
+                }
+                if executor is None:
+                    result = run_case(case, dataset, workdir)
+                else:
+                    result = executor.submit(run_case, case, dataset, workdir).result()
+                results.append(result)
+            os.remove(path)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return {"environment": environment(), "results": results}
+
+
+def environment():
+    """Returns the versions and machine the benchmark ran with."""
+    import numpy
+
+    return {
+        "microjson": microjson.__version__,
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Compares the cases of two benchmark runs by name.
+
+    Args:
+        baseline (dict): The results of the earlier run
+        current (dict): The results of the later run
+        threshold (float): The relative increase of the wall time, peak
+            memory or output size counted as a regression
+
+    Returns:
+        list: For each case in both runs, its name, the ratio of each
+        measurement to the baseline, and whether it regressed
+    """
+    earlier = {result["name"]: result for result in baseline["results"]}
+    comparison = []
+    for result in current["results"]:
+        before = earlier.get(result["name"])
+        if before is None:
+            continue
+        ratios = {}
+        for key in ("wall", "peak_rss", "output_bytes"):
+            if before[key] and result[key] is not None:
+                ratios[key] = result[key] / before[key]
+        comparison.append(
+            {
+                "name": result["name"],
+                **ratios,
+                "regression": any(r > 1 + threshold for r in ratios.values()),
+            }
+        )
+    return comparison
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--scales",
+        nargs="+",
+        type=int,
+        help=f"Numbers of features of the datasets, {DEFAULT_SCALES} by default",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help=f"Runs datasets of {FULL_SCALES} features, unless --scales is given",
+    )
+    parser.add_argument("--kinds", nargs="+", choices=KINDS, default=KINDS)
+    parser.add_argument("--formats", nargs="+", choices=FORMATS, default=FORMATS)
+    parser.add_argument("--maxzooms", nargs="+", type=int, default=DEFAULT_MAXZOOMS)
+    parser.add_argument(
+        "--tolerances",
+        nargs="+",
+        choices=list(AVAILABLE_TOLERANCE_FUNCTIONS),
+        default=list(AVAILABLE_TOLERANCE_FUNCTIONS),
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--workdir", default="benchmark", help="Directory for the datasets and tiles"
+    )
+    parser.add_argument(
+        "--output", default="benchmark.json", help="Path of the results file"
+    )
+    parser.add_argument("--compare", help="Results file of an earlier run")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="Relative increase counted as a regression",
+    )
+    args = parser.parse_args()
+    if args.scales is None:
+        args.scales = FULL_SCALES if args.full else DEFAULT_SCALES
+
+    results = run_benchmarks(
+        args.workdir,
+        scales=args.scales,
+        kinds=args.kinds,
+        formats=args.formats,
+        maxzooms=args.maxzooms,
+        tolerances=args.tolerances,
+        seed=args.seed,
+    )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for result in results["results"]:
+        print(
+            f"{result['name']}: {result['wall']:.2f} s, "
+            f"{result['features_per_second']:.0f} features/s, "
+            f"{result['tiles']} tiles, {result['output_bytes']} bytes"
+        )
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = 0
+        for row in compare_results(baseline, results, args.threshold):
+            ratios = ", ".join(
+                f"{key} x{row[key]:.2f}"
+                for key in ("wall", "peak_rss", "output_bytes")
+                if key in row
+            )
+            flag = " REGRESSION" if row["regression"] else ""
+            print(f"{row['name']}: {ratios}{flag}")
+            regressions += row["regression"]
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
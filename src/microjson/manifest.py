@@ -0,0 +1,139 @@
+import hashlib
+import json
+from typing import Dict, Iterable, List, Optional
+
+# bumped when the manifest, or the tiles cut from the same input, change
+MANIFEST_VERSION = 1
+
+
+def digest(data: bytes) -> str:
+    """Returns the hex content hash of a tile or feature, see TileManifest."""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def feature_keys(features: Iterable[dict]) -> List[str]:
+    """
+    Returns a key for each GeoJSON feature, the hash of its JSON, followed
+    by the number of identical features before it, if any.
+
+    Args:
+        features (Iterable[dict]): The features
+
+    Returns:
+        List[str]: The keys of the features, in their order
+    """
+    keys = []
+    seen: Dict[str, int] = {}
+    for feature in features:
+        key = digest(
+            json.dumps(feature, sort_keys=True, separators=(",", ":")).encode()
+        )
+        count = seen.get(key, 0)
+        seen[key] = count + 1
+        keys.append(key if count == 0 else f"{key}-{count}")
+    return keys
+
+
+def geometry_bounds(geometry: Optional[dict]) -> Optional[List[float]]:
+    """
+    Returns the [minx, miny, maxx, maxy] bounds of the coordinates of a
+    GeoJSON geometry, or None for a geometry without coordinates.
+    """
+    if geometry is None:
+        return None
+    if geometry.get("type") == "GeometryCollection":
+        parts = [geometry_bounds(g) for g in geometry.get("geometries") or []]
+        parts = [part for part in parts if part is not None]
+        if not parts:
+            return None
+        return [
+            min(part[0] for part in parts),
+            min(part[1] for part in parts),
+            max(part[2] for part in parts),
+            max(part[3] for part in parts),
+        ]
+    minx = miny = float("inf")
+    maxx = maxy = float("-inf")
+    stack = [geometry.get("coordinates") or []]
+    while stack:
+        coords = stack.pop()
+        if coords and isinstance(coords[0], (int, float)):
+            minx = min(minx, coords[0])
+            miny = min(miny, coords[1])
+            maxx = max(maxx, coords[0])
+            maxy = max(maxy, coords[1])
+        else:
+            stack.extend(coords)
+    if minx > maxx:
+        return None
+    return [minx, miny, maxx, maxy]
+
+
+class TileManifest:
+    """
+    Records the content of a tileset written to a directory, to cut again
+    only the tiles that a change of the input reaches, see
+    TileWriter.microjson2tiles.
+
+    The manifest holds the hash of the settings the tiles were cut with,
+    the content hash of each tile, by "z/x/y", and the key and projected
+    bounding box of each input feature, in the input order. The features
+    that contributed to a tile are those whose box reaches it, see
+    MicroJsonVt.covering_tiles.
+
+    Attributes:
+        settings (str): Hash of the settings of the tileset
+        tiles (Dict[str, str]): Content hash of each tile, by "z/x/y"
+        features (List[list]): Key and [minx, miny, maxx, maxy] box, None
+        for a feature without geometry, of each input feature
+    """
+
+    def __init__(
+        self,
+        settings: str,
+        tiles: Optional[Dict[str, str]] = None,
+        features: Optional[List[list]] = None,
+    ):
+        self.settings = settings
+        self.tiles = {} if tiles is None else tiles
+        self.features = [] if features is None else features
+
+    @staticmethod
+    def settings_hash(settings: dict) -> str:
+        """Returns the hash of the JSON serialisable settings of a tileset."""
+        return digest(
+            json.dumps(
+                {"version": MANIFEST_VERSION, **settings}, sort_keys=True
+            ).encode()
+        )
+
+    def to_dict(self) -> dict:
+        """Returns the manifest as a JSON serialisable dict."""
+        return {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "tiles": self.tiles,
+            "features": self.features,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "TileManifest":
+        """Reads a manifest written by to_dict."""
+        return cls(data["settings"], data["tiles"], data["features"])
+
+    def save(self, path: str):
+        """Writes the manifest to a JSON file."""
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["TileManifest"]:
+        """
+        Reads a manifest from a JSON file, or returns None when it was
+        written by another version.
+        """
+        with open(path, "r") as file:
+            data = json.load(file)
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls.from_dict(data)
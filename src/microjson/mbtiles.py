@@ -0,0 +1,211 @@
+import hashlib
+import os
+import sqlite3
+from typing import Iterator, List, Optional, Tuple
+
+from .tilemodel import TileModel
+
+# suffix of a tiles template naming an MBTiles file instead of a directory
+MBTILES_SUFFIX = ".mbtiles"
+# tiles inserted by each executemany, and in each transaction
+INSERT_BATCH_SIZE = 1000
+TRANSACTION_SIZE = 100_000
+
+# the deduplicating schema of MBTiles 1.3: each distinct tile is stored once
+# in images, and map points the tiles to it
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);
+CREATE UNIQUE INDEX IF NOT EXISTS metadata_name ON metadata (name);
+CREATE TABLE IF NOT EXISTS map (
+    zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_id TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS map_index
+    ON map (zoom_level, tile_column, tile_row);
+CREATE TABLE IF NOT EXISTS images (tile_data BLOB, tile_id TEXT);
+CREATE UNIQUE INDEX IF NOT EXISTS images_id ON images (tile_id);
+CREATE VIEW IF NOT EXISTS tiles AS
+    SELECT map.zoom_level AS zoom_level,
+           map.tile_column AS tile_column,
+           map.tile_row AS tile_row,
+           images.tile_data AS tile_data
+    FROM map JOIN images ON images.tile_id = map.tile_id;
+"""
+
+
+def is_mbtiles(path) -> bool:
+    """Returns whether a tiles template names an MBTiles file."""
+    return str(path).endswith(MBTILES_SUFFIX)
+
+
+def tile_row(z: int, y: int) -> int:
+    """
+    Returns the MBTiles row of tile row y, as rows are numbered from the
+    bottom in MBTiles, and the inverse.
+    """
+    return (1 << z) - 1 - y
+
+
+class MBTiles:
+    """
+    A tileset stored in an MBTiles file, a SQLite database, instead of one
+    file per tile.
+
+    Tiles are added in batches of INSERT_BATCH_SIZE, in transactions of
+    TRANSACTION_SIZE tiles, and identical tiles, such as empty ones, are
+    stored once, keyed by their MD5 hash.
+
+    Attributes:
+        path (str): The path of the MBTiles file
+        tiles (int): The number of tiles added
+        blobs (int): The number of distinct tiles added
+    """
+
+    def __init__(self, path: str, mode: str = "r"):
+        """
+        Open an MBTiles file
+
+        Args:
+            path (str): The path of the MBTiles file
+            mode (str): "r" to read the tiles, "w" to add tiles to a new
+            file, which replaces any existing one once closed
+        """
+        if mode not in ("r", "w"):
+            raise ValueError(f"Invalid mode: {mode}, expected 'r' or 'w'")
+        self.path = str(path)
+        self.mode = mode
+        self.tiles = 0
+        self.blobs = 0
+        self._pending: List[Tuple[int, int, int, str, bytes]] = []
+        self._uncommitted = 0
+        if mode == "r":
+            if not os.path.exists(self.path):
+                raise FileNotFoundError(self.path)
+            self.connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        else:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            # the tiles are written to a temporary file, which replaces any
+            # earlier tileset when the file is closed, see close
+            for path in (self.path + ".tmp", self.path + ".tmp-journal"):
+                if os.path.exists(path):
+                    os.remove(path)
+            self.connection = sqlite3.connect(self.path + ".tmp")
+            # the file is only written by this connection, and written again
+            # from scratch after a crash
+            self.connection.execute("PRAGMA synchronous = OFF")
+            self.connection.executescript(SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close(abort=exc_type is not None)
+
+    def write_metadata(self, tile_json: TileModel, tile_format: str):
+        """
+        Store the TileJSON of the tileset in the metadata table, with the
+        fields of the MBTiles specification and the whole TileJSON under
+        json.
+
+        Args:
+            tile_json (TileModel): The TileJSON of the tileset
+            tile_format (str): The format of the tiles, "pbf", "json" or
+            "parquet"
+        """
+        metadata = {
+            "name": tile_json.name or os.path.basename(self.path),
+            "format": tile_format,
+            "json": tile_json.model_dump_json(exclude_none=True),
+        }
+        for key in ("minzoom", "maxzoom", "description", "version", "attribution"):
+            value = getattr(tile_json, key)
+            if value is not None:
+                metadata[key] = str(value)
+        for key in ("bounds", "center"):
+            value = getattr(tile_json, key)
+            if value is not None:
+                metadata[key] = ",".join(str(v) for v in value)
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO metadata (name, value) VALUES (?, ?)",
+            metadata.items(),
+        )
+        self.connection.commit()
+
+    def metadata(self) -> dict:
+        """Returns the metadata table of the tileset as a dict."""
+        return dict(self.connection.execute("SELECT name, value FROM metadata"))
+
+    def add_tile(self, z: int, x: int, y: int, data: bytes):
+        """
+        Add a tile, replacing any tile of the same coordinates. The tile is
+        inserted with the next batch.
+
+        Args:
+            z (int): The zoom level of the tile
+            x (int): The x coordinate of the tile
+            y (int): The y coordinate of the tile, numbered from the top
+            data (bytes): The encoded tile
+        """
+        tile_id = hashlib.md5(data).hexdigest()
+        self._pending.append((z, x, tile_row(z, y), tile_id, data))
+        self.tiles += 1
+        if len(self._pending) >= INSERT_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Insert the pending tiles, and commit every TRANSACTION_SIZE tiles."""
+        if self._pending:
+            cursor = self.connection.executemany(
+                "INSERT OR IGNORE INTO images (tile_data, tile_id) VALUES (?, ?)",
+                ((data, tile_id) for _, _, _, tile_id, data in self._pending),
+            )
+            self.blobs += max(cursor.rowcount, 0)
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO map "
+                "(zoom_level, tile_column, tile_row, tile_id) VALUES (?, ?, ?, ?)",
+                (tile[:4] for tile in self._pending),
+            )
+            self._uncommitted += len(self._pending)
+            self._pending = []
+        if self._uncommitted >= TRANSACTION_SIZE:
+            self.connection.commit()
+            self._uncommitted = 0
+
+    def get_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """
+        Returns the encoded tile z/x/y, y numbered from the top, or None
+        when the tileset has no such tile.
+        """
+        row = self.connection.execute(
+            "SELECT tile_data FROM tiles "
+            "WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+            (z, x, tile_row(z, y)),
+        ).fetchone()
+        return None if row is None else bytes(row[0])
+
+    def tile_coords(self, z: int) -> Iterator[Tuple[int, int]]:
+        """Yields the (x, y) coordinates of the tiles at zoom z."""
+        for x, row in self.connection.execute(
+            "SELECT tile_column, tile_row FROM map WHERE zoom_level = ?", (z,)
+        ):
+            yield x, tile_row(z, row)
+
+    def close(self, abort: bool = False):
+        """
+        Insert and commit the pending tiles, close the file and move it to
+        the path of the tileset.
+
+        Args:
+            abort (bool): Flag to indicate that writing failed, to remove
+            the file instead, keeping any earlier tileset
+        """
+        if self.mode == "w" and not abort:
+            self.flush()
+            self.connection.commit()
+        self.connection.close()
+        if self.mode == "w":
+            if abort:
+                os.remove(self.path + ".tmp")
+            else:
+                os.replace(self.path + ".tmp", self.path)
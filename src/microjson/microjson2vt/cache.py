@@ -0,0 +1,129 @@
+from collections import OrderedDict
+
+
+class ZoomCache:
+    """
+    Simplified geometry for each zoom level, computed the first time a zoom
+    is requested and kept under a memory budget.
+
+    When the cached zooms exceed the budget, the least recently used ones
+    are evicted and will be recomputed if they are needed again. Zooms can
+    also be released explicitly once no pending tile needs them.
+
+    Attributes:
+        compute (callable): returns the geometry of a zoom level
+        nbytes (callable): returns the approximate size of a computed zoom
+        max_bytes (int): memory budget in bytes, or None for no limit
+        stats (dict): number of computed and evicted zooms
+    """
+
+    def __init__(self, compute, nbytes, max_bytes=None):
+        self.compute = compute
+        self.nbytes = nbytes
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.stats = {"computed": 0, "evicted": 0}
+        self._zooms = OrderedDict()
+
+    def __contains__(self, z):
+        return z in self._zooms
+
+    def __len__(self):
+        return len(self._zooms)
+
+    def get(self, z):
+        """Returns the geometry of zoom z, computing it if needed."""
+        entry = self._zooms.get(z)
+        if entry is not None:
+            self._zooms.move_to_end(z)
+            return entry[0]
+
+        value = self.compute(z)
+        size = self.nbytes(value)
+        self._zooms[z] = (value, size)
+        self.size += size
+        self.stats["computed"] += 1
+
+        # evict the least recently used zooms, never the one just computed
+        while (
+            self.max_bytes is not None
+            and self.size > self.max_bytes
+            and len(self._zooms) > 1
+        ):
+            _, (_, evicted_size) = self._zooms.popitem(last=False)
+            self.size -= evicted_size
+            self.stats["evicted"] += 1
+        return value
+
+    def release(self, max_zoom=None):
+        """
+        Drops the cached zooms up to and including max_zoom, or every zoom
+        if max_zoom is None.
+        """
+        for z in list(self._zooms):
+            if max_zoom is None or z <= max_zoom:
+                _, size = self._zooms.pop(z)
+                self.size -= size
+
+
+class TileCache:
+    """
+    Least recently used order and estimated size of the tiles of a
+    MicroJsonVt index, under a limit on their number and memory.
+
+    The cache only does the bookkeeping: add and resize return the ids of
+    the tiles to evict, which the index then drops.
+
+    Attributes:
+        nbytes (callable): returns the approximate size of a tile
+        max_tiles (int): maximum number of tiles, or None for no limit
+        max_bytes (int): memory budget in bytes, or None for no limit
+    """
+
+    def __init__(self, nbytes, max_tiles=None, max_bytes=None):
+        self.nbytes = nbytes
+        self.max_tiles = max_tiles
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._tiles = OrderedDict()
+
+    def __contains__(self, id_):
+        return id_ in self._tiles
+
+    def __len__(self):
+        return len(self._tiles)
+
+    def touch(self, id_):
+        """Marks a tile as the most recently used one."""
+        if id_ in self._tiles:
+            self._tiles.move_to_end(id_)
+
+    def discard(self, id_):
+        """Forgets a tile dropped from the index."""
+        size = self._tiles.pop(id_, None)
+        if size is not None:
+            self.size -= size
+
+    def add(self, id_, tile):
+        """
+        Adds a tile, or updates the size of a tile already in the cache
+        after its content changed, and marks it as the most recently used.
+
+        Returns:
+            list: The ids of the least recently used tiles to evict to stay
+            within the limits, never the one just added
+        """
+        size = self.nbytes(tile)
+        self.size += size - self._tiles.get(id_, 0)
+        self._tiles[id_] = size
+        self._tiles.move_to_end(id_)
+
+        evicted = []
+        while len(self._tiles) > 1 and (
+            (self.max_tiles is not None and len(self._tiles) > self.max_tiles)
+            or (self.max_bytes is not None and self.size > self.max_bytes)
+        ):
+            evicted_id, evicted_size = self._tiles.popitem(last=False)
+            self.size -= evicted_size
+            evicted.append(evicted_id)
+        return evicted
@@ -5,7 +5,8 @@
 # Modifications by PolusAI, 2024
 
 import math
-from .feature import create_feature, Slice
+import numpy as np
+from .feature import create_feature, is_line_pieces, Slice
 
 
 r"""
@@ -33,16 +34,16 @@ def clip(features, scale, k1, k2, axis, minAll, maxAll, options, z=None):
     clipped = []
 
     for feature in features:
-        geometry_key = f'geometry_z{z}' if z is not None else 'geometry'
-        if isinstance(feature.get('geometry'), Slice):
+        geometry_key = f"geometry_z{z}" if z is not None else "geometry"
+        if isinstance(feature.get("geometry"), Slice):
             geometry = feature.get(geometry_key)
         else:
             geometry = Slice(feature.get(geometry_key))
 
-        type_ = feature.get('type')
+        type_ = feature.get("type")
 
-        min_ = feature.get('minX') if axis == 0 else feature.get('minY')
-        max_ = feature.get('maxX') if axis == 0 else feature.get('maxY')
+        min_ = feature.get("minX") if axis == 0 else feature.get("minY")
+        max_ = feature.get("maxX") if axis == 0 else feature.get("maxY")
 
         if min_ >= k1 and max_ < k2:  # trivial accept
             clipped.append(feature)
@@ -52,19 +53,30 @@ def clip(features, scale, k1, k2, axis, minAll, maxAll, options, z=None):
 
         newGeometry = Slice([])  # []
 
-        if type_ == 'Point' or type_ == 'MultiPoint':
+        if type_ == "Point" or type_ == "MultiPoint":
             clip_points(geometry, newGeometry, k1, k2, axis)
-        elif type_ == 'LineString':
-            clip_line(geometry, newGeometry, k1, k2,
-                      axis, False, options.get('lineMetrics', False))
-        elif type_ == 'MultiLineString':
+        elif type_ == "LineString":
+            if is_line_pieces(geometry):
+                # already cut into pieces by a previous clip at this zoom
+                clip_lines(geometry, newGeometry, k1, k2, axis, False)
+            else:
+                clip_line(
+                    geometry,
+                    newGeometry,
+                    k1,
+                    k2,
+                    axis,
+                    False,
+                    options.get("lineMetrics", False),
+                )
+        elif type_ == "MultiLineString":
             clip_lines(geometry, newGeometry, k1, k2, axis, False)
-        elif type_ == 'Polygon':
+        elif type_ == "Polygon":
             if any(isinstance(li, list) for li in geometry):
                 clip_lines(geometry, newGeometry, k1, k2, axis, True)
             else:
                 clip_line(geometry, newGeometry, k1, k2, axis, True, False)
-        elif type_ == 'MultiPolygon':
+        elif type_ == "MultiPolygon":
             for polygon in geometry:
                 newPolygon = Slice([])
                 clip_lines(polygon, newPolygon, k1, k2, axis, True)
@@ -73,13 +85,19 @@ def clip(features, scale, k1, k2, axis, minAll, maxAll, options, z=None):
 
         if len(newGeometry) > 0:
             new_feature = create_feature(
-                feature.get('id'), type_, newGeometry, feature.get('tags'))
+                feature.get("id"), type_, newGeometry, feature.get("tags")
+            )
             if z is not None:
-                new_feature[f'geometry_z{z}'] = newGeometry
+                new_feature[f"geometry_z{z}"] = newGeometry
+                if "index" in feature:
+                    # the converted feature this one was clipped from
+                    new_feature["index"] = feature["index"]
                 # set the geometries with higher zoom levels to the original
-                for i in range(z + 1, options.get('maxZoom') + 1):
-                    new_feature[f'geometry_z{i}'] = feature.get(
-                        f'geometry_z{i}')
+                for i in range(z + 1, options.get("maxZoom") + 1):
+                    key = f"geometry_z{i}"
+                    if key not in feature:
+                        break  # lazily simplified, looked up by index
+                    new_feature[key] = feature[key]
             clipped.append(new_feature)
 
     return clipped if len(clipped) > 0 else None
@@ -95,7 +113,7 @@ def clip_points(geom, newGeom, k1, k2, axis):
 def clip_line(geom, newGeom, k1, k2, axis, isPolygon, trackMetrics):
     slice_ = new_slice(geom)
     intersect = intersectX if axis == 0 else intersectY
-    l_l = geom.start if isinstance(geom, Slice) else 0.
+    l_l = geom.start if isinstance(geom, Slice) else 0.0
     segLen, t = None, None
 
     # length = len(geom) if isinstance(geom, list) else 0
@@ -155,8 +173,10 @@ def clip_line(geom, newGeom, k1, k2, axis, isPolygon, trackMetrics):
 
     # close the polygon if its endpoints are not the same after clipping
     last = len(slice_) - 3
-    if isPolygon and last >= 3 and (
-        slice_[last] != slice_[0] or slice_[last + 1] != slice_[1]
+    if (
+        isPolygon
+        and last >= 3
+        and (slice_[last] != slice_[0] or slice_[last + 1] != slice_[1])
     ):
         add_point(slice_, slice_[0], slice_[1], slice_[2])
 
@@ -167,9 +187,9 @@ def clip_line(geom, newGeom, k1, k2, axis, isPolygon, trackMetrics):
 
 def new_slice(line):
     slice_ = Slice([])
-    slice_.size = line.size if isinstance(line, Slice) else 0.
-    slice_.start = line.start if isinstance(line, Slice) else 0.
-    slice_.end = line.end if isinstance(line, Slice) else 0.
+    slice_.size = line.size if isinstance(line, Slice) else 0.0
+    slice_.start = line.start if isinstance(line, Slice) else 0.0
+    slice_.end = line.end if isinstance(line, Slice) else 0.0
     return slice_
 
 
@@ -194,3 +214,128 @@ def intersectY(out, ax, ay, bx, by, y):
     t = (y - ay) / (by - ay)
     add_point(out, ax + (bx - ax) * t, y, 1)
     return t
+
+
+def trivial_clip(mins, maxs, k1, k2):
+    """
+    Vectorised trivial accept/reject of bounding boxes against the k1/k2
+    band, as done per feature by clip.
+
+    Returns:
+        tuple: boolean arrays of the accepted and rejected boxes
+    """
+    accept = (mins >= k1) & (maxs < k2)
+    reject = (maxs < k1) | (mins >= k2)
+    return accept, reject
+
+
+def clip_rings(coords, ring_offsets, k1, k2, axis, is_polygon, is_points=None):
+    """
+    Clips a batch of rings between two axis-parallel lines in one vectorised
+    pass, with the same result as calling clip_line (or clip_points) on each
+    ring.
+
+    Args:
+        coords (np.ndarray): (n, 2) vertices of all rings
+        ring_offsets (np.ndarray): offsets of each ring into coords, rings
+            must not be empty
+        k1 (float): The lower line coordinate
+        k2 (float): The upper line coordinate
+        axis (int): 0 for x, 1 for y
+        is_polygon (np.ndarray): whether each ring is a polygon ring, which
+            is closed instead of being cut into pieces
+        is_points (np.ndarray): whether each ring is a set of points, which
+            are only filtered
+
+    Returns:
+        tuple: The clipped vertices, the offsets of the clipped rings into
+        them and the index of the input ring each clipped ring comes from
+    """
+    n = len(coords)
+    num_rings = len(ring_offsets) - 1
+    if n == 0:
+        return (
+            np.zeros((0, 2), dtype=np.float64),
+            np.zeros(1, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+        )
+    ring = np.repeat(np.arange(num_rings), ring_offsets[1:] - ring_offsets[:-1])
+
+    # a segment leaves every vertex but the last of a ring, or of a point set
+    segment = np.ones(n, dtype=bool)
+    segment[ring_offsets[1:] - 1] = False
+    if is_points is not None:
+        segment &= ~is_points[ring]
+
+    a = coords[:, axis]
+    b = np.empty(n, dtype=np.float64)
+    b[:-1] = a[1:]
+    b[-1] = a[-1]
+    inside = (a >= k1) & (a <= k2)
+    enter_low = segment & (a < k1) & (b > k1)
+    enter_high = segment & (a > k2) & (b < k2)
+    exit_low = segment & (b < k1) & (a >= k1)
+    exit_high = segment & (b > k2) & (a <= k2)
+
+    # every vertex emits up to two points in order: itself or the point
+    # where its segment enters the band, then the point where it exits
+    points = np.empty((n, 2, 2), dtype=np.float64)
+    emitted = np.zeros((n, 2), dtype=bool)
+    points[inside, 0] = coords[inside]
+    emitted[:, 0] = inside | enter_low | enter_high
+    emitted[:, 1] = exit_low | exit_high
+    for mask, slot, k in (
+        (enter_low, 0, k1),
+        (enter_high, 0, k2),
+        (exit_low, 1, k1),
+        (exit_high, 1, k2),
+    ):
+        index = np.flatnonzero(mask)
+        if len(index) > 0:
+            points[index, slot] = _intersect(coords, index, k, axis)
+
+    flat = emitted.ravel()
+    out = points.reshape(-1, 2)[flat]
+    out_ring = np.repeat(ring, 2)[flat]
+    out_exit = np.tile([False, True], n)[flat]
+    if len(out) == 0:
+        return out, np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    # lines are cut into a new piece after each exit
+    starts = np.ones(len(out), dtype=bool)
+    starts[1:] = (out_ring[1:] != out_ring[:-1]) | (
+        out_exit[:-1] & ~is_polygon[out_ring[:-1]]
+    )
+    first = np.flatnonzero(starts)
+    offsets = np.append(first, len(out))
+    source = out_ring[first]
+
+    # close the polygon rings whose end points differ after clipping
+    last = offsets[1:] - 1
+    close = (
+        is_polygon[source]
+        & (last > first)
+        & ((out[last, 0] != out[first, 0]) | (out[last, 1] != out[first, 1]))
+    )
+    if close.any():
+        out = np.insert(out, offsets[1:][close], out[first[close]], axis=0)
+        offsets = offsets + np.append(0, np.cumsum(close))
+    return out, offsets, source
+
+
+def _intersect(coords, index, k, axis):
+    """Vectorised intersectX/intersectY of the segments starting at index."""
+    ax = coords[index, 0]
+    ay = coords[index, 1]
+    bx = coords[index + 1, 0]
+    by = coords[index + 1, 1]
+    out = np.empty((len(index), 2), dtype=np.float64)
+    if axis == 0:
+        t = (k - ax) / (bx - ax)
+        out[:, 0] = k
+        out[:, 1] = ay + (by - ay) * t
+    else:
+        t = (k - ay) / (by - ay)
+        out[:, 0] = ax + (bx - ax) * t
+        out[:, 1] = k
+    return out
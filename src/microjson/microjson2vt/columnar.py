@@ -0,0 +1,1264 @@
+"""
+Columnar (NumPy) storage and tiling of MicroJSON features.
+
+Instead of one `Slice` list of interleaved [x, y, 0] floats per ring, all
+vertices of a feature collection live in one contiguous float64 array of
+shape (n, 2). Rings, parts and features are described by offset arrays in
+the style of GeoArrow:
+
+    coords[ring_offsets[r]:ring_offsets[r + 1]]          vertices of ring r
+    ring_offsets[part_offsets[p]:part_offsets[p + 1]]    rings of part p
+    part_offsets[feature_offsets[f]:feature_offsets[f + 1]]  parts of feature f
+
+A Polygon has one part, a MultiPolygon one part per polygon, lines have a
+single part holding one ring per line string and points a single part with
+one ring holding all points. Per-feature bounding boxes are kept in separate
+arrays so trivial accept/reject tests never touch the vertices.
+"""
+
+import heapq
+import numpy as np
+from .cache import ZoomCache
+from .clip import clip_rings, trivial_clip
+from .convert import get_feature_id, get_projector
+from .simplify import MAX_ITERATIONS, rank_vertices
+from .transform import FeatureRings, transform_rings
+
+POINT = 0
+MULTIPOINT = 1
+LINESTRING = 2
+MULTILINESTRING = 3
+POLYGON = 4
+MULTIPOLYGON = 5
+
+GEOMETRY_TYPES = (
+    "Point",
+    "MultiPoint",
+    "LineString",
+    "MultiLineString",
+    "Polygon",
+    "MultiPolygon",
+)
+TYPE_CODES = {name: code for code, name in enumerate(GEOMETRY_TYPES)}
+
+# vector tile feature type for each type code: 1 point, 2 line, 3 polygon
+TILE_TYPES = np.array([1, 1, 2, 2, 3, 3], dtype=np.uint8)
+
+
+# approximate memory used by a tile dict without its features
+TILE_NBYTES = 1024
+
+
+def geometry_nbytes(geometry):
+    """Returns the memory used by a ColumnarGeometry, for a ZoomCache."""
+    return geometry.nbytes
+
+
+def concat_ranges(starts, stops):
+    """
+    Concatenates the integer ranges [starts[i], stops[i]) into one array,
+    without a Python loop over the ranges.
+    """
+    starts = np.asarray(starts, dtype=np.int64)
+    lengths = np.asarray(stops, dtype=np.int64) - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    shift = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return np.arange(total, dtype=np.int64) + shift
+
+
+def offsets_to_lengths(offsets):
+    """Converts an offset array back to the lengths it delimits."""
+    return offsets[1:] - offsets[:-1]
+
+
+def lengths_to_offsets(lengths):
+    """Converts an array of lengths to an offset array with a leading 0."""
+    offsets = np.zeros(len(lengths) + 1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    return offsets
+
+
+class ColumnarGeometry:
+    """
+    Geometries of a sequence of features stored as contiguous arrays.
+
+    Attributes:
+        coords (np.ndarray): (n, 2) float64 array of projected vertices
+        ring_offsets (np.ndarray): offsets of each ring into coords
+        part_offsets (np.ndarray): offsets of each part into the rings
+        feature_offsets (np.ndarray): offsets of each feature into the parts
+    """
+
+    __slots__ = ("coords", "ring_offsets", "part_offsets", "feature_offsets")
+
+    def __init__(self, coords, ring_offsets, part_offsets, feature_offsets):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.part_offsets = part_offsets
+        self.feature_offsets = feature_offsets
+
+    @classmethod
+    def empty(cls):
+        zero = np.zeros(1, dtype=np.int64)
+        return cls(np.zeros((0, 2), dtype=np.float64), zero, zero, zero)
+
+    def __len__(self):
+        return len(self.feature_offsets) - 1
+
+    @property
+    def num_rings(self):
+        return len(self.ring_offsets) - 1
+
+    @property
+    def nbytes(self):
+        return (
+            self.coords.nbytes
+            + self.ring_offsets.nbytes
+            + self.part_offsets.nbytes
+            + self.feature_offsets.nbytes
+        )
+
+    def ring_lengths(self):
+        return offsets_to_lengths(self.ring_offsets)
+
+    def ring_feature_index(self):
+        """Returns the index of the owning feature for every ring."""
+        part_feature = np.repeat(
+            np.arange(len(self), dtype=np.int64),
+            offsets_to_lengths(self.feature_offsets),
+        )
+        return np.repeat(part_feature, offsets_to_lengths(self.part_offsets))
+
+    def first_ring_mask(self):
+        """Returns a boolean mask marking the first ring of every part."""
+        mask = np.zeros(self.num_rings, dtype=bool)
+        starts = self.part_offsets[:-1][offsets_to_lengths(self.part_offsets) > 0]
+        mask[starts] = True
+        return mask
+
+    def feature_vertex_counts(self):
+        """Returns the number of vertices of every feature."""
+        ring_ends = self.ring_offsets[self.part_offsets[self.feature_offsets]]
+        return offsets_to_lengths(ring_ends)
+
+    def take(self, indices):
+        """Returns a new ColumnarGeometry holding the given features."""
+        indices = np.asarray(indices, dtype=np.int64)
+        parts = concat_ranges(
+            self.feature_offsets[indices], self.feature_offsets[indices + 1]
+        )
+        rings = concat_ranges(self.part_offsets[parts], self.part_offsets[parts + 1])
+        vertices = concat_ranges(self.ring_offsets[rings], self.ring_offsets[rings + 1])
+        return ColumnarGeometry(
+            self.coords[vertices],
+            lengths_to_offsets(offsets_to_lengths(self.ring_offsets)[rings]),
+            lengths_to_offsets(offsets_to_lengths(self.part_offsets)[parts]),
+            lengths_to_offsets(offsets_to_lengths(self.feature_offsets)[indices]),
+        )
+
+    @staticmethod
+    def concat(geometries):
+        """Concatenates several ColumnarGeometry objects feature-wise."""
+        geometries = [g for g in geometries if len(g) > 0]
+        if len(geometries) == 0:
+            return ColumnarGeometry.empty()
+        if len(geometries) == 1:
+            return geometries[0]
+        return ColumnarGeometry(
+            np.concatenate([g.coords for g in geometries]),
+            lengths_to_offsets(np.concatenate([g.ring_lengths() for g in geometries])),
+            lengths_to_offsets(
+                np.concatenate([offsets_to_lengths(g.part_offsets) for g in geometries])
+            ),
+            lengths_to_offsets(
+                np.concatenate(
+                    [offsets_to_lengths(g.feature_offsets) for g in geometries]
+                )
+            ),
+        )
+
+
+class GeometryBuilder:
+    """Accumulates features ring by ring and packs them into arrays."""
+
+    def __init__(self):
+        self._rings = []
+        self._ring_lengths = []
+        self._part_lengths = []
+        self._feature_lengths = []
+
+    def __len__(self):
+        return len(self._feature_lengths)
+
+    def add(self, parts):
+        """
+        Adds a feature given as a list of parts, each a list of (k, 2)
+        vertex arrays. Empty rings and parts are dropped.
+
+        Returns:
+            bool: whether the feature had any vertices and was added
+        """
+        num_parts = 0
+        for part in parts:
+            num_rings = 0
+            for ring in part:
+                if len(ring) == 0:
+                    continue
+                self._rings.append(ring)
+                self._ring_lengths.append(len(ring))
+                num_rings += 1
+            if num_rings > 0:
+                self._part_lengths.append(num_rings)
+                num_parts += 1
+        if num_parts == 0:
+            return False
+        self._feature_lengths.append(num_parts)
+        return True
+
+    def finish(self):
+        if len(self._feature_lengths) == 0:
+            return ColumnarGeometry.empty()
+        return ColumnarGeometry(
+            np.concatenate(self._rings).astype(np.float64, copy=False),
+            lengths_to_offsets(np.array(self._ring_lengths, dtype=np.int64)),
+            lengths_to_offsets(np.array(self._part_lengths, dtype=np.int64)),
+            lengths_to_offsets(np.array(self._feature_lengths, dtype=np.int64)),
+        )
+
+
+def feature_bboxes(geometry, types):
+    """
+    Computes the bounding box of every feature, like create_feature: only
+    the outer ring of each polygon contributes, all vertices otherwise.
+
+    Args:
+        geometry (ColumnarGeometry): The feature geometries
+        types (np.ndarray): The type code of every feature
+
+    Returns:
+        tuple: min_x, min_y, max_x, max_y arrays
+    """
+    n = len(geometry)
+    if n == 0:
+        empty = np.zeros(0, dtype=np.float64)
+        return empty, empty.copy(), empty.copy(), empty.copy()
+    starts = geometry.ring_offsets[:-1]
+    ring_min = np.minimum.reduceat(geometry.coords, starts, axis=0)
+    ring_max = np.maximum.reduceat(geometry.coords, starts, axis=0)
+
+    ring_feature = geometry.ring_feature_index()
+    is_polygon = types >= POLYGON
+    ignored = is_polygon[ring_feature] & ~geometry.first_ring_mask()
+    ring_min[ignored] = np.inf
+    ring_max[ignored] = -np.inf
+
+    feature_rings = geometry.part_offsets[geometry.feature_offsets[:-1]]
+    mins = np.minimum.reduceat(ring_min, feature_rings, axis=0)
+    maxs = np.maximum.reduceat(ring_max, feature_rings, axis=0)
+    return mins[:, 0], mins[:, 1], maxs[:, 0], maxs[:, 1]
+
+
+class FeatureStore:
+    """
+    All features of a MicroJsonVt index in columnar form.
+
+    Attributes:
+        geometry (ColumnarGeometry): full resolution projected geometry
+        types (np.ndarray): type code of every feature, see GEOMETRY_TYPES
+        ids (list): feature ids as strings, or None
+        tags (list): feature properties
+        min_x, min_y, max_x, max_y (np.ndarray): feature bounding boxes
+        importance (np.ndarray): simplification importance of every vertex
+        ring_rank (np.ndarray): importance needed to simplify each ring
+    """
+
+    def __init__(self, geometry, types, ids, tags):
+        self.geometry = geometry
+        self.types = types
+        self.ids = ids
+        self.tags = tags
+        self.min_x, self.min_y, self.max_x, self.max_y = feature_bboxes(geometry, types)
+        # ranked once, each zoom then only filters by its tolerance
+        self.importance, self.ring_rank = rank_polygon_rings(geometry, types)
+
+    def __len__(self):
+        return len(self.types)
+
+    def extend(self, other):
+        """
+        Appends the features of another store.
+
+        Returns:
+            np.ndarray: The indices of the appended features
+        """
+        start = len(self)
+        self.geometry = ColumnarGeometry.concat([self.geometry, other.geometry])
+        self.types = np.concatenate([self.types, other.types])
+        self.ids.extend(other.ids)
+        self.tags.extend(other.tags)
+        for name in ("min_x", "min_y", "max_x", "max_y", "importance", "ring_rank"):
+            setattr(
+                self, name, np.concatenate([getattr(self, name), getattr(other, name)])
+            )
+        return np.arange(start, len(self), dtype=np.int64)
+
+    def simplified(self, sq_tolerance):
+        """
+        Returns the geometry with every Polygon ring simplified as in the
+        per-zoom simplification of MicroJsonVt; other types are unchanged.
+        """
+        geometry = self.geometry
+        if len(geometry.coords) == 0 or not sq_tolerance > 0:
+            return geometry
+
+        # halve the tolerance of each ring until more than 3 vertices are
+        # left, as simplify does; rings that never get there are kept as is
+        needed = self.ring_rank
+        ring_tolerance = np.full(len(needed), float(sq_tolerance))
+        found = needed > ring_tolerance
+        for _ in range(MAX_ITERATIONS - 1):
+            ring_tolerance = np.where(found, ring_tolerance, ring_tolerance / 2)
+            found = needed > ring_tolerance
+        ring_tolerance[~found] = -np.inf
+
+        lengths = geometry.ring_lengths()
+        keep = self.importance > np.repeat(ring_tolerance, lengths)
+        if keep.all():
+            return geometry
+        new_lengths = np.add.reduceat(keep, geometry.ring_offsets[:-1], dtype=np.int64)
+        return ColumnarGeometry(
+            geometry.coords[keep],
+            lengths_to_offsets(new_lengths),
+            geometry.part_offsets,
+            geometry.feature_offsets,
+        )
+
+
+def rank_polygon_rings(geometry, types, min_vertices=3):
+    """
+    Ranks the vertices of every Polygon ring, see rank_vertices.
+
+    Returns:
+        tuple: the importance of every vertex, 0 outside of Polygons, and
+        for every ring the importance above which more than min_vertices
+        vertices are kept, -inf for rings that are never simplified
+    """
+    importance = np.zeros(len(geometry.coords), dtype=np.float64)
+    ring_rank = np.full(geometry.num_rings, -np.inf)
+    ring_feature = geometry.ring_feature_index()
+    lengths = geometry.ring_lengths()
+    rings = np.flatnonzero((types[ring_feature] == POLYGON) & (lengths > min_vertices))
+    offsets = geometry.ring_offsets
+    for r in rings:
+        start = offsets[r]
+        stop = offsets[r + 1]
+        ring = geometry.coords[start:stop]
+        ranks = rank_vertices(ring[:, 0].tolist(), ring[:, 1].tolist())
+        importance[start:stop] = ranks
+        ring_rank[r] = heapq.nlargest(min_vertices - 1, ranks[1:-1])[-1]
+    return importance, ring_rank
+
+
+def _ring(positions):
+    """Converts a list of GeoJSON positions to an (n, 2) float64 array."""
+    try:
+        ring = np.asarray(positions, dtype=np.float64)
+    except ValueError:
+        # mixed 2D and 3D positions
+        ring = np.array([p[:2] for p in positions], dtype=np.float64)
+    if ring.ndim != 2:
+        return np.zeros((0, 2), dtype=np.float64)
+    return ring[:, :2]
+
+
+class _StoreBuilder:
+    def __init__(self):
+        self.geometry = GeometryBuilder()
+        self.types = []
+        self.ids = []
+        self.tags = []
+
+    def add(self, id_, type_, parts, tags):
+        if self.geometry.add(parts):
+            self.types.append(TYPE_CODES[type_])
+            self.ids.append(None if id_ is None else str(id_))
+            self.tags.append(tags)
+
+    def finish(self, projector):
+        geometry = self.geometry.finish()
+        if len(geometry.coords) > 0:
+            geometry.coords = projector.project_coords(geometry.coords)
+        return FeatureStore(
+            geometry, np.array(self.types, dtype=np.uint8), self.ids, self.tags
+        )
+
+
+def convert_columnar(data, options):
+    """
+    Converts MicroJSON data into a projected FeatureStore, the columnar
+    counterpart of convert.convert.
+
+    Args:
+        data (dict): The MicroJSON data
+        options (dict): The MicroJsonVt options
+
+    Returns:
+        FeatureStore: The projected features
+    """
+    if data.get("type") == "FeatureCollection":
+        store = _convert_points(data.get("features"), options)
+        if store is not None:
+            return store
+    builder = _StoreBuilder()
+    if data.get("type") == "FeatureCollection":
+        for i, feature in enumerate(data.get("features")):
+            _convert_feature(builder, feature, options, i)
+    elif data.get("type") == "Feature":
+        _convert_feature(builder, data, options)
+    else:
+        # single geometry or a geometry collection
+        _convert_feature(builder, {"geometry": data}, options)
+    return builder.finish(get_projector(options))
+
+
+def _convert_points(features, options):
+    """
+    Converts a collection of Point features, such as cell centroids, with
+    one array for all coordinates instead of one per feature.
+
+    Returns:
+        FeatureStore: The projected features, or None if any feature is not
+        a 2D or 3D Point
+    """
+    positions = []
+    ids = []
+    tags = []
+    for i, feature in enumerate(features):
+        geometry = feature.get("geometry")
+        if geometry is None or geometry.get("type") != "Point":
+            return None
+        position = geometry.get("coordinates")
+        if position is None or len(position) not in (2, 3):
+            return None
+        positions.append(position[:2])
+        id_ = get_feature_id(feature, options, i)
+        ids.append(None if id_ is None else str(id_))
+        tags.append(feature.get("properties"))
+
+    coords = np.array(positions, dtype=np.float64).reshape(-1, 2)
+    if len(coords) > 0:
+        coords = get_projector(options).project_coords(coords)
+    offsets = np.arange(len(coords) + 1, dtype=np.int64)
+    geometry = ColumnarGeometry(coords, offsets, offsets.copy(), offsets.copy())
+    types = np.full(len(coords), POINT, dtype=np.uint8)
+    return FeatureStore(geometry, types, ids, tags)
+
+
+def _convert_feature(builder, geojson, options, index=None):
+    if geojson.get("geometry", None) is None:
+        return
+
+    coords = geojson.get("geometry").get("coordinates")
+
+    if coords is not None and len(coords) == 0:
+        return
+
+    type_ = geojson.get("geometry").get("type")
+    id_ = get_feature_id(geojson, options, index)
+
+    if type_ == "Point":
+        parts = [[_ring([coords])]]
+    elif type_ == "MultiPoint" or type_ == "LineString":
+        parts = [[_ring(coords)]]
+    elif type_ == "MultiLineString" or type_ == "Polygon":
+        parts = [[_ring(line) for line in coords]]
+    elif type_ == "MultiPolygon":
+        parts = [[_ring(ring) for ring in polygon] for polygon in coords]
+    elif type_ == "GeometryCollection":
+        for single_geometry in geojson["geometry"]["geometries"]:
+            _convert_feature(
+                builder,
+                {
+                    "id": str(id_),
+                    "geometry": single_geometry,
+                    "properties": geojson.get("properties"),
+                },
+                options,
+                index,
+            )
+        return
+    else:
+        raise Exception("Input data is not a valid GeoJSON object.")
+
+    builder.add(id_, type_, parts, geojson.get("properties"))
+
+
+class FeatureSet:
+    """
+    The features of one tile: indices into the FeatureStore, their geometry
+    at the tile's zoom (clipped to the tile) and their bounding boxes.
+    """
+
+    __slots__ = ("fids", "geometry", "min_x", "min_y", "max_x", "max_y")
+
+    def __init__(self, fids, geometry, min_x, min_y, max_x, max_y):
+        self.fids = fids
+        self.geometry = geometry
+        self.min_x = min_x
+        self.min_y = min_y
+        self.max_x = max_x
+        self.max_y = max_y
+
+    def __len__(self):
+        return len(self.fids)
+
+    @property
+    def nbytes(self):
+        return self.fids.nbytes + self.geometry.nbytes + 4 * self.min_x.nbytes
+
+    def take(self, indices):
+        """Returns the subset of features at the given positions."""
+        return FeatureSet(
+            self.fids[indices],
+            self.geometry.take(indices),
+            self.min_x[indices],
+            self.min_y[indices],
+            self.max_x[indices],
+            self.max_y[indices],
+        )
+
+    def with_geometry(self, geometry):
+        """Returns the same features with another geometry."""
+        return FeatureSet(
+            self.fids, geometry, self.min_x, self.min_y, self.max_x, self.max_y
+        )
+
+
+def ring_centroids(geometry):
+    """
+    Returns the signed area and the centroid of every ring of a
+    ColumnarGeometry. Rings without area get the mean of their vertices.
+    """
+    coords = geometry.coords
+    starts = geometry.ring_offsets[:-1]
+    lengths = geometry.ring_lengths()
+    x = coords[:, 0]
+    y = coords[:, 1]
+    # the next vertex of each vertex, wrapping around its ring
+    following = np.arange(1, len(coords) + 1, dtype=np.int64)
+    following[starts + lengths - 1] = starts
+    x1 = x[following]
+    y1 = y[following]
+    cross = x * y1 - x1 * y
+    area = np.add.reduceat(cross, starts) / 2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cx = np.add.reduceat((x + x1) * cross, starts) / (6 * area)
+        cy = np.add.reduceat((y + y1) * cross, starts) / (6 * area)
+    flat = area == 0
+    cx[flat] = np.add.reduceat(x, starts)[flat] / lengths[flat]
+    cy[flat] = np.add.reduceat(y, starts)[flat] / lengths[flat]
+    return area, np.stack([cx, cy], axis=1)
+
+
+def cull_polygons(features, types, min_area, collapse):
+    """
+    Drops the Polygon and MultiPolygon parts of a FeatureSet whose outer
+    ring has an area below min_area, see tile.add_feature. With collapse,
+    a feature whose parts are all that small becomes a point at the
+    centroid of each part instead.
+
+    Args:
+        features (FeatureSet): The features of a tile
+        types (np.ndarray): The type code of each feature
+        min_area (float): The smallest area kept, in projected units
+        collapse (bool): Whether to replace small features by points
+
+    Returns:
+        tuple: The remaining features and their type codes
+    """
+    geometry = features.geometry
+    if len(geometry.coords) == 0:
+        return features, types
+    part_counts = offsets_to_lengths(geometry.feature_offsets)
+    part_feature = np.repeat(np.arange(len(features), dtype=np.int64), part_counts)
+    first_rings = geometry.part_offsets[:-1]
+    areas, centroids = ring_centroids(geometry)
+    small = (types[part_feature] >= POLYGON) & (np.abs(areas[first_rings]) < min_area)
+    if not small.any():
+        return features, types
+
+    num_small = np.bincount(part_feature[small], minlength=len(features))
+    collapsed = num_small == part_counts
+    if not collapse:
+        collapsed[:] = False
+    collapsed_part = collapsed[part_feature]
+    kept = ~small & ~collapsed_part
+    # the points of a collapsed feature are the vertices of one ring
+    first_part = np.zeros(len(part_feature), dtype=bool)
+    first_part[geometry.feature_offsets[:-1][part_counts > 0]] = True
+    collapsed_first = collapsed_part & first_part
+
+    parts = np.arange(len(part_feature), dtype=np.int64)
+    num_rings = geometry.num_rings
+    num_coords = len(geometry.coords)
+    # take the rings and vertices of the kept parts in order, and the
+    # appended ring length and centroid of the collapsed parts
+    ring_lengths = np.concatenate([geometry.ring_lengths(), part_counts[part_feature]])[
+        concat_ranges(
+            np.where(collapsed_first, num_rings + parts, first_rings),
+            np.where(
+                collapsed_first,
+                num_rings + parts + 1,
+                np.where(kept, geometry.part_offsets[1:], first_rings),
+            ),
+        )
+    ]
+    ring_starts = geometry.ring_offsets[first_rings]
+    coords = np.concatenate([geometry.coords, centroids[first_rings]])[
+        concat_ranges(
+            np.where(collapsed_part, num_coords + parts, ring_starts),
+            np.where(
+                collapsed_part,
+                num_coords + parts + 1,
+                np.where(
+                    kept, geometry.ring_offsets[geometry.part_offsets[1:]], ring_starts
+                ),
+            ),
+        )
+    ]
+    part_entry = kept | collapsed_first
+    part_lengths = np.where(
+        collapsed_first, 1, offsets_to_lengths(geometry.part_offsets)
+    )
+    feature_parts = np.bincount(part_feature[part_entry], minlength=len(features))
+
+    remaining = feature_parts > 0
+    types = np.where(
+        collapsed, np.where(part_counts > 1, MULTIPOINT, POINT), types
+    ).astype(types.dtype)
+    culled = FeatureSet(
+        features.fids,
+        ColumnarGeometry(
+            coords,
+            lengths_to_offsets(ring_lengths),
+            lengths_to_offsets(part_lengths[part_entry]),
+            lengths_to_offsets(feature_parts),
+        ),
+        features.min_x,
+        features.min_y,
+        features.max_x,
+        features.max_y,
+    )
+    if not remaining.all():
+        indices = np.flatnonzero(remaining)
+        culled = culled.take(indices)
+        types = types[indices]
+    return culled, types
+
+
+def clip_set(features, types, scale, k1, k2, axis, min_all, max_all):
+    """
+    Clips a FeatureSet between two axis-parallel lines, the columnar
+    counterpart of clip.clip.
+
+    Args:
+        features (FeatureSet): The features to clip
+        types (np.ndarray): Type codes of all features in the store
+        scale (int): 2 ** z of the parent tile
+        k1 (float): The lower line coordinate, in parent tile units
+        k2 (float): The upper line coordinate, in parent tile units
+        axis (int): 0 for x, 1 for y
+        min_all (float): Minimum coordinate of all features along axis
+        max_all (float): Maximum coordinate of all features along axis
+
+    Returns:
+        FeatureSet: The clipped features, or None if none are left
+    """
+    k1 /= scale
+    k2 /= scale
+
+    if min_all >= k1 and max_all < k2:
+        return features  # trivial accept
+    elif max_all < k1 or min_all >= k2:
+        return None  # trivial reject
+
+    mins = features.min_x if axis == 0 else features.min_y
+    maxs = features.max_x if axis == 0 else features.max_y
+    accept, reject = trivial_clip(mins, maxs, k1, k2)
+    partial = np.flatnonzero(~accept & ~reject)
+    accepted = np.flatnonzero(accept)
+
+    clipped_set = None
+    if len(partial) > 0:
+        clipped_set, clipped = clip_features(
+            features.take(partial), types, k1, k2, axis
+        )
+    if clipped_set is None:
+        return features.take(accepted) if len(accepted) > 0 else None
+    if len(accepted) == 0:
+        return clipped_set
+
+    # merge accepted and clipped features back into their original order
+    merged = np.concatenate([accepted, partial[clipped]])
+    order = np.argsort(merged, kind="stable")
+    accepted_set = features.take(accepted)
+    return FeatureSet(
+        np.concatenate([accepted_set.fids, clipped_set.fids])[order],
+        ColumnarGeometry.concat([accepted_set.geometry, clipped_set.geometry]).take(
+            order
+        ),
+        np.concatenate([accepted_set.min_x, clipped_set.min_x])[order],
+        np.concatenate([accepted_set.min_y, clipped_set.min_y])[order],
+        np.concatenate([accepted_set.max_x, clipped_set.max_x])[order],
+        np.concatenate([accepted_set.max_y, clipped_set.max_y])[order],
+    )
+
+
+def clip_point_set(features, scale, k1, k2, axis):
+    """
+    Filters a FeatureSet of Point and MultiPoint features between two
+    axis-parallel lines, with the same result as clip_set but without
+    clipping: points are only compared with the lines.
+
+    Returns:
+        FeatureSet: The remaining features, or None if none are left
+    """
+    k1 /= scale
+    k2 /= scale
+    geometry = features.geometry
+    coords = geometry.coords
+    a = coords[:, axis]
+    # clip rejects a feature whose bounding box starts at k2 before looking
+    # at its points, otherwise it keeps the points on both lines
+    mins = features.min_x if axis == 0 else features.min_y
+    keep = (a >= k1) & (a <= k2)
+    if len(coords) == len(features):
+        # one point per feature
+        index = np.flatnonzero(keep & (mins < k2))
+        if len(index) == 0:
+            return None
+        kept = coords[index]
+        offsets = np.arange(len(index) + 1, dtype=np.int64)
+        return FeatureSet(
+            features.fids[index],
+            ColumnarGeometry(kept, offsets, offsets.copy(), offsets.copy()),
+            kept[:, 0],
+            kept[:, 1],
+            kept[:, 0],
+            kept[:, 1],
+        )
+
+    # every feature is a single ring of points
+    lengths = geometry.ring_lengths()
+    keep &= np.repeat(mins < k2, lengths)
+    counts = np.add.reduceat(keep, geometry.ring_offsets[:-1], dtype=np.int64)
+    index = np.flatnonzero(counts)
+    if len(index) == 0:
+        return None
+    kept = coords[keep]
+    starts = lengths_to_offsets(counts[index])
+    offsets = np.arange(len(index) + 1, dtype=np.int64)
+    point_min = np.minimum.reduceat(kept, starts[:-1], axis=0)
+    point_max = np.maximum.reduceat(kept, starts[:-1], axis=0)
+    return FeatureSet(
+        features.fids[index],
+        ColumnarGeometry(kept, starts, offsets, offsets.copy()),
+        point_min[:, 0],
+        point_min[:, 1],
+        point_max[:, 0],
+        point_max[:, 1],
+    )
+
+
+def clip_features(features, types, k1, k2, axis):
+    """
+    Clips the geometry of every feature of a FeatureSet with clip_rings.
+
+    Returns:
+        tuple: The features with some geometry left, or None, and the
+        position of each of them in the input set
+    """
+    geometry = features.geometry
+    ring_types = types[features.fids][geometry.ring_feature_index()]
+    coords, ring_offsets, source = clip_rings(
+        geometry.coords,
+        geometry.ring_offsets,
+        k1,
+        k2,
+        axis,
+        ring_types >= POLYGON,
+        ring_types <= MULTIPOINT,
+    )
+    if len(source) == 0:
+        return None, None
+
+    # regroup the clipped rings into the parts and features they come from,
+    # dropping the parts and features left without any ring
+    ring_part = np.repeat(
+        np.arange(len(geometry.part_offsets) - 1),
+        offsets_to_lengths(geometry.part_offsets),
+    )[source]
+    part_starts = np.flatnonzero(np.r_[True, ring_part[1:] != ring_part[:-1]])
+    part_feature = np.repeat(
+        np.arange(len(geometry)), offsets_to_lengths(geometry.feature_offsets)
+    )[ring_part[part_starts]]
+    feature_starts = np.flatnonzero(np.r_[True, part_feature[1:] != part_feature[:-1]])
+    index = part_feature[feature_starts]
+
+    clipped_geometry = ColumnarGeometry(
+        coords,
+        ring_offsets,
+        np.append(part_starts, len(ring_part)),
+        np.append(feature_starts, len(part_feature)),
+    )
+    fids = features.fids[index]
+    bboxes = feature_bboxes(clipped_geometry, types[fids])
+    return FeatureSet(fids, clipped_geometry, *bboxes), index
+
+
+class ColumnarBackend:
+    """
+    MicroJsonVt geometry backend keeping all features in a FeatureStore.
+
+    Tiles carry their FeatureSet under the "columns" key instead of a list
+    of feature dicts; the features are only built when a tile is requested.
+    """
+
+    def __init__(self, data, options):
+        if options.get("lineMetrics"):
+            raise ValueError("lineMetrics is not supported by the columnar backend")
+        self.options = options
+        timer = options.get("instrumentation")
+        if timer is not None:
+            start = timer.start()
+        self.store = convert_columnar(data, options)
+        if timer is not None:
+            timer.stop(
+                start,
+                "convert",
+                features_out=len(self.store),
+                vertices_out=len(self.store.geometry.coords),
+            )
+
+        # simplified geometry for each zoom level
+        self.zoom_cache = None
+        if options.get("lazySimplify"):
+            self.zoom_cache = ZoomCache(
+                self.simplify_zoom, geometry_nbytes, options.get("simplifyCacheBytes")
+            )
+        else:
+            self.zoom_levels = [
+                self.simplify_zoom(z) for z in range(options.get("maxZoom") + 1)
+            ]
+
+        store = self.store
+        # point features are never simplified nor clipped
+        self.points_only = bool((store.types <= MULTIPOINT).all())
+        self.features = FeatureSet(
+            np.arange(len(store), dtype=np.int64),
+            self.zoom_geometry(0),
+            store.min_x,
+            store.min_y,
+            store.max_x,
+            store.max_y,
+        )
+
+    def simplify_zoom(self, z):
+        """Returns the geometry of all features simplified for zoom z."""
+        timer = self.options.get("instrumentation")
+        if timer is not None:
+            start = timer.start()
+        tolerance = self.options["tolerance_function"](z, self.options)
+        geometry = self.store.simplified(tolerance)
+        if timer is not None:
+            timer.stop(start, "simplify", z, vertices_out=len(geometry.coords))
+        return geometry
+
+    def root_features(self, fids):
+        """Returns the FeatureSet of the given features at zoom 0."""
+        store = self.store
+        return FeatureSet(
+            fids,
+            self.zoom_geometry(0).take(fids),
+            store.min_x[fids],
+            store.min_y[fids],
+            store.max_x[fids],
+            store.max_y[fids],
+        )
+
+    def convert_feature(self, geojson, index=None):
+        """
+        Converts a GeoJSON feature and adds it to the store, without adding
+        it to the features to tile, see splice.
+
+        Returns:
+            FeatureSet: The converted features
+        """
+        options = self.options
+        builder = _StoreBuilder()
+        _convert_feature(builder, geojson, options, index)
+        store = builder.finish(get_projector(options))
+        fids = self.store.extend(store)
+        self.points_only = self.points_only and bool((store.types <= MULTIPOINT).all())
+        if self.zoom_cache is not None:
+            # the cached zooms only cover the features converted before
+            self.zoom_cache.release()
+        else:
+            for z, geometry in enumerate(self.zoom_levels):
+                tolerance = options["tolerance_function"](z, options)
+                self.zoom_levels[z] = ColumnarGeometry.concat(
+                    [geometry, store.simplified(tolerance)]
+                )
+        return self.root_features(fids)
+
+    def find(self, id_):
+        """Returns the positions of the features with the given id."""
+        ids = self.store.ids
+        fids = self.features.fids.tolist()
+        return [i for i, fid in enumerate(fids) if ids[fid] == id_]
+
+    def splice(self, positions, features):
+        """
+        Removes the features at the given positions and inserts converted
+        features in place of the first one, or at the end. Removed features
+        stay in the store.
+        """
+        fids = self.features.fids
+        at = positions[0] if positions else len(fids)
+        keep = np.ones(len(fids), dtype=bool)
+        keep[positions] = False
+        self.features = self.root_features(
+            np.concatenate([fids[:at][keep[:at]], features.fids, fids[at:][keep[at:]]])
+        )
+
+    def zoom_geometry(self, z):
+        """Returns the simplified geometry of all features at zoom z."""
+        z = min(z, self.options.get("maxZoom"))
+        if self.zoom_cache is not None:
+            return self.zoom_cache.get(z)
+        return self.zoom_levels[z]
+
+    def release(self, max_zoom=None):
+        """Drops lazily simplified zooms up to max_zoom."""
+        if self.zoom_cache is not None:
+            self.zoom_cache.release(max_zoom)
+
+    def bounds(self, features):
+        """
+        Returns the min_x, min_y, max_x and max_y arrays of the full
+        resolution bounding boxes of the features of a FeatureSet.
+        """
+        store = self.store
+        return (
+            store.min_x[features.fids],
+            store.min_y[features.fids],
+            store.max_x[features.fids],
+            store.max_y[features.fids],
+        )
+
+    def take(self, features, indices):
+        """Returns the features of a FeatureSet at the given indices."""
+        return features.take(indices)
+
+    def roots(self):
+        """
+        Returns the ids, tags and full resolution bounding boxes of all
+        features of the store, for a feature priority function.
+        """
+        store = self.store
+        return {
+            "id": store.ids,
+            "tags": store.tags,
+            "minX": store.min_x,
+            "minY": store.min_y,
+            "maxX": store.max_x,
+            "maxY": store.max_y,
+        }
+
+    def root_indices(self, features):
+        """Returns the index in roots of the features of a FeatureSet."""
+        return features.fids
+
+    def tile_nbytes(self, tile):
+        """
+        Approximates the memory used by a tile, for a TileCache. A retained
+        source is the FeatureSet of the tile itself.
+        """
+        features = tile.get("columns")
+        return TILE_NBYTES + (0 if features is None else features.nbytes)
+
+    def create_tile(self, features, z, tx, ty, keep=None):
+        """
+        Creates a tile holding the given FeatureSet, or only its features at
+        the indices keep. The bounds of the tile cover all features, as
+        split clips them by it. With the minPolygonArea option, the
+        polygons too small for the zoom are dropped or turned into points,
+        whose type codes are then kept under the "types" key.
+        """
+        options = self.options
+        if features is None or len(features) == 0:
+            features = None
+        columns = features
+        if features is not None and keep is not None:
+            columns = features.take(keep)
+        tile = {
+            "columns": columns,
+            "numPoints": 0,
+            "numSimplified": 0,
+            "numFeatures": 0 if columns is None else len(columns),
+            "source": None,
+            "x": tx,
+            "y": ty,
+            "z": z,
+            "transformed": False,
+            "minX": 2,
+            "minY": 1,
+            "maxX": -1,
+            "maxY": 0,
+        }
+        if tile["columns"] is None:
+            return tile
+
+        types = self.store.types[columns.fids]
+        min_area = options.get("minPolygonArea")
+        if min_area and (types >= POLYGON).any():
+            # the area is given in square tile units of this zoom
+            scale = ((1 << z) * options.get("extent")) ** 2
+            collapse = options.get("smallPolygons") == "point"
+            columns, types = cull_polygons(columns, types, min_area / scale, collapse)
+            tile["columns"] = columns if len(columns) > 0 else None
+            tile["types"] = types
+        counts = columns.geometry.feature_vertex_counts()
+        tile["numPoints"] = int(counts.sum())
+        tile["numSimplified"] = int(counts[types <= MULTIPOINT].sum())
+        tile["minX"] = min(tile["minX"], float(features.min_x.min()))
+        tile["minY"] = min(tile["minY"], float(features.min_y.min()))
+        tile["maxX"] = max(tile["maxX"], float(features.max_x.max()))
+        tile["maxY"] = max(tile["maxY"], float(features.max_y.max()))
+        return tile
+
+    def split(self, features, z, x, y, tile, child=None):
+        """
+        Clips the features of tile z/x/y into its four children, or only into
+        the child at the given position of the result.
+
+        Returns:
+            tuple: The top-left, bottom-left, top-right and bottom-right
+            FeatureSets, None where a child is empty or not cut
+        """
+        options = self.options
+        types = self.store.types
+        z2 = 1 << z
+
+        k1 = 0.5 * options.get("buffer") / options.get("extent")
+        k2 = 0.5 - k1
+        k3 = 0.5 + k1
+        k4 = 1 + k1
+
+        if self.points_only:
+            return self.split_points(features, z2, x, y, (k1, k2, k3, k4), child)
+
+        # the children are cut from the geometry of their own zoom
+        zoom_geometry = self.zoom_geometry(z + 1)
+        features = features.with_geometry(zoom_geometry.take(features.fids))
+
+        tl = bl = tr = br = left = right = None
+        if child is None or child < 2:
+            left = clip_set(
+                features, types, z2, x - k1, x + k3, 0, tile["minX"], tile["maxX"]
+            )
+        if child is None or child >= 2:
+            right = clip_set(
+                features, types, z2, x + k2, x + k4, 0, tile["minX"], tile["maxX"]
+            )
+        # the clipped features are cut from the geometry of the next zoom,
+        # which the bounding box of the tile may not cover
+        if left is not None:
+            min_y, max_y = left.min_y.min(), left.max_y.max()
+            if child != 1:
+                tl = clip_set(left, types, z2, y - k1, y + k3, 1, min_y, max_y)
+            if child != 0:
+                bl = clip_set(left, types, z2, y + k2, y + k4, 1, min_y, max_y)
+        if right is not None:
+            min_y, max_y = right.min_y.min(), right.max_y.max()
+            if child != 3:
+                tr = clip_set(right, types, z2, y - k1, y + k3, 1, min_y, max_y)
+            if child != 2:
+                br = clip_set(right, types, z2, y + k2, y + k4, 1, min_y, max_y)
+        return tl, bl, tr, br
+
+    def split_points(self, features, z2, x, y, k, child=None):
+        """
+        Splits Point and MultiPoint features among the children of a tile,
+        see split. Their geometry is the same at every zoom.
+        """
+        k1, k2, k3, k4 = k
+        tl = bl = tr = br = left = right = None
+        if child is None or child < 2:
+            left = clip_point_set(features, z2, x - k1, x + k3, 0)
+        if child is None or child >= 2:
+            right = clip_point_set(features, z2, x + k2, x + k4, 0)
+        if left is not None:
+            if child != 1:
+                tl = clip_point_set(left, z2, y - k1, y + k3, 1)
+            if child != 0:
+                bl = clip_point_set(left, z2, y + k2, y + k4, 1)
+        if right is not None:
+            if child != 3:
+                tr = clip_point_set(right, z2, y - k1, y + k3, 1)
+            if child != 2:
+                br = clip_point_set(right, z2, y + k2, y + k4, 1)
+        return tl, bl, tr, br
+
+    def transform(self, tile, extent, arrays=False):
+        """
+        Builds the features of a tile in tile coordinates, as returned by
+        transform_tile for the slice backend, or by transform_tile_arrays
+        with arrays. The stored tile is unchanged.
+        """
+        transformed = {k: v for k, v in tile.items() if k != "columns" and k != "types"}
+        if arrays:
+            transformed["features"] = self.tile_arrays(tile, extent)
+        else:
+            transformed["features"] = self.tile_features(tile, extent)
+        transformed["source"] = None
+        transformed["transformed"] = True
+        return transformed
+
+    def tile_features(self, tile, extent):
+        features = tile.get("columns")
+        if features is None:
+            return []
+        geometry = features.geometry
+        store = self.store
+        types = tile.get("types")
+        if types is None:
+            types = store.types[features.fids]
+        z2 = 1 << tile["z"]
+
+        coords = rewind_rings(geometry, types)
+        coords = np.round(extent * (coords * z2 - (tile["x"], tile["y"])), 0)
+        coords = coords.tolist()
+
+        if len(coords) == len(features) and (types <= MULTIPOINT).all():
+            # one point per feature
+            ids = store.ids
+            tags = store.tags
+            result = []
+            for point, fid in zip(coords, features.fids.tolist()):
+                feature = {"geometry": [point], "type": 1, "tags": tags[fid]}
+                if ids[fid] is not None:
+                    feature["id"] = ids[fid]
+                result.append(feature)
+            return result
+
+        result = []
+        ring_offsets = geometry.ring_offsets.tolist()
+        part_offsets = geometry.part_offsets.tolist()
+        feature_offsets = geometry.feature_offsets.tolist()
+        for i, fid in enumerate(features.fids.tolist()):
+            type_ = types[i]
+            first_ring = part_offsets[feature_offsets[i]]
+            last_ring = part_offsets[feature_offsets[i + 1]]
+            if type_ <= MULTIPOINT:
+                feature_geometry = coords[
+                    ring_offsets[first_ring] : ring_offsets[last_ring]
+                ]
+            else:
+                feature_geometry = [
+                    coords[ring_offsets[r] : ring_offsets[r + 1]]
+                    for r in range(first_ring, last_ring)
+                ]
+            feature = {
+                "geometry": feature_geometry,
+                "type": int(TILE_TYPES[type_]),
+                "tags": store.tags[fid],
+            }
+            if store.ids[fid] is not None:
+                feature["id"] = store.ids[fid]
+            result.append(feature)
+        return result
+
+    def tile_arrays(self, tile, extent):
+        features = tile.get("columns")
+        if features is None:
+            return []
+        geometry = features.geometry
+        store = self.store
+        types = tile.get("types")
+        if types is None:
+            types = store.types[features.fids]
+        tile_types = TILE_TYPES[types]
+
+        # the points of a Point or MultiPoint feature become one ring
+        first_rings = geometry.part_offsets[geometry.feature_offsets]
+        ring_types = np.repeat(tile_types, np.diff(first_rings))
+        starts = ring_types != 1
+        starts[first_rings[:-1][tile_types == 1]] = True
+        feature_rings = np.concatenate([[0], np.cumsum(starts)])[first_rings]
+        ring_offsets = np.concatenate(
+            [geometry.ring_offsets[:-1][starts], geometry.ring_offsets[-1:]]
+        )
+
+        rings, kept = transform_rings(
+            rewind_rings(geometry, types),
+            ring_offsets,
+            feature_rings,
+            tile_types,
+            extent,
+            1 << tile["z"],
+            tile["x"],
+            tile["y"],
+        )
+        result = []
+        ids = store.ids
+        tags = store.tags
+        fids = features.fids[kept].tolist()
+        for i, (fid, type_) in enumerate(zip(fids, rings.types.tolist())):
+            feature = {
+                "geometry": FeatureRings(rings, i),
+                "type": type_,
+                "tags": tags[fid],
+            }
+            if ids[fid] is not None:
+                feature["id"] = ids[fid]
+            result.append(feature)
+        return result
+
+
+def rewind_rings(geometry, types):
+    """
+    Returns the coordinates with polygon rings reordered like tile.rewind:
+    outer rings clockwise and inner rings counter-clockwise.
+    """
+    coords = geometry.coords
+    if len(coords) == 0:
+        return coords
+    ring_feature = geometry.ring_feature_index()
+    polygon_rings = types[ring_feature] >= POLYGON
+    if not polygon_rings.any():
+        return coords
+
+    starts = geometry.ring_offsets[:-1]
+    lengths = geometry.ring_lengths()
+    # previous vertex of every vertex, wrapping around within its ring
+    previous = np.arange(-1, len(coords) - 1, dtype=np.int64)
+    previous[starts] = starts + lengths - 1
+    x = coords[:, 0]
+    y = coords[:, 1]
+    terms = (x - x[previous]) * (y + y[previous])
+    area = np.add.reduceat(terms, starts)
+    clockwise = geometry.first_ring_mask()
+    flip = polygon_rings & ((area > 0) == clockwise)
+    if not flip.any():
+        return coords
+
+    order = np.arange(len(coords), dtype=np.int64)
+    ring_of_vertex = np.repeat(np.arange(len(lengths)), lengths)
+    flipped = flip[ring_of_vertex]
+    ring_start = starts[ring_of_vertex]
+    ring_stop = ring_start + lengths[ring_of_vertex] - 1
+    order[flipped] = (ring_start + ring_stop - order)[flipped]
+    return coords[order]
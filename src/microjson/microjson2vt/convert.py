@@ -6,7 +6,9 @@
 
 import math
 from abc import ABC, abstractmethod
+import numpy as np
 from .feature import Slice, create_feature
+from .simplify import simplify
 
 # converts Microjson feature into an intermediate projected JSON vector format
 # with simplification data
@@ -16,6 +18,14 @@ def convert(data, options):
     """
     wrapper around AbstractProjector.convert
     """
+    return get_projector(options).convert(data, options)
+
+
+def get_projector(options):
+    """
+    Returns the projector from the options, or a Cartesian projector for
+    the given bounds, or a Mercator projector if no bounds are given.
+    """
     projector = options.get("projector")
     bounds = options.get("bounds")
     if projector is None:
@@ -24,8 +34,24 @@ def convert(data, options):
             if bounds is not None
             else MercatorProjector()
         )
+    return projector
 
-    return projector.convert(data, options)
+
+def get_feature_id(geojson, options, index=None):
+    """
+    Returns the id of a GeoJSON feature, honouring the promoteId and
+    generateId options.
+    """
+    id_ = geojson.get("id")
+    if (
+        options.get("promoteId", None) is not None
+        and geojson.get("properties", None) is not None
+        and "promoteId" in geojson.get("properties")
+    ):
+        id_ = geojson["properties"][options.get("promoteId")]
+    elif options.get("generateId", False):
+        id_ = index if index is not None else 0
+    return id_
 
 
 class AbstractProjector(ABC):
@@ -46,6 +72,20 @@ class AbstractProjector(ABC):
     def project_y(self, y):
         pass
 
+    def project_coords(self, coords):
+        """
+        Projects an (n, 2) array of coordinates. Subclasses may override
+        this with a vectorised implementation.
+        """
+        out = np.empty((len(coords), 2), dtype=np.float64)
+        out[:, 0] = np.fromiter(
+            map(self.project_x, coords[:, 0]), np.float64, len(coords)
+        )
+        out[:, 1] = np.fromiter(
+            map(self.project_y, coords[:, 1]), np.float64, len(coords)
+        )
+        return out
+
     def convert(self, data, options):
         features = []
         if data.get("type") == "FeatureCollection":
@@ -79,15 +119,7 @@ class AbstractProjector(ABC):
             2,
         )
         geometry = Slice([])
-        id_ = geojson.get("id")
-        if (
-            options.get("promoteId", None) is not None
-            and geojson.get("properties", None) is not None
-            and "promoteId" in geojson.get("properties")
-        ):
-            id_ = geojson["properties"][options.get("promoteId")]
-        elif options.get("generateId", False):
-            id_ = index if index is not None else 0
+        id_ = get_feature_id(geojson, options, index)
 
         if type_ == "Point":
             self.convert_point(coords, geometry)
@@ -166,8 +198,8 @@ class AbstractProjector(ABC):
         dosimplify = False
         if dosimplify:
             simplified_line = simplify(
-                [[x, y] for x, y in zip(out[0::3], out[1::3])],
-                tolerance)  # New call
+                [[x, y] for x, y in zip(out[0::3], out[1::3])], tolerance
+            )  # New call
             out.clear()  # clear existing data
             # check if simplified_line has at least 3 points
             if len(simplified_line) < 3:
@@ -191,11 +223,26 @@ class CartesianProjector(AbstractProjector):
     def project_y(self, y):
         return (y - self.bounds[1]) / (self.bounds[3] - self.bounds[1])
 
+    def project_coords(self, coords):
+        out = np.empty((len(coords), 2), dtype=np.float64)
+        out[:, 0] = (coords[:, 0] - self.bounds[0]) / (self.bounds[2] - self.bounds[0])
+        out[:, 1] = (coords[:, 1] - self.bounds[1]) / (self.bounds[3] - self.bounds[1])
+        return out
+
 
 class MercatorProjector(AbstractProjector):
     def project_x(self, x):
         return x / 360.0 + 0.5
 
+    def project_coords(self, coords):
+        # y keeps the scalar path so results match project_y bit for bit
+        out = np.empty((len(coords), 2), dtype=np.float64)
+        out[:, 0] = coords[:, 0] / 360.0 + 0.5
+        out[:, 1] = np.fromiter(
+            map(self.project_y, coords[:, 1]), np.float64, len(coords)
+        )
+        return out
+
     def project_y(self, y):
         sin = math.sin(y * math.pi / 180.0)
         if sin == 1.0:
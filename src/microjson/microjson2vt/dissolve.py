@@ -0,0 +1,100 @@
+import shapely
+from shapely.geometry.polygon import orient
+
+
+def ring_area(ring):
+    """
+    Returns twice the signed area of a ring of [x, y] tile coordinates, in
+    the convention of tile.rewind: negative for an outer ring.
+    """
+    area = 0
+    for i in range(len(ring)):
+        area += (ring[i][0] - ring[i - 1][0]) * (ring[i][1] + ring[i - 1][1])
+    return area
+
+
+def feature_polygons(geometry):
+    """
+    Splits the rings of a transformed polygon feature into shapely
+    Polygons. Each outer ring is followed by its holes, as written by
+    transform_tile.
+    """
+    polygons = []
+    shell = None
+    holes = []
+    for ring in geometry:
+        if len(ring) < 4:
+            continue
+        area = ring_area(ring)
+        if area < 0:
+            if shell is not None:
+                polygons.append(shapely.Polygon(shell, holes))
+            shell = ring
+            holes = []
+        elif area > 0 and shell is not None:
+            holes.append(ring)
+    if shell is not None:
+        polygons.append(shapely.Polygon(shell, holes))
+    return polygons
+
+
+def dissolve_features(features, by=None, sums=()):
+    """
+    Merges the polygon features of a transformed tile that share the value
+    of a property into one feature per value, keeping the other features
+    as they are.
+
+    The polygons of a group are unioned on the integer grid of the tile, so
+    that the ones touching or overlapping at the resolution of the tile
+    become one shape. A merged feature has no id; its tags are the grouping
+    property, the number of features merged as count and, for each
+    property in sums, the total of its numeric values as <property>_sum.
+
+    Args:
+        features (list): The features of a tile, as returned by get_tile
+        by (str): The property to group by, or None to merge all polygons
+        sums (list): The numeric properties to add up in each group
+
+    Returns:
+        list: The features that are not polygons, followed by one polygon
+        feature per group, in the order of their first feature
+    """
+    result = []
+    groups = {}
+    for feature in features:
+        if feature["type"] != 3:
+            result.append(feature)
+            continue
+        tags = feature.get("tags") or {}
+        key = tags.get(by) if by is not None else None
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = {"polygons": [], "count": 0}
+            group["sums"] = {name: 0 for name in sums}
+        group["polygons"].extend(feature_polygons(feature["geometry"]))
+        group["count"] += 1
+        for name in sums:
+            value = tags.get(name)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                group["sums"][name] += value
+
+    for key, group in groups.items():
+        # rounding to the tile grid can make rings self-intersect
+        polygons = shapely.make_valid(group["polygons"])
+        merged = shapely.union_all(polygons, grid_size=1)
+        geometry = []
+        for polygon in shapely.get_parts(shapely.get_parts(merged)):
+            if not isinstance(polygon, shapely.Polygon) or polygon.is_empty:
+                continue
+            polygon = orient(polygon, 1.0)
+            geometry.append([list(c) for c in polygon.exterior.coords])
+            for interior in polygon.interiors:
+                geometry.append([list(c) for c in interior.coords])
+        if len(geometry) == 0:
+            continue
+        tags = {} if by is None else {by: key}
+        tags["count"] = group["count"]
+        for name, total in group["sums"].items():
+            tags[f"{name}_sum"] = total
+        result.append({"geometry": geometry, "type": 3, "tags": tags})
+    return result
@@ -0,0 +1,91 @@
+import time
+
+
+class Instrumentation:
+    """
+    Records the time spent in each stage of tiling and what it processed,
+    per zoom level.
+
+    A stage is measured between start and stop; every measurement adds one
+    call, its wall and CPU time and any counters given to stop, such as
+    vertices_in, vertices_out or bytes_out, to the totals of the stage at
+    that zoom. Stages that do not belong to a zoom are recorded under
+    None.
+
+    Pass an instance as the instrumentation option of MicroJsonVt, or to
+    TileWriter.microjson2tiles. The code measuring a stage skips it when
+    the option is None, so disabled instrumentation costs one comparison
+    per stage.
+
+    Attributes:
+        stages (dict): The totals of each stage, by zoom
+        callback (callable): Called with the stage, the zoom and the dict
+            of the wall and cpu time and counters of every measurement.
+            Measurements made in worker processes are only merged into
+            stages.
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.stages = {}
+
+    def __getstate__(self):
+        # worker processes only record, see merge
+        return {"callback": None, "stages": {}}
+
+    def start(self):
+        """Returns the start of a measurement, to pass to stop."""
+        return time.perf_counter(), time.process_time()
+
+    def elapsed(self, start):
+        """Returns the wall and cpu time since start, in seconds."""
+        return {
+            "wall": time.perf_counter() - start[0],
+            "cpu": time.process_time() - start[1],
+        }
+
+    def stop(self, start, stage, z=None, **counts):
+        """Ends a measurement started with start and records it."""
+        self.record(stage, z, {**self.elapsed(start), **counts})
+
+    def record(self, stage, z, measurement):
+        """Adds a measurement of a stage at zoom z to the totals."""
+        self._add(stage, z, measurement, 1)
+        if self.callback is not None:
+            self.callback(stage, z, measurement)
+
+    def merge(self, stages):
+        """Adds the stages of another Instrumentation to the totals."""
+        for stage, zooms in stages.items():
+            for z, totals in zooms.items():
+                totals = dict(totals)
+                self._add(stage, z, totals, totals.pop("calls"))
+
+    def _add(self, stage, z, measurement, calls):
+        zooms = self.stages.setdefault(stage, {})
+        totals = zooms.get(z)
+        if totals is None:
+            totals = zooms[z] = {"calls": 0}
+        totals["calls"] += calls
+        for key, value in measurement.items():
+            totals[key] = totals.get(key, 0) + value
+
+    def report(self):
+        """
+        Returns the totals of each stage over all zooms, with the totals of
+        each zoom level under "zooms" for the stages measured per zoom.
+
+        Returns:
+            dict: The report, keyed by stage
+        """
+        report = {}
+        for stage, zooms in self.stages.items():
+            total = {}
+            for totals in zooms.values():
+                for key, value in totals.items():
+                    total[key] = total.get(key, 0) + value
+            per_zoom = {z: dict(totals) for z, totals in zooms.items() if z is not None}
+            if per_zoom:
+                total["zooms"] = dict(sorted(per_zoom.items()))
+            report[stage] = total
+        return report
@@ -6,11 +6,19 @@
 
 import logging
 import math
-from .convert import convert
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .convert import convert, get_projector
 from .clip import clip
-from .transform import transform_tile
+from .transform import transform_tile, transform_tile_arrays
 from .tile import create_tile
-from .simplify import simplify
+from .simplify import rank_threshold, rank_vertices
+from .columnar import TILE_NBYTES, ColumnarBackend
+from .cache import TileCache, ZoomCache
+from .occupancy import TileOccupancy
+from .dissolve import dissolve_features
+from .spatialindex import FeatureIndex
 
 
 def default_tolerance_func(z, options):
@@ -41,14 +49,19 @@ def linear_tolerance_func(z, options):
 
 
 def constant_tolerance_func(z, options):
-    """Constant tolerance relative to extent (same simplification regardless of zoom)."""
+    """
+    Constant tolerance relative to extent (same simplification regardless of
+    zoom).
+    """
     tolerance_val = options.get("tolerance", 50)
     extent_val = options.get("extent", 4096)
     if extent_val == 0:
         return 1e-12  # Avoid division by zero
-    # Apply the base tolerance scaled by extent, squared like the default, but without zoom factor
+    # Apply the base tolerance scaled by extent, squared like the default, but
+    # without zoom factor
     return (tolerance_val / extent_val) ** 2
-    # Alternative: return a fixed value if extent scaling is not desired e.g. options.get('tolerance', 50)
+    # Alternative: return a fixed value if extent scaling is not desired e.g.
+    # options.get('tolerance', 50)
 
 
 def slow_exponential_tolerance_func(z, options, exponent=1.5):
@@ -110,6 +123,38 @@ AVAILABLE_TOLERANCE_FUNCTIONS = {
 }
 
 
+# --- Feature Priority Functions ---
+# Each takes the converted features of an index as a dict of "id" and "tags"
+# lists and "minX", "minY", "maxX" and "maxY" arrays of projected bounding
+# boxes, and returns one number per feature. Tiles over maxFeaturesPerTile
+# keep the features with the highest priority.
+
+
+def area_priority(features):
+    """Ranks features by the area of their bounding box, largest first."""
+    return (features["maxX"] - features["minX"]) * (features["maxY"] - features["minY"])
+
+
+def hash_priority(features):
+    """
+    Ranks features by a stable hash of their id, or of their position if
+    they have none, which samples them evenly.
+    """
+    return np.array(
+        [
+            zlib.crc32(str(i if id_ is None else id_).encode())
+            for i, id_ in enumerate(features["id"])
+        ],
+        dtype=np.float64,
+    )
+
+
+AVAILABLE_PRIORITY_FUNCTIONS = {
+    "area": area_priority,
+    "hash": hash_priority,
+}
+
+
 def get_default_options():
     return {
         "maxZoom": 8,  # max zoom to preserve detail on
@@ -123,10 +168,381 @@ def get_default_options():
         "generateId": False,  # whether to generate feature ids.
         "projector": None,  # which projection to use
         "bounds": None,  # [west, south, east, north]
-        "tolerance_function": default_tolerance_func,  # function to calculate tolerance per zoom
+        # function to calculate tolerance per zoom
+        "tolerance_function": default_tolerance_func,
+        "backend": "slice",  # geometry backend, "slice" or "columnar"
+        "lazySimplify": False,  # simplify each zoom only when first needed
+        "simplifyCacheBytes": 256 * 1024 * 1024,  # budget for lazy zooms
+        "workers": 1,  # processes finishing the pyramid below parallelZoom
+        "parallelZoom": 3,  # zoom of the subtrees handed to the workers
+        "sparse": False,  # whether to skip empty tiles
+        "tileCacheSize": None,  # max number of tiles kept in the index
+        "tileCacheBytes": None,  # budget for the tiles kept in the index
+        "maxFeaturesPerTile": None,  # features kept in a tile, None for all
+        "featurePriority": "area",  # ranks the features kept in a full tile
+        "minPolygonArea": 0,  # smallest polygon part kept, in square tile units
+        "smallPolygons": "drop",  # "drop" smaller polygons or make them "point"s
+        "dissolveMaxZoom": None,  # max zoom merging polygons, None for none
+        "dissolveBy": None,  # property grouping the merged polygons
+        "dissolveSum": [],  # numeric properties summed over merged polygons
+        "instrumentation": None,  # Instrumentation recording stage timings
+        "layerBy": None,  # property naming the layer of a feature
+        "layerZooms": {},  # [minzoom, maxzoom] of each layer, all if absent
+        "arrayGeometry": False,  # transform tiles to int32 arrays of each ring
     }
 
 
+def rank_geometry(feature):
+    """
+    Stores the simplification importance of every vertex of a Polygon in the
+    third slot of its coordinates, see rank_vertices.
+    """
+    if feature["type"] != "Polygon":
+        return
+    for ring in feature["geometry"]:
+        ring[2::3] = rank_vertices(ring[0::3], ring[1::3])
+
+
+def simplify_geometry(feature, tolerance):
+    """
+    Returns a copy of the geometry of a ranked feature simplified with the
+    given squared tolerance. Only Polygon rings are simplified, and a ring is
+    kept as is if simplification would leave fewer than 4 vertices.
+    """
+    geometry = feature["geometry"].copy()
+    # check feature type only simplify Polygon
+    if feature["type"] != "Polygon":
+        return geometry
+    for iring in range(len(geometry)):
+        ring = geometry[iring]
+        threshold = rank_threshold(ring[2::3], tolerance)
+        if threshold is None:
+            # too few vertices would be left, use the original coordinates
+            continue
+        # keep the vertices ranked above the tolerance
+        simplified_ring = []
+        for i in range(0, len(ring), 3):
+            if ring[i + 2] > threshold:
+                simplified_ring.append(ring[i])
+                simplified_ring.append(ring[i + 1])
+                simplified_ring.append(ring[i + 2])
+        geometry[iring] = simplified_ring
+    return geometry
+
+
+def geometry_vertices(geometry):
+    """Counts the vertices of a Slice geometry, for an Instrumentation."""
+    if len(geometry) > 0 and isinstance(geometry[0], list):
+        return sum(geometry_vertices(part) for part in geometry)
+    return len(geometry) // 3
+
+
+def geometry_nbytes(geometries):
+    """Approximates the memory used by a list of Slice geometries."""
+    # a pointer in the list plus a float object per coordinate
+    size = 0
+    for geometry in geometries:
+        if geometry is None:
+            continue  # removed feature
+        if len(geometry) > 0 and isinstance(geometry[0], list):
+            size += sum(32 * len(ring) for ring in geometry)
+        else:
+            size += 32 * len(geometry)
+    return size
+
+
+class SliceBackend:
+    """
+    Geometry backend keeping features as dicts of Slice lists, as in
+    geojson2vt, with a separate geometry_z{z} copy per zoom level.
+
+    Features remember the index of the converted feature they were clipped
+    from, in converted, where removed features are left as None. With the
+    lazySimplify option, the copies are not stored on the features up front;
+    each zoom is simplified the first time a tile needs it and kept in a
+    ZoomCache.
+    """
+
+    def __init__(self, data, options):
+        self.options = options
+        timer = options.get("instrumentation")
+        if timer is not None:
+            start = timer.start()
+        features = convert(data, options)
+        for i, feature in enumerate(features):
+            rank_geometry(feature)
+            feature["index"] = i
+        self.converted = list(features)
+        if timer is not None:
+            elapsed = timer.elapsed(start)
+            vertices = sum(geometry_vertices(f["geometry"]) for f in features)
+            timer.record(
+                "convert",
+                None,
+                {**elapsed, "features_out": len(features), "vertices_out": vertices},
+            )
+
+        tolerance_func = options["tolerance_function"]  # resolved by MicroJsonVt
+
+        self.zoom_cache = None
+        if options.get("lazySimplify"):
+            self.features = features
+            self.zoom_cache = ZoomCache(
+                self.simplify_zoom, geometry_nbytes, options.get("simplifyCacheBytes")
+            )
+            return
+
+        # Simplify features for each zoom level
+        for z in range(options.get("maxZoom") + 1):
+            if timer is not None:
+                start = timer.start()
+            # Calculate tolerance using the provided or default function
+            tolerance = tolerance_func(z, options)
+            for feature in features:
+                feature[f"geometry_z{z}"] = simplify_geometry(feature, tolerance)
+            if timer is not None:
+                self.record_simplify(
+                    timer, start, z, [f[f"geometry_z{z}"] for f in features]
+                )
+        self.features = features
+
+    def simplify_zoom(self, z):
+        """Returns the geometry of every converted feature simplified for z."""
+        timer = self.options.get("instrumentation")
+        if timer is not None:
+            start = timer.start()
+        tolerance = self.options["tolerance_function"](z, self.options)
+        geometries = [
+            None if feature is None else simplify_geometry(feature, tolerance)
+            for feature in self.converted
+        ]
+        if timer is not None:
+            self.record_simplify(timer, start, z, geometries)
+        return geometries
+
+    def record_simplify(self, timer, start, z, geometries):
+        """Records the simplification of zoom z in an Instrumentation."""
+        elapsed = timer.elapsed(start)
+        vertices = sum(geometry_vertices(g) for g in geometries if g is not None)
+        timer.record("simplify", z, {**elapsed, "vertices_out": vertices})
+
+    def convert_feature(self, geojson, index=None):
+        """
+        Converts a GeoJSON feature and adds it to the converted features,
+        without adding it to the features to tile, see splice.
+
+        Returns:
+            list: The converted features
+        """
+        options = self.options
+        features = []
+        get_projector(options).convert_feature(features, geojson, options, index)
+        features = [feature for feature in features if len(feature["geometry"]) > 0]
+        for feature in features:
+            rank_geometry(feature)
+            feature["index"] = len(self.converted)
+            self.converted.append(feature)
+            if self.zoom_cache is None:
+                for z in range(options.get("maxZoom") + 1):
+                    tolerance = options["tolerance_function"](z, options)
+                    feature[f"geometry_z{z}"] = simplify_geometry(feature, tolerance)
+        if self.zoom_cache is not None:
+            # the cached zooms only cover the features converted before
+            self.zoom_cache.release()
+        return features
+
+    def find(self, id_):
+        """Returns the positions of the features with the given id."""
+        return [i for i, feature in enumerate(self.features) if feature["id"] == id_]
+
+    def splice(self, positions, features):
+        """
+        Removes the features at the given positions and inserts converted
+        features in place of the first one, or at the end.
+        """
+        removed = set(positions)
+        for i in positions:
+            self.converted[self.features[i]["index"]] = None
+        at = positions[0] if positions else len(self.features)
+        self.features = (
+            [f for i, f in enumerate(self.features[:at]) if i not in removed]
+            + list(features)
+            + [f for i, f in enumerate(self.features[at:], at) if i not in removed]
+        )
+
+    def zoom_features(self, features, z):
+        """
+        Sets the geometry_z{z} of lazily simplified features from the
+        geometry of the feature they were clipped from.
+        """
+        if self.zoom_cache is None:
+            return features
+        geometry = self.zoom_cache.get(z)
+        key = f"geometry_z{z}"
+        return [{**feature, key: geometry[feature["index"]]} for feature in features]
+
+    def release(self, max_zoom=None):
+        """Drops lazily simplified zooms up to max_zoom."""
+        if self.zoom_cache is not None:
+            self.zoom_cache.release(max_zoom)
+
+    def tile_nbytes(self, tile):
+        """
+        Approximates the memory used by a tile and its retained source, for
+        a TileCache. The geometry of the higher zooms is shared with the
+        converted features and not counted.
+        """
+        # a float object and a pointer per coordinate, see geometry_nbytes
+        size = TILE_NBYTES + 2 * 32 * tile["numSimplified"]
+        if tile.get("source"):
+            size += 3 * 32 * tile["numPoints"]
+        return size
+
+    def bounds(self, features):
+        """
+        Returns the min_x, min_y, max_x and max_y arrays of the full
+        resolution bounding boxes of the converted features that the given
+        features were clipped from.
+        """
+        roots = [self.converted[feature["index"]] for feature in features]
+        return tuple(
+            np.array([root[key] for root in roots], dtype=np.float64)
+            for key in ("minX", "minY", "maxX", "maxY")
+        )
+
+    def take(self, features, indices):
+        """Returns the features at the given indices."""
+        return [features[i] for i in indices.tolist()]
+
+    def roots(self):
+        """
+        Returns the ids, tags and full resolution bounding boxes of all
+        converted features, for a feature priority function. Removed
+        features are left with no id, no tags and an empty box.
+        """
+        converted = self.converted
+        roots = {
+            "id": [None if root is None else root["id"] for root in converted],
+            "tags": [{} if root is None else root["tags"] for root in converted],
+        }
+        for key in ("minX", "minY", "maxX", "maxY"):
+            roots[key] = np.array(
+                [0.0 if root is None else root[key] for root in converted],
+                dtype=np.float64,
+            )
+        return roots
+
+    def root_indices(self, features):
+        """Returns the index in roots of the features they were clipped from."""
+        return np.array([feature["index"] for feature in features], dtype=np.int64)
+
+    def create_tile(self, features, z, x, y, keep=None):
+        """
+        Creates tile z/x/y holding the given features, or only those at the
+        indices keep. The bounds of the tile cover all features, as split
+        clips them by it.
+        """
+        # only the unclipped root features lack their own zoom geometry
+        if z == 0:
+            features = self.zoom_features(features, z)
+        kept = features if keep is None else self.take(features, keep)
+        # Use simplified geometries for this zoom level
+        simplified_features = [
+            {**feature, "geometry": feature[f"geometry_z{z}"]} for feature in kept
+        ]
+        tile = create_tile(simplified_features, z, x, y, self.options)
+        if keep is not None:
+            tile["minX"] = min(tile["minX"], min(f["minX"] for f in features))
+            tile["minY"] = min(tile["minY"], min(f["minY"] for f in features))
+            tile["maxX"] = max(tile["maxX"], max(f["maxX"] for f in features))
+            tile["maxY"] = max(tile["maxY"], max(f["maxY"] for f in features))
+        return tile
+
+    def split(self, features, z, x, y, tile, child=None):
+        """
+        Clips the features of tile z/x/y into its four children, or only into
+        the child at the given position of the result.
+
+        Returns:
+            tuple: The top-left, bottom-left, top-right and bottom-right
+            features, None where a child is empty or not cut
+        """
+        options = self.options
+        z2 = 1 << z
+
+        # values we'll use for clipping
+        k1 = 0.5 * options.get("buffer") / options.get("extent")
+        k2 = 0.5 - k1
+        k3 = 0.5 + k1
+        k4 = 1 + k1
+
+        tl = None
+        bl = None
+        tr = None
+        br = None
+
+        # the children are cut from the geometry of their own zoom
+        features = self.zoom_features(features, z + 1)
+
+        left = right = None
+        if child is None or child < 2:
+            left = clip(
+                features,
+                z2,
+                x - k1,
+                x + k3,
+                0,
+                tile["minX"],
+                tile["maxX"],
+                options,
+                z + 1,
+            )
+        if child is None or child >= 2:
+            right = clip(
+                features,
+                z2,
+                x + k2,
+                x + k4,
+                0,
+                tile["minX"],
+                tile["maxX"],
+                options,
+                z + 1,
+            )
+
+        if left is not None:
+            # the clipped features are cut from the geometry of the next
+            # zoom, which the bounding box of the tile may not cover
+            min_y = min(feature["minY"] for feature in left)
+            max_y = max(feature["maxY"] for feature in left)
+            if child != 1:
+                tl = clip(left, z2, y - k1, y + k3, 1, min_y, max_y, options, z + 1)
+            if child != 0:
+                bl = clip(left, z2, y + k2, y + k4, 1, min_y, max_y, options, z + 1)
+            left = None
+
+        if right is not None:
+            min_y = min(feature["minY"] for feature in right)
+            max_y = max(feature["maxY"] for feature in right)
+            if child != 3:
+                tr = clip(right, z2, y - k1, y + k3, 1, min_y, max_y, options, z + 1)
+            if child != 2:
+                br = clip(right, z2, y + k2, y + k4, 1, min_y, max_y, options, z + 1)
+            right = None
+        return tl, bl, tr, br
+
+    def transform(self, tile, extent, arrays=False):
+        if arrays:
+            return transform_tile_arrays(tile, extent)
+        return transform_tile(tile, extent)
+
+
+BACKENDS = {
+    "slice": SliceBackend,
+    "columnar": ColumnarBackend,
+}
+
+
 class MicroJsonVt:
     """
     MicroJsonVt class, which is the main class for generating vector tiles
@@ -163,10 +579,25 @@ class MicroJsonVt:
                 )
         elif not callable(tolerance_setting):
             raise TypeError(
-                "Option 'tolerance_function' must be a callable function or a valid string key."
+                "Option 'tolerance_function' must be a callable function or a "
+                "valid string key."
             )
         # If it's already callable, we use it directly.
 
+        priority_setting = options.get("featurePriority")
+        if isinstance(priority_setting, str):
+            if priority_setting not in AVAILABLE_PRIORITY_FUNCTIONS:
+                raise ValueError(
+                    f"Invalid feature priority key: '{priority_setting}'. "
+                    f"Available keys: {list(AVAILABLE_PRIORITY_FUNCTIONS.keys())}"
+                )
+            options["featurePriority"] = AVAILABLE_PRIORITY_FUNCTIONS[priority_setting]
+        elif not callable(priority_setting):
+            raise TypeError(
+                "Option 'featurePriority' must be a callable function or a valid "
+                "string key."
+            )
+
         logging.debug("preprocess data start")
 
         if options.get("maxZoom") < 0 or options.get("maxZoom") > 24:
@@ -176,52 +607,59 @@ class MicroJsonVt:
         ):
             raise Exception("promoteId and generateId cannot be used together.")
 
-        # projects and adds simplification info
-        # Create a new instance of a CartesianProjector
+        if options.get("smallPolygons") not in ("drop", "point"):
+            raise ValueError(
+                f"Invalid smallPolygons: '{options.get('smallPolygons')}'. "
+                "Available values: ['drop', 'point']"
+            )
 
-        features = convert(data, options)
+        backend = options.get("backend")
+        if backend not in BACKENDS:
+            raise ValueError(
+                f"Invalid backend: '{backend}'. "
+                f"Available backends: {list(BACKENDS.keys())}"
+            )
 
-        # Create a separate geometry for each zoom level
-        for z in range(options.get("maxZoom") + 1):
-            for feature in features:
-                feature[f"geometry_z{z}"] = feature["geometry"].copy()
+        # per-stage timings and counters, None when disabled
+        self.instrumentation = options.get("instrumentation")
 
-        tolerance_func = options["tolerance_function"]  # Resolved above
+        # projects and adds simplification info
+        self._backend = BACKENDS[backend](data, options)
+        features = self._backend.features
 
-        # Simplify features for each zoom level
-        for z in range(options.get("maxZoom") + 1):
-            # Calculate tolerance using the provided or default function
-            tolerance = tolerance_func(z, options)
-            for feature in features:
-                geometry_key = f"geometry_z{z}"
-                # check feature type only simplify Polygon
-                if feature["type"] == "Polygon":
-                    for iring in range(len(feature[geometry_key])):
-                        ring = feature[geometry_key][iring]
-                        # Convert geom to list of [x, y] pairs
-                        coords = [
-                            [ring[i], ring[i + 1]] for i in range(0, len(ring), 3)
-                        ]
-                        scoords = simplify(coords, tolerance)
-                        # Check that it has at least 4 pairs of coordinates
-                        if len(scoords) < 4:
-                            # If not, use the original coordinates
-                            feature[geometry_key][iring] = ring
-                        else:
-                            # flatten the simplified coords
-                            simplified_ring = []
-                            for i in range(len(scoords)):
-                                simplified_ring.append(scoords[i][0])
-                                simplified_ring.append(scoords[i][1])
-                                simplified_ring.append(0)
-                            feature[geometry_key][iring] = simplified_ring
+        # only the first tiling pass of this index is run in parallel
+        self._parallel = options.get("workers") > 1
 
         # tiles and tile_coords are part of the public API
         self.tiles = {}
-        self.tile_coords = []
 
-        self.stats = {}
+        # tiles created per zoom, and get_tile hits, misses and evictions
+        self.stats = {"hits": 0, "misses": 0, "evicted": 0}
         self.total = 0
+        # least recently used tiles beyond the limits are dropped from tiles
+        self._tile_cache = None
+        if (
+            options.get("tileCacheSize") is not None
+            or options.get("tileCacheBytes") is not None
+        ):
+            self._tile_cache = TileCache(
+                self._backend.tile_nbytes,
+                options.get("tileCacheSize"),
+                options.get("tileCacheBytes"),
+            )
+        # tiles with features, among the tiles cut so far, with the sparse
+        # option
+        self.occupancy = TileOccupancy() if options.get("sparse") else None
+        # spatial index of the retained source of each tile drilled from
+        self._source_indexes = {}
+        # whether tiles were dropped, so split tiles may miss children
+        self._pruned = False
+        # sort keys of the converted features for maxFeaturesPerTile
+        self._priorities = None
+        # the input position given to added features, for generateId
+        self._next_index = (
+            len(data.get("features")) if data.get("type") == "FeatureCollection" else 1
+        )
 
         # wraps features (ie extreme west and extreme east)
         # features = wrap(features, options)
@@ -252,34 +690,32 @@ class MicroJsonVt:
         """
         stack = [features, z, x, y]
         options = self.options
+        # lazily simplified zooms are dropped once their subtrees are done
+        release = options.get("lazySimplify") and cz is None
+        # subtrees below parallelZoom are left to worker processes
+        subtrees = [] if self._parallel and cz is None else None
         # avoid recursion by using a processing queue
         while len(stack) > 0:
+            if release:
+                # the stack is ordered by zoom, so its bottom holds the lowest
+                # pending zoom; no pending tile needs the zooms below it
+                self._backend.release(stack[1] - 1)
             y = stack.pop()
             x = stack.pop()
             z = stack.pop()
             features = stack.pop()
 
-            z2 = 1 << z
             id_ = to_Id(z, x, y)
             tile = self.tiles.get(id_, None)
 
             if tile is None:
-                # Use simplified geometries for this zoom level
-                simplified_features = [
-                    {**feature, "geometry": feature[f"geometry_z{z}"]}
-                    for feature in features
-                ]
-
-                self.tiles[id_] = create_tile(simplified_features, z, x, y, options)
-                tile = self.tiles[id_]
-                self.tile_coords.append({"z": z, "x": x, "y": y})
-
-                self.stats[f"z{z}"] = self.stats.get(f"z{z}", 0) + 1
-                self.total += 1
+                tile = self.create_tile(features, z, x, y)
+                self.add_tile(tile)
 
             # save reference to original geometry in tile so that we can drill
             # down later if we stop now
             tile["source"] = features
+            self.cache_tile(id_)
 
             # if it's the first-pass tiling
             if cz is None:
@@ -300,118 +736,485 @@ class MicroJsonVt:
 
             # if we slice further down, no need to keep source geometry
             tile["source"] = None
+            self.cache_tile(id_)
 
             if not features or len(features) == 0:
                 continue
 
+            if subtrees is not None and z == options.get("parallelZoom"):
+                subtrees.append((features, z, x, y))
+                continue
+
             logging.debug("clipping start")
 
-            # values we'll use for clipping
-            k1 = 0.5 * options.get("buffer") / options.get("extent")
-            k2 = 0.5 - k1
-            k3 = 0.5 + k1
-            k4 = 1 + k1
+            tl, bl, tr, br = self.split(features, z, x, y, tile)
+            features = None
 
-            tl = None
-            bl = None
-            tr = None
-            br = None
+            logging.debug("clipping ended")
 
-            left = clip(
-                features,
-                z2,
-                x - k1,
-                x + k3,
-                0,
-                tile["minX"],
-                tile["maxX"],
-                options,
-                z + 1,
-            )
-            right = clip(
-                features,
-                z2,
-                x + k2,
-                x + k4,
-                0,
-                tile["minX"],
-                tile["maxX"],
-                options,
-                z + 1,
-            )
-            features = None
+            self.push_children(stack, (tl, bl, tr, br), z, x, y)
 
-            if left is not None:
-                tl = clip(
-                    left,
-                    z2,
-                    y - k1,
-                    y + k3,
-                    1,
-                    tile["minY"],
-                    tile["maxY"],
-                    options,
-                    z + 1,
-                )
-                bl = clip(
-                    left,
-                    z2,
-                    y + k2,
-                    y + k4,
-                    1,
-                    tile["minY"],
-                    tile["maxY"],
-                    options,
-                    z + 1,
-                )
-                left = None
-
-            if right is not None:
-                tr = clip(
-                    right,
-                    z2,
-                    y - k1,
-                    y + k3,
-                    1,
-                    tile["minY"],
-                    tile["maxY"],
-                    options,
-                    z + 1,
+        if release:
+            self._backend.release()
+        if subtrees:
+            self.split_subtrees(subtrees)
+
+    def split_subtrees(self, subtrees):
+        """
+        Tiles subtrees in worker processes and merges their tiles into the
+        index, in the order a serial run would have created them.
+
+        Args:
+            subtrees (list): (features, z, x, y) of the root tile of each
+                subtree, already created by split_tile
+        """
+        with ProcessPoolExecutor(
+            max_workers=self.options.get("workers"),
+            initializer=_init_worker,
+            initargs=(self,),
+        ) as executor:
+            futures = [
+                executor.submit(_split_subtree, features, z, x, y)
+                for features, z, x, y in subtrees
+            ]
+            results = {}
+            for (_, z, x, y), future in zip(subtrees, futures):
+                results[to_Id(z, x, y)], stages = future.result()
+                if self.instrumentation is not None:
+                    self.instrumentation.merge(stages)
+
+        # the tiles of a subtree directly follow its root tile in a serial
+        # depth-first run
+        tiles = {}
+        for id_, tile in self.tiles.items():
+            tiles[id_] = tile
+            tiles.update(results.get(id_, {}))
+        self.tiles = tiles
+        for subtree_tiles in results.values():
+            for id_, tile in subtree_tiles.items():
+                if id_ not in tiles:
+                    # the root tile of the subtree was evicted meanwhile
+                    self.tiles[id_] = tile
+                z = tile["z"]
+                self.stats[f"z{z}"] = self.stats.get(f"z{z}", 0) + 1
+                self.total += 1
+                if tile["numFeatures"] > 0 and self.occupancy is not None:
+                    self.occupancy.add(z, tile["x"], tile["y"])
+                self.cache_tile(id_)
+
+    @property
+    def tile_coords(self):
+        """The coordinates of the tiles in the index, in creation order."""
+        return [
+            {"z": tile["z"], "x": tile["x"], "y": tile["y"]}
+            for tile in self.tiles.values()
+        ]
+
+    def add_tile(self, tile):
+        """Adds a newly created tile to the index and its statistics."""
+        z = tile["z"]
+        self.tiles[to_Id(z, tile["x"], tile["y"])] = tile
+        self.stats[f"z{z}"] = self.stats.get(f"z{z}", 0) + 1
+        self.total += 1
+        if tile["numFeatures"] > 0 and self.occupancy is not None:
+            self.occupancy.add(z, tile["x"], tile["y"])
+
+    def cache_tile(self, id_):
+        """
+        Accounts for a tile that was added or whose source changed, and
+        drops the least recently used tiles beyond the tileCacheSize and
+        tileCacheBytes limits. get_tile regenerates dropped tiles on demand.
+        """
+        if self._tile_cache is None:
+            return
+        for evicted in self._tile_cache.add(id_, self.tiles[id_]):
+            del self.tiles[evicted]
+            self.stats["evicted"] += 1
+            self._pruned = True
+            # the index of the root tile also serves regenerating from the
+            # converted features, which are always kept
+            if evicted != to_Id(0, 0, 0):
+                self._source_indexes.pop(evicted, None)
+
+    def create_tile(self, features, z, x, y):
+        """
+        Creates tile z/x/y from the features clipped to it. Beyond
+        maxFeaturesPerTile features, only those ranked highest by
+        featurePriority are kept in the tile, ties broken by a stable hash
+        of their id. The others are still split into the children, so they
+        show up again at the zoom where a tile holds few enough features.
+        """
+        backend = self._backend
+        timer = self.instrumentation
+        if timer is not None:
+            start = timer.start()
+        keep = None
+        budget = self.options.get("maxFeaturesPerTile")
+        if budget is not None and features is not None and len(features) > budget:
+            if self._priorities is None:
+                roots = backend.roots()
+                priority = np.asarray(
+                    self.options["featurePriority"](roots), dtype=np.float64
                 )
-                br = clip(
-                    right,
-                    z2,
-                    y + k2,
-                    y + k4,
-                    1,
-                    tile["minY"],
-                    tile["maxY"],
-                    options,
-                    z + 1,
+                self._priorities = (
+                    np.nan_to_num(priority, nan=-np.inf),
+                    hash_priority(roots),
                 )
-                right = None
+            indices = backend.root_indices(features)
+            priority, tie = (keys[indices] for keys in self._priorities)
+            keep = np.sort(np.lexsort((-tie, -priority))[:budget])
+        tile = backend.create_tile(features, z, x, y, keep)
+        if timer is not None:
+            timer.stop(
+                start,
+                "create_tile",
+                z,
+                features_in=0 if features is None else len(features),
+                vertices_out=tile["numPoints"],
+            )
+        return tile
 
-            logging.debug("clipping ended")
+    def split(self, features, z, x, y, tile, child=None):
+        """
+        Clips the features of tile z/x/y into its four children, or only
+        into the child at the given position, see SliceBackend.split.
+        """
+        timer = self.instrumentation
+        if timer is None:
+            return self._backend.split(features, z, x, y, tile, child)
+        start = timer.start()
+        children = self._backend.split(features, z, x, y, tile, child)
+        timer.stop(
+            start,
+            "split",
+            z,
+            features_in=len(features),
+            features_out=sum(len(c) for c in children if c is not None),
+        )
+        return children
 
-            stack.append(tl if tl is not None else [])
-            stack.append(z + 1)
-            stack.append(x * 2)
-            stack.append(y * 2)
+    def transform(self, tile):
+        """
+        Returns a tile in tile coordinates. Up to dissolveMaxZoom, the
+        polygons sharing the dissolveBy property are merged, see
+        dissolve_features.
+
+        With the layerBy option, the features are also grouped by the value
+        of that property under "layers", in the order of layerZooms and then
+        of their first feature. The layers whose layerZooms range does not
+        hold the zoom of the tile are left out, of "features" as well.
+
+        With the arrayGeometry option, the geometry of the features is
+        built as int32 arrays by transform_tile_arrays, except at the zooms
+        that are dissolved.
+        """
+        options = self.options
+        timer = self.instrumentation
+        z = tile["z"]
+        if timer is not None:
+            start = timer.start()
+        # dissolve_features reads the rings as lists
+        max_zoom = options.get("dissolveMaxZoom")
+        arrays = options.get("arrayGeometry") and (max_zoom is None or z > max_zoom)
+        transformed = self._backend.transform(tile, options.get("extent"), arrays)
+        if timer is not None:
+            timer.stop(
+                start,
+                "transform",
+                z,
+                features_out=len(transformed["features"]),
+            )
+        layer_by = options.get("layerBy")
+        if layer_by is None:
+            features = self.dissolve(transformed["features"], z)
+            if features is transformed["features"]:
+                return transformed
+            # the slice backend transforms the stored tile in place
+            return {**transformed, "features": features}
+
+        zooms = options.get("layerZooms") or {}
+        layers = {name: [] for name in zooms}
+        for feature in transformed["features"]:
+            name = (feature.get("tags") or {}).get(layer_by)
+            layers.setdefault(name, []).append(feature)
+        for name, (min_zoom, max_zoom) in zooms.items():
+            if not min_zoom <= z <= max_zoom:
+                del layers[name]
+        features = []
+        for name, layer in layers.items():
+            layer = layers[name] = self.dissolve(layer, z)
+            features.extend(layer)
+        return {**transformed, "features": features, "layers": layers}
+
+    def dissolve(self, features, z):
+        """
+        Returns the features of a transformed tile at zoom z, with their
+        polygons merged up to dissolveMaxZoom, see dissolve_features.
+        """
+        options = self.options
+        max_zoom = options.get("dissolveMaxZoom")
+        if max_zoom is None or z > max_zoom:
+            return features
+        timer = self.instrumentation
+        if timer is not None:
+            start = timer.start()
+        dissolved = dissolve_features(
+            features,
+            options.get("dissolveBy"),
+            options.get("dissolveSum"),
+        )
+        if timer is not None:
+            timer.stop(
+                start,
+                "dissolve",
+                z,
+                features_in=len(features),
+                features_out=len(dissolved),
+            )
+        return dissolved
 
-            stack.append(bl if bl is not None else [])
+    def push_children(self, stack, children, z, x, y):
+        """
+        Pushes the top-left, bottom-left, top-right and bottom-right children
+        of tile z/x/y onto a split_tile stack. Children without features are
+        pushed as empty tiles, or skipped with the sparse option.
+        """
+        sparse = self.options.get("sparse")
+        for features, cx, cy in zip(
+            children,
+            (x * 2, x * 2, x * 2 + 1, x * 2 + 1),
+            (y * 2, y * 2 + 1, y * 2, y * 2 + 1),
+        ):
+            if features is None:
+                if sparse:
+                    continue
+                features = []
+            stack.append(features)
             stack.append(z + 1)
-            stack.append(x * 2)
-            stack.append(y * 2 + 1)
+            stack.append(cx)
+            stack.append(cy)
 
-            stack.append(tr if tr is not None else [])
-            stack.append(z + 1)
-            stack.append(x * 2 + 1)
-            stack.append(y * 2)
+    def iter_tiles(self, minzoom=0, maxzoom=None, tiles=None):
+        """
+        Cuts the whole tile pyramid depth-first and yields each tile as soon
+        as it is cut, without storing it in the index.
 
-            stack.append(br if br is not None else [])
-            stack.append(z + 1)
-            stack.append(x * 2 + 1)
-            stack.append(y * 2 + 1)
+        Every tile with features is split down to maxzoom, regardless of
+        indexMaxZoom and indexMaxPoints. A tile's geometry is released once
+        it is split, so only the tiles along one root-to-leaf path and their
+        pending siblings are held at a time.
+
+        Args:
+            minzoom (int): The lowest zoom level to yield
+            maxzoom (int): The highest zoom level to cut, at most maxZoom
+            tiles (set): The (z, x, y) of the tiles to cut, holding the
+                parent of each, such as covering_tiles returns, None for all
+
+        Yields:
+            dict: The transformed tiles, as returned by get_tile, in the
+            order split_tile creates them
+        """
+        options = self.options
+        max_zoom = options.get("maxZoom")
+        maxzoom = max_zoom if maxzoom is None else min(maxzoom, max_zoom)
+        release = options.get("lazySimplify")
+
+        stack = [self._backend.features, 0, 0, 0]
+        while len(stack) > 0:
+            if release:
+                # see split_tile
+                self._backend.release(stack[1] - 1)
+            y = stack.pop()
+            x = stack.pop()
+            z = stack.pop()
+            features = stack.pop()
+            if tiles is not None and (z, x, y) not in tiles:
+                continue
+
+            tile = self.create_tile(features, z, x, y)
+            if tile["numFeatures"] > 0 and self.occupancy is not None:
+                self.occupancy.add(z, x, y)
+            if z >= minzoom:
+                yield self.transform(tile)
+
+            if z == maxzoom or not features or len(features) == 0:
+                continue
+
+            tl, bl, tr, br = self.split(features, z, x, y, tile)
+            features = tile = None
+
+            self.push_children(stack, (tl, bl, tr, br), z, x, y)
+
+        if release:
+            self._backend.release()
+
+    def drill_down(self, features, z, x, y, cz, cx, cy):
+        """
+        Clips the features of tile z/x/y straight down to its descendant
+        cz/cx/cy and adds that tile to the index.
+
+        Unlike split_tile, neither the tiles in between nor their siblings
+        are created, so features only needs to hold the features that reach
+        the target tile. Without features left, the target is added as an
+        empty tile, or skipped with the sparse option.
+
+        Args:
+            features (list): The features of tile z/x/y near the target
+            z (int): The zoom level of the tile to drill from
+            x (int): The x coordinate of the tile to drill from
+            y (int): The y coordinate of the tile to drill from
+            cz (int): The zoom level of the target tile
+            cx (int): The x coordinate of the target tile
+            cy (int): The y coordinate of the target tile
+        """
+        while z < cz and features is not None and len(features) > 0:
+            tile = self.create_tile(features, z, x, y)
+            z += 1
+            x = cx >> (cz - z)
+            y = cy >> (cz - z)
+            # children are ordered top-left, bottom-left, top-right, bottom-right
+            child = (x & 1) * 2 + (y & 1)
+            features = self.split(features, z - 1, x >> 1, y >> 1, tile, child)[child]
+
+        if features is None or len(features) == 0:
+            if self.options.get("sparse"):
+                return
+            features = []
+
+        tile = self.create_tile(features, cz, cx, cy)
+        # keep the geometry to drill further down later
+        tile["source"] = features
+        self.add_tile(tile)
+        self.cache_tile(to_Id(cz, cx, cy))
+
+    def add_feature(self, feature):
+        """
+        Adds a GeoJSON feature to the index.
+
+        Args:
+            feature (dict): The GeoJSON feature to add
+
+        Returns:
+            list: The coordinates of the tiles whose content may have
+            changed, see invalidate
+        """
+        index = self._next_index
+        self._next_index += 1
+        return self.edit_features(None, feature, index)
+
+    def replace_feature(self, id_, feature):
+        """
+        Replaces the features with the given id by a GeoJSON feature, in the
+        same position.
+
+        Args:
+            id_ (str): The id of the features to replace
+            feature (dict): The new GeoJSON feature
+
+        Returns:
+            list: The coordinates of the tiles whose content may have
+            changed, see invalidate
+        """
+        # generated ids are the position of the feature in the input
+        index = int(id_) if self.options.get("generateId") else None
+        return self.edit_features(id_, feature, index)
+
+    def remove_feature(self, id_):
+        """
+        Removes the features with the given id from the index.
+
+        Args:
+            id_ (str): The id of the features to remove
+
+        Returns:
+            list: The coordinates of the tiles whose content may have
+            changed, see invalidate
+        """
+        return self.edit_features(id_, None)
+
+    def edit_features(self, id_, feature, index=None):
+        """
+        Removes the features with id id_, if given, and adds a GeoJSON
+        feature in their place, if given, then invalidates the tiles that
+        either touches.
+
+        Raises:
+            KeyError: If there is no feature with id id_
+        """
+        backend = self._backend
+        positions = []
+        boxes = []
+        if id_ is not None:
+            positions = backend.find(str(id_))
+            if len(positions) == 0:
+                raise KeyError(f"No feature with id '{id_}'")
+            boxes.append(
+                backend.bounds(backend.take(backend.features, np.array(positions)))
+            )
+        if feature is not None:
+            features = backend.convert_feature(feature, index)
+            boxes.append(backend.bounds(features))
+        else:
+            features = backend.take(backend.features, np.zeros(0, dtype=np.int64))
+        backend.splice(positions, features)
+        self._priorities = None
+        return self.invalidate(*(np.concatenate(arrays) for arrays in zip(*boxes)))
+
+    def invalidate(self, min_x, min_y, max_x, max_y):
+        """
+        Drops the tiles whose buffered bounds intersect any of the given
+        boxes, in projected coordinates. get_tile cuts them again on demand.
+
+        Returns:
+            list: The coordinates of every tile up to maxZoom that intersects
+            the boxes, by zoom and in row-major order, whether or not it is
+            in the index
+        """
+        self._pruned = True
+        dirty = []
+        for z, x, y in self.covering_tiles(min_x, min_y, max_x, max_y):
+            id_ = to_Id(z, x, y)
+            self.tiles.pop(id_, None)
+            if self._tile_cache is not None:
+                self._tile_cache.discard(id_)
+            self._source_indexes.pop(id_, None)
+            if self.occupancy is not None:
+                self.occupancy.discard(z, x, y)
+            dirty.append({"z": z, "x": x, "y": y})
+        # the converted features changed
+        self._source_indexes.pop(to_Id(0, 0, 0), None)
+        return dirty
+
+    def covering_tiles(self, min_x, min_y, max_x, max_y):
+        """
+        Returns the tiles up to maxZoom whose buffered bounds intersect any
+        of the given boxes, in projected coordinates, that is the tiles
+        that features within the boxes can reach. The parent of such a tile
+        is one too.
+
+        Returns:
+            list: The (z, x, y) of the tiles, by zoom and in row-major order
+        """
+        options = self.options
+        k = options.get("buffer") / options.get("extent")
+        min_x, min_y, max_x, max_y = (
+            np.asarray(a, dtype=np.float64) for a in (min_x, min_y, max_x, max_y)
+        )
+        covered = []
+        for z in range(options.get("maxZoom") + 1):
+            z2 = 1 << z
+            # tile x covers (x - k) / z2 to (x + 1 + k) / z2
+            x0 = np.maximum(np.ceil(min_x * z2 - 1 - k), 0).astype(np.int64)
+            y0 = np.maximum(np.ceil(min_y * z2 - 1 - k), 0).astype(np.int64)
+            x1 = np.minimum(np.floor(max_x * z2 + k), z2 - 1).astype(np.int64)
+            y1 = np.minimum(np.floor(max_y * z2 + k), z2 - 1).astype(np.int64)
+            tiles = set()
+            for a, b, c, d in zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist()):
+                tiles.update((x, y) for y in range(b, d + 1) for x in range(a, c + 1))
+            covered.extend(
+                (z, x, y) for x, y in sorted(tiles, key=lambda tile: (tile[1], tile[0]))
+            )
+        return covered
 
     def get_tile(self, z, x, y):
         z = int(z)
@@ -430,22 +1233,40 @@ class MicroJsonVt:
         id_ = to_Id(z, x, y)
         current_tile = self.tiles.get(id_, None)
         if current_tile is not None:
-            return transform_tile(self.tiles[id_], extent)
+            self.stats["hits"] += 1
+            if self._tile_cache is not None:
+                self._tile_cache.touch(id_)
+            return self.transform(current_tile)
+        self.stats["misses"] += 1
 
         logging.debug(f"drilling down to z{z}-{x}-{y}")
 
         z0 = z
         x0 = x
         y0 = y
-        parent = None
+        source = None
 
-        while parent is None and z0 > 0:
+        while z0 > 0:
             z0 -= 1
             x0 = x0 >> 1
             y0 = y0 >> 1
             parent = self.tiles.get(to_Id(z0, x0, y0), None)
-
-        if parent is None or parent.get("source", None) is None:
+            if parent is None:
+                continue
+            source = parent.get("source", None)
+            # the tiles below a split tile were all cut, unless dropped
+            if source is not None or not self._pruned:
+                break
+
+        if source is None and self._pruned:
+            # no retained ancestor is left, start over from the top
+            z0 = x0 = y0 = 0
+            source = self._backend.features
+
+        # a target without features is an empty tile, or None with the sparse
+        # option, whether its nearest retained ancestor is empty or the
+        # features near it are, see drill_down
+        if source is None or z > options.get("maxZoom"):
             return None
 
         # if we found a parent tile containing the original geometry, we can
@@ -453,18 +1274,64 @@ class MicroJsonVt:
         logging.debug(f"found parent tile z{z0}-{x0}-{y0}")
         logging.debug("drilling down start")
 
-        self.split_tile(parent.get("source"), z0, x0, y0, z, x, y)
+        # only the features near the target tile can end up in it
+        parent_id = to_Id(z0, x0, y0)
+        if self._tile_cache is not None:
+            self._tile_cache.touch(parent_id)
+        if len(source) > 0:
+            index = self._source_indexes.get(parent_id, None)
+            if index is None:
+                index = FeatureIndex(*self._backend.bounds(source))
+                self._source_indexes[parent_id] = index
+            k = options.get("buffer") / extent
+            candidates = index.query(
+                (x - k) / z2, (y - k) / z2, (x + 1 + k) / z2, (y + 1 + k) / z2
+            )
+            source = self._backend.take(source, candidates)
+        self.drill_down(source, z0, x0, y0, z, x, y)
 
         logging.debug("drilling down end")
 
         transformed = (
-            transform_tile(self.tiles[id_], extent)
+            self.transform(self.tiles[id_])
             if self.tiles.get(id_, None) is not None
             else None
         )
         return transformed
 
 
+# index copied into each worker process by split_subtrees
+_worker_index = None
+
+
+def _init_worker(index):
+    global _worker_index
+    _worker_index = index
+    _worker_index._parallel = False
+    # the parent process applies the cache limits once the tiles are merged
+    _worker_index._tile_cache = None
+
+
+def _split_subtree(features, z, x, y):
+    """
+    Tiles the subtree below tile z/x/y in a worker process.
+
+    Returns:
+        tuple: The tiles below the root tile of the subtree, in creation
+        order, and the stages recorded by the instrumentation, if any
+    """
+    index = _worker_index
+    index.tiles = {}
+    timer = index.instrumentation
+    if timer is not None:
+        # the parent process merges the stages of each subtree
+        timer.stages = {}
+    index.split_tile(features, z, x, y)
+    # the root tile was already created by the parent process
+    del index.tiles[to_Id(z, x, y)]
+    return index.tiles, {} if timer is None else timer.stages
+
+
 def to_Id(z, x, y):
     """
     Converts the zoom, x, and y coordinates to a unique id
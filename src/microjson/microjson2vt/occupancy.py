@@ -0,0 +1,137 @@
+import base64
+import json
+import zlib
+
+import numpy as np
+
+# highest zoom held as a dense bitmap, of 4 ** z / 8 bytes, the bytes of
+# the higher zooms are only held once a tile sets one of their bits
+DENSE_MAX_ZOOM = 10
+
+
+def _encode(data):
+    return base64.b64encode(zlib.compress(bytes(data))).decode("ascii")
+
+
+def _decode(text):
+    return zlib.decompress(base64.b64decode(text))
+
+
+class TileOccupancy:
+    """
+    Records which tiles of a pyramid have content, as one bitmap per zoom.
+
+    Tile x/y of zoom z is bit y * 2 ** z + x of the bitmap of zoom z, with
+    the bits of each byte in little-endian order. Up to DENSE_MAX_ZOOM, a
+    bitmap is a bytearray of 4 ** z / 8 bytes, allocated once a tile of its
+    zoom is added. Above it, a bitmap is a dict holding its non-zero bytes
+    by index, so its size follows the number of tiles added.
+    """
+
+    def __init__(self):
+        self.bitmaps = {}
+
+    def add(self, z, x, y):
+        """Marks tile z/x/y as having content."""
+        bitmap = self.bitmaps.get(z)
+        if bitmap is None:
+            bitmap = self.bitmaps[z] = (
+                bytearray(((1 << (2 * z)) + 7) // 8) if z <= DENSE_MAX_ZOOM else {}
+            )
+        i = (y << z) + x
+        if isinstance(bitmap, dict):
+            bitmap[i >> 3] = bitmap.get(i >> 3, 0) | (1 << (i & 7))
+        else:
+            bitmap[i >> 3] |= 1 << (i & 7)
+
+    def discard(self, z, x, y):
+        """Marks tile z/x/y as having no content."""
+        bitmap = self.bitmaps.get(z)
+        if bitmap is None:
+            return
+        i = (y << z) + x
+        if isinstance(bitmap, dict):
+            byte = bitmap.get(i >> 3, 0) & ~(1 << (i & 7))
+            if byte:
+                bitmap[i >> 3] = byte
+            else:
+                bitmap.pop(i >> 3, None)
+        else:
+            bitmap[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+
+    def __contains__(self, tile):
+        z, x, y = tile
+        bitmap = self.bitmaps.get(z)
+        if bitmap is None or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+            return False
+        i = (y << z) + x
+        if isinstance(bitmap, dict):
+            return bool(bitmap.get(i >> 3, 0) & (1 << (i & 7)))
+        return bool(bitmap[i >> 3] & (1 << (i & 7)))
+
+    def count(self, z):
+        """Returns the number of tiles with content at zoom z."""
+        bitmap = self.bitmaps.get(z)
+        if bitmap is None:
+            return 0
+        if isinstance(bitmap, dict):
+            return sum(byte.bit_count() for byte in bitmap.values())
+        return int.from_bytes(bitmap, "little").bit_count()
+
+    def tiles(self, z):
+        """Yields the (x, y) coordinates of the tiles with content at zoom z."""
+        bitmap = self.bitmaps.get(z)
+        if bitmap is None:
+            return
+        items = (
+            sorted(bitmap.items()) if isinstance(bitmap, dict) else enumerate(bitmap)
+        )
+        for byte_index, byte in items:
+            while byte:
+                bit = (byte & -byte).bit_length() - 1
+                i = (byte_index << 3) + bit
+                yield i & ((1 << z) - 1), i >> z
+                byte &= byte - 1
+
+    def to_dict(self):
+        """
+        Returns the occupancy as a JSON serialisable dict, holding the
+        zlib-compressed, base64-encoded bitmap of each zoom, or above
+        DENSE_MAX_ZOOM its non-zero bytes, as the little-endian uint64
+        indices of the bytes and the bytes.
+        """
+        zooms = {}
+        for z, bitmap in sorted(self.bitmaps.items()):
+            zoom = zooms[str(z)] = {"count": self.count(z)}
+            if isinstance(bitmap, dict):
+                indices = sorted(bitmap)
+                zoom["indices"] = _encode(np.array(indices, dtype="<u8").tobytes())
+                zoom["bytes"] = _encode(bytes(bitmap[i] for i in indices))
+            else:
+                zoom["bitmap"] = _encode(bitmap)
+        return {"order": "row-major", "zooms": zooms}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Creates an occupancy from the output of to_dict."""
+        occupancy = cls()
+        for z, zoom in data["zooms"].items():
+            if "bitmap" in zoom:
+                occupancy.bitmaps[int(z)] = bytearray(_decode(zoom["bitmap"]))
+            else:
+                indices = np.frombuffer(_decode(zoom["indices"]), dtype="<u8")
+                occupancy.bitmaps[int(z)] = dict(
+                    zip(indices.tolist(), _decode(zoom["bytes"]))
+                )
+        return occupancy
+
+    def save(self, path):
+        """Writes the occupancy to a JSON file."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f)
+
+    @classmethod
+    def load(cls, path):
+        """Reads an occupancy written by save."""
+        with open(path, "r") as f:
+            return cls.from_dict(json.load(f))
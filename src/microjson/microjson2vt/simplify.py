@@ -4,75 +4,111 @@
 
 # Modifications by PolusAI, 2024
 
+import heapq
 
-def simplify(coords, sq_tolerance, min_vertices=3):
-    """Simplifies a list of coordinates using the Ramer-Douglas-Peucker
-    algorithm."""
+MAX_ITERATIONS = 50
+
+
+def get_sq_seg_dist(px, py, x, y, bx, by):
+    """Calculates the square distance from a point to a segment."""
+    dx = bx - x
+    dy = by - y
+
+    if dx != 0 or dy != 0:
+        t = ((px - x) * dx + (py - y) * dy) / (dx * dx + dy * dy)
+
+        if t > 1:
+            x = bx
+            y = by
+        elif t > 0:
+            x += dx * t
+            y += dy * t
 
-    def get_sq_seg_dist(px, py, x, y, bx, by):
-        """Calculates the square distance from a point to a segment."""
-        dx = bx - x
-        dy = by - y
+    dx = px - x
+    dy = py - y
 
-        if dx != 0 or dy != 0:
-            t = ((px - x) * dx + (py - y) * dy) / (dx * dx + dy * dy)
+    return dx * dx + dy * dy
 
-            if t > 1:
-                x = bx
-                y = by
-            elif t > 0:
-                x += dx * t
-                y += dy * t
 
-        dx = px - x
-        dy = py - y
+def rank_vertices(xs, ys):
+    """
+    Ranks the vertices of a line by their importance in the
+    Ramer-Douglas-Peucker algorithm.
 
-        return dx * dx + dy * dy
+    The importance of a vertex is the square distance at which the algorithm
+    splits the line at it, capped by the importance of the vertex that split
+    the enclosing segment. Simplifying with a square tolerance then keeps
+    exactly the end points and the vertices whose importance is above the
+    tolerance.
 
-    def simplify_recursive(coords, sq_tolerance):
-        """Recursive step"""
-        first = 0
-        last = len(coords) - 1
+    Args:
+        xs (list): x coordinates of the vertices
+        ys (list): y coordinates of the vertices
+
+    Returns:
+        list: the importance of each vertex, infinite for the end points
+    """
+    n = len(xs)
+    importance = [0.0] * n
+    if n == 0:
+        return importance
+    importance[0] = importance[n - 1] = float("inf")
+
+    # avoid recursion by using a stack of segments and their cap
+    stack = [(0, n - 1, float("inf"))]
+    while stack:
+        first, last, cap = stack.pop()
         max_sq_dist = 0
         index = None
+        ax = xs[first]
+        ay = ys[first]
+        bx = xs[last]
+        by = ys[last]
 
-        for i in range(1, last):
-            sq_dist = get_sq_seg_dist(
-                coords[i][0],
-                coords[i][1],
-                coords[first][0],
-                coords[first][1],
-                coords[last][0],
-                coords[last][1],
-            )
+        for i in range(first + 1, last):
+            sq_dist = get_sq_seg_dist(xs[i], ys[i], ax, ay, bx, by)
             if sq_dist > max_sq_dist:
                 index = i
                 max_sq_dist = sq_dist
 
-        if max_sq_dist > sq_tolerance and sq_tolerance > 0:
-            left_simplified = simplify_recursive(coords[: index + 1], sq_tolerance)
-            right_simplified = simplify_recursive(coords[index:], sq_tolerance)
+        if index is None:
+            continue
+        sq_dist = min(max_sq_dist, cap)
+        importance[index] = sq_dist
+        stack.append((first, index, sq_dist))
+        stack.append((index, last, sq_dist))
+    return importance
 
-            new_coords = left_simplified[:-1] + right_simplified
 
-            return new_coords
+def rank_threshold(importance, sq_tolerance, min_vertices=3):
+    """
+    Returns the square tolerance simplify would end up using for a line with
+    the given vertex importance, or None if it would keep the line as is.
 
-            # Exclude the last point of the left as it's the first of the
-            # right.
-            # return left_simplified + right_simplified[1:]
-        else:
-            return [coords[first], coords[last]]
+    As in simplify, the tolerance is halved until more than min_vertices
+    vertices are left.
+    """
+    if len(importance) <= min_vertices or not sq_tolerance > 0:
+        return None
+    # the end points are always kept, so more than min_vertices vertices are
+    # left when enough inner vertices are above the tolerance
+    if min_vertices < 2:
+        return sq_tolerance
+    needed = heapq.nlargest(min_vertices - 1, importance[1:-1])[-1]
+    for _ in range(MAX_ITERATIONS):
+        if needed > sq_tolerance:
+            return sq_tolerance
+        # try again with a lower tolerance
+        sq_tolerance /= 2
+    return None
 
-    if len(coords) <= min_vertices:
-        return coords
-    else:
-        max_iterations = 50
-        for _ in range(max_iterations):
-            simplified = simplify_recursive(coords, sq_tolerance)
-            # check that the simplification has enough vertices
-            if len(simplified) > min_vertices:
-                return simplified
-            # try again with a lower tolerance
-            sq_tolerance /= 2
-        # exhausted iterations — return original coordinates
+
+def simplify(coords, sq_tolerance, min_vertices=3):
+    """Simplifies a list of coordinates using the Ramer-Douglas-Peucker
+    algorithm."""
+    importance = rank_vertices([c[0] for c in coords], [c[1] for c in coords])
+    threshold = rank_threshold(importance, sq_tolerance, min_vertices)
+    if threshold is None:
+        # too short, or exhausted iterations — return original coordinates
         return coords
+    return [c for c, sq_dist in zip(coords, importance) if sq_dist > threshold]
@@ -0,0 +1,80 @@
+import math
+import numpy as np
+from .columnar import concat_ranges
+
+
+class FeatureIndex:
+    """
+    Static R-tree over feature bounding boxes, packed with the
+    Sort-Tile-Recursive (STR) algorithm.
+
+    The boxes are sorted into vertical slices by their x center and each
+    slice by y center, then packed into leaves of node_size boxes. Every
+    upper level groups node_size consecutive nodes of the level below.
+
+    Attributes:
+        order (np.ndarray): feature index of every box in packed order
+        levels (list): (min_x, min_y, max_x, max_y) arrays of the boxes of
+            every level, from the features up to the root
+        node_size (int): maximum number of children of a node
+    """
+
+    def __init__(self, min_x, min_y, max_x, max_y, node_size=16):
+        min_x = np.asarray(min_x, dtype=np.float64)
+        min_y = np.asarray(min_y, dtype=np.float64)
+        max_x = np.asarray(max_x, dtype=np.float64)
+        max_y = np.asarray(max_y, dtype=np.float64)
+        self.node_size = node_size
+
+        n = len(min_x)
+        num_leaves = math.ceil(n / node_size)
+        slice_size = node_size * max(1, math.ceil(math.sqrt(num_leaves)))
+        order = np.argsort(min_x + max_x, kind="stable")
+        center_y = (min_y + max_y)[order]
+        for start in range(0, n, slice_size):
+            stop = min(start + slice_size, n)
+            order[start:stop] = order[start:stop][
+                np.argsort(center_y[start:stop], kind="stable")
+            ]
+        self.order = order
+
+        level = (min_x[order], min_y[order], max_x[order], max_y[order])
+        self.levels = [level]
+        while len(level[0]) > 1:
+            starts = np.arange(0, len(level[0]), node_size)
+            level = (
+                np.minimum.reduceat(level[0], starts),
+                np.minimum.reduceat(level[1], starts),
+                np.maximum.reduceat(level[2], starts),
+                np.maximum.reduceat(level[3], starts),
+            )
+            self.levels.append(level)
+
+    def __len__(self):
+        return len(self.order)
+
+    def query(self, min_x, min_y, max_x, max_y):
+        """
+        Finds the features whose bounding box intersects the given box,
+        edges included.
+
+        Returns:
+            np.ndarray: The sorted indices of the features
+        """
+        if len(self.order) == 0:
+            return np.zeros(0, dtype=np.int64)
+        nodes = np.arange(len(self.levels[-1][0]))
+        for depth in range(len(self.levels) - 1, -1, -1):
+            lx, ly, ux, uy = self.levels[depth]
+            hit = (
+                (lx[nodes] <= max_x)
+                & (ux[nodes] >= min_x)
+                & (ly[nodes] <= max_y)
+                & (uy[nodes] >= min_y)
+            )
+            nodes = nodes[hit]
+            if depth > 0:
+                size = len(self.levels[depth - 1][0])
+                starts = nodes * self.node_size
+                nodes = concat_ranges(starts, np.minimum(starts + self.node_size, size))
+        return np.sort(self.order[nodes])
@@ -4,6 +4,8 @@
 
 # Modifications by PolusAI, 2024
 
+from .feature import is_line_pieces
+
 
 def create_tile(features, z, tx, ty, options):
     features = features if features is not None else []
@@ -12,6 +14,10 @@ def create_tile(features, z, tx, ty, options):
         if z == options.get("maxZoom")
         else options.get("tolerance") / ((1 << z) * options.get("extent"))
     )
+    # smallest polygon area kept, from square tile units to projected units
+    min_area = (options.get("minPolygonArea") or 0) / (
+        (1 << z) * options.get("extent")
+    ) ** 2
     tile = {
         "features": [],
         "numPoints": 0,
@@ -28,11 +34,11 @@ def create_tile(features, z, tx, ty, options):
         "maxY": 0,
     }
     for feature in features:
-        add_feature(tile, feature, tolerance, options)
+        add_feature(tile, feature, tolerance, options, min_area)
     return tile
 
 
-def add_feature(tile, feature, tolerance, options):
+def add_feature(tile, feature, tolerance, options, min_area=0):
     geom = feature.get("geometry")
     type_ = feature.get("type")
     simplified = []
@@ -49,18 +55,38 @@ def add_feature(tile, feature, tolerance, options):
             tile["numPoints"] += 1
             tile["numSimplified"] += 1
 
+    elif type_ == "LineString" and is_line_pieces(geom):
+        for line in geom:
+            add_line(simplified, line, tile, tolerance, False, False)
+
     elif type_ == "LineString":
         add_line(simplified, geom, tile, tolerance, False, False)
 
-    elif type_ == "MultiLineString" or type_ == "Polygon":
+    elif type_ == "MultiLineString":
         for i in range(len(geom)):
-            add_line(simplified, geom[i], tile, tolerance, type_ == "Polygon", i == 0)
-
-    elif type_ == "MultiPolygon":
-        for k in range(len(geom)):
-            polygon = geom[k]
+            add_line(simplified, geom[i], tile, tolerance, False, False)
+
+    elif type_ == "Polygon" or type_ == "MultiPolygon":
+        polygons = geom if type_ == "MultiPolygon" else [geom]
+        centroids = []
+        for polygon in polygons:
+            if min_area > 0:
+                # drop the parts smaller than min_area
+                area, x, y = ring_centroid(polygon[0])
+                if abs(area) < min_area:
+                    centroids.append(x)
+                    centroids.append(y)
+                    continue
             for i in range(len(polygon)):
                 add_line(simplified, polygon[i], tile, tolerance, True, i == 0)
+        if len(centroids) == 2 * len(polygons) and (
+            options.get("smallPolygons") == "point"
+        ):
+            # every part is too small, keep the feature as points
+            type_ = "MultiPoint" if len(polygons) > 1 else "Point"
+            simplified = centroids
+            tile["numPoints"] += len(polygons)
+            tile["numSimplified"] += len(polygons)
 
     if len(simplified) > 0:
         tags = feature.get("tags")
@@ -88,7 +114,6 @@ def add_feature(tile, feature, tolerance, options):
 
 
 def add_line(result, geom, tile, tolerance, is_polygon, is_outer):
-
     # Convert geom to list of [x, y] pairs
     coords = [[geom[i], geom[i + 1]] for i in range(0, len(geom), 3)]
 
@@ -108,6 +133,25 @@ def add_line(result, geom, tile, tolerance, is_polygon, is_outer):
     result.append(ring)
 
 
+def ring_centroid(ring):
+    """
+    Returns the signed area and the centroid x and y of a ring of [x, y, z]
+    triplets. A ring without area gets the mean of its vertices.
+    """
+    area = cx = cy = 0
+    n = len(ring)
+    for i in range(0, n, 3):
+        j = i + 3 if i + 3 < n else 0
+        cross = ring[i] * ring[j + 1] - ring[j] * ring[i + 1]
+        area += cross
+        cx += (ring[i] + ring[j]) * cross
+        cy += (ring[i + 1] + ring[j + 1]) * cross
+    area /= 2
+    if area == 0:
+        return 0, sum(ring[0::3]) / (n // 3), sum(ring[1::3]) / (n // 3)
+    return area, cx / (6 * area), cy / (6 * area)
+
+
 def rewind(ring, clockwise):
     area = 0
     ringl = len(ring)
@@ -116,7 +160,8 @@ def rewind(ring, clockwise):
         area += (ring[i] - ring[j]) * (ring[i + 1] + ring[j + 1])
         j = i
     if (area > 0) == clockwise:
-        for i in range(0, ringl, 2):
+        # swap vertex pairs from both ends up to the middle of the ring
+        for i in range(0, ringl // 2, 2):
             x = ring[i]
             y = ring[i + 1]
             ring[i] = ring[ringl - 2 - i]
@@ -4,39 +4,208 @@
 
 # Modifications by PolusAI, 2024
 
+import itertools
+import numpy as np
+
 
 def transform_tile(tile, extent):
-    if tile.get('transformed', None):
+    if tile.get("transformed", None):
         return tile
 
-    z2 = 1 << tile.get('z')
-    tx = tile.get('x')
-    ty = tile.get('y')
+    z2 = 1 << tile.get("z")
+    tx = tile.get("x")
+    ty = tile.get("y")
 
-    for feature in tile.get('features', []):
-        geom = feature.get('geometry')
-        type_ = feature.get('type')
+    for feature in tile.get("features", []):
+        geom = feature.get("geometry")
+        type_ = feature.get("type")
 
-        feature['geometry'] = []
+        feature["geometry"] = []
 
         if type_ == 1:
             for j in range(0, len(geom), 2):
-                feature['geometry'].append(transform_point(
-                    geom[j], geom[j + 1], extent, z2, tx, ty))
+                feature["geometry"].append(
+                    transform_point(geom[j], geom[j + 1], extent, z2, tx, ty)
+                )
         else:
             for j in range(len(geom)):
                 ring = []
                 for k in range(0, len(geom[j]), 2):
-                    ring.append(transform_point(
-                        geom[j][k], geom[j][k + 1], extent, z2, tx, ty))
-                feature['geometry'].append(ring)
+                    ring.append(
+                        transform_point(geom[j][k], geom[j][k + 1], extent, z2, tx, ty)
+                    )
+                feature["geometry"].append(ring)
 
-    tile['transformed'] = True
+    tile["transformed"] = True
     return tile
 
 
 def transform_point(x, y, extent, z2, tx, ty):
-    return [
-        round(extent * (x * z2 - tx), 0),
-        round(extent * (y * z2 - ty), 0)
-    ]
+    return [round(extent * (x * z2 - tx), 0), round(extent * (y * z2 - ty), 0)]
+
+
+# fewest vertices of a ring of each tile type, with the closing vertex of
+# polygon rings
+MIN_RING_VERTICES = np.array([0, 1, 2, 4])
+
+
+class TileRings:
+    """
+    The geometry of the features of a transformed tile as arrays, built by
+    transform_rings.
+
+    Attributes:
+        coords (np.ndarray): The (n, 2) int32 tile coordinates of all rings
+        ring_offsets (np.ndarray): The start of each ring in coords, and
+            the end of the last one. The points of a Point or MultiPoint
+            feature are one ring.
+        feature_offsets (np.ndarray): The first ring of each feature, and
+            the end of the last one
+        types (np.ndarray): The tile type, 1, 2 or 3, of each feature
+        encoded: The encoded geometry, cached by the encoder
+    """
+
+    def __init__(self, coords, ring_offsets, feature_offsets, types):
+        self.coords = coords
+        self.ring_offsets = ring_offsets
+        self.feature_offsets = feature_offsets
+        self.types = types
+        self.encoded = None
+
+
+class FeatureRings:
+    """
+    The geometry of one feature of TileRings. It iterates like the geometry
+    of transform_tile, over the points of a point feature, or the rings of
+    a line or polygon feature as (n, 2) arrays.
+    """
+
+    __slots__ = ("rings", "index")
+
+    def __init__(self, rings, index):
+        self.rings = rings
+        self.index = index
+
+    def ring_arrays(self):
+        """Returns the (n, 2) coordinates of each ring of the feature."""
+        rings = self.rings
+        offsets = rings.ring_offsets
+        first = rings.feature_offsets[self.index]
+        last = rings.feature_offsets[self.index + 1]
+        return [rings.coords[offsets[r] : offsets[r + 1]] for r in range(first, last)]
+
+    def __iter__(self):
+        rings = self.ring_arrays()
+        if self.rings.types[self.index] == 1:
+            return iter(rings[0])
+        return iter(rings)
+
+    def __len__(self):
+        if self.rings.types[self.index] == 1:
+            return len(self.ring_arrays()[0])
+        return int(
+            self.rings.feature_offsets[self.index + 1]
+            - self.rings.feature_offsets[self.index]
+        )
+
+    def tolist(self):
+        """Returns the geometry as lists, as built by transform_tile."""
+        if self.rings.types[self.index] == 1:
+            return self.ring_arrays()[0].tolist()
+        return [ring.tolist() for ring in self.ring_arrays()]
+
+
+def transform_rings(coords, ring_offsets, feature_offsets, types, extent, z2, tx, ty):
+    """
+    Maps the projected coordinates of the rings of a tile to int32 tile
+    coordinates at once, and drops the consecutive vertices of lines and
+    polygon rings that snap to the same pixel. The rings left with too few
+    vertices are dropped, then the features left without rings.
+
+    Args:
+        coords (np.ndarray): The (n, 2) projected coordinates
+        ring_offsets (np.ndarray): The start of each ring in coords, and
+            the end of the last one
+        feature_offsets (np.ndarray): The first ring of each feature, and
+            the end of the last one
+        types (np.ndarray): The tile type, 1, 2 or 3, of each feature
+        extent (int): The tile extent
+        z2 (int): The number of tiles along an axis at the zoom of the tile
+        tx (int): The x of the tile
+        ty (int): The y of the tile
+
+    Returns:
+        tuple: The TileRings of the features kept, and whether each feature
+        was kept
+    """
+    ring_offsets = np.asarray(ring_offsets, dtype=np.int64)
+    feature_offsets = np.asarray(feature_offsets, dtype=np.int64)
+    types = np.asarray(types, dtype=np.int64)
+    xy = np.round(extent * (coords * z2 - (tx, ty))).astype(np.int32)
+    ring_types = np.repeat(types, np.diff(feature_offsets))
+    ring_lengths = np.diff(ring_offsets)
+
+    keep = np.ones(len(xy), dtype=bool)
+    keep[1:] = (xy[1:] != xy[:-1]).any(axis=1)
+    starts = ring_offsets[:-1]
+    keep[starts[starts < len(xy)]] = True
+    keep[np.repeat(ring_types == 1, ring_lengths)] = True
+
+    lengths = np.diff(np.concatenate([[0], np.cumsum(keep)])[ring_offsets])
+    valid = lengths >= MIN_RING_VERTICES[ring_types]
+    keep &= np.repeat(valid, ring_lengths)
+
+    rings = np.concatenate([[0], np.cumsum(valid)])[feature_offsets]
+    kept = np.diff(rings) > 0
+    tile_rings = TileRings(
+        xy[keep],
+        np.concatenate([[0], np.cumsum(lengths[valid])]),
+        np.concatenate([rings[:-1][kept], rings[-1:]]),
+        types[kept],
+    )
+    return tile_rings, kept
+
+
+def transform_tile_arrays(tile, extent):
+    """
+    Transforms a tile like transform_tile, with the geometry of each feature
+    as a FeatureRings of the TileRings of the tile, built at once by
+    transform_rings. Features left without rings are removed from the tile.
+    """
+    if tile.get("transformed", None):
+        return tile
+
+    features = tile.get("features", [])
+    rings = []
+    feature_rings = [0]
+    for feature in features:
+        geom = feature.get("geometry")
+        if feature.get("type") == 1:
+            rings.append(geom)
+        else:
+            rings.extend(geom)
+        feature_rings.append(len(rings))
+
+    ring_offsets = np.concatenate(
+        [[0], np.cumsum([len(ring) // 2 for ring in rings], dtype=np.int64)]
+    )
+    coords = np.fromiter(
+        itertools.chain.from_iterable(rings), np.float64, 2 * int(ring_offsets[-1])
+    ).reshape(-1, 2)
+    tile_rings, kept = transform_rings(
+        coords,
+        ring_offsets,
+        feature_rings,
+        [feature.get("type") for feature in features],
+        extent,
+        1 << tile.get("z"),
+        tile.get("x"),
+        tile.get("y"),
+    )
+
+    features = list(itertools.compress(features, kept.tolist()))
+    for i, feature in enumerate(features):
+        feature["geometry"] = FeatureRings(tile_rings, i)
+    tile["features"] = features
+    tile["transformed"] = True
+    return tile
@@ -0,0 +1,446 @@
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import struct
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+from .tilemodel import TileModel
+from .vt2pbf.service.wire import varint
+
+# suffix of a tiles template naming a PMTiles archive instead of a directory
+PMTILES_SUFFIX = ".pmtiles"
+HEADER_SIZE = 127
+# the header and root directory are read at once by clients, so the root
+# directory must fit in the first 16 KiB
+ROOT_SIZE = 16384
+# entries of the leaf directories, doubled until the root directory fits
+LEAF_SIZE = 4096
+# leaf directories kept deserialized by a reader
+LEAF_CACHE_SIZE = 64
+COMPRESSION_NONE = 1
+COMPRESSION_GZIP = 2
+# the tile type of the header of each tile format, unknown for the others
+TILE_TYPES = {"pbf": 1}
+# magic, version, 11 offsets, lengths and counts, clustered, internal and
+# tile compression, tile type, min and max zoom, bounds, center zoom and
+# center
+HEADER = struct.Struct("<7sB11Q6B4iB2i")
+HEADER_FIELDS = (
+    "root_dir_offset",
+    "root_dir_length",
+    "metadata_offset",
+    "metadata_length",
+    "leaf_dirs_offset",
+    "leaf_dirs_length",
+    "tile_data_offset",
+    "tile_data_length",
+    "addressed_tiles_count",
+    "tile_entries_count",
+    "tile_contents_count",
+    "clustered",
+    "internal_compression",
+    "tile_compression",
+    "tile_type",
+    "min_zoom",
+    "max_zoom",
+    "min_lon_e7",
+    "min_lat_e7",
+    "max_lon_e7",
+    "max_lat_e7",
+    "center_zoom",
+    "center_lon_e7",
+    "center_lat_e7",
+)
+
+# the bounds of the header of an archive whose tiles are not geographic,
+# the whole world of Web Mercator
+WORLD_BOUNDS = (-180.0, -85.0511287, 180.0, 85.0511287)
+
+# a directory entry: the first tile id, the offset and length of the tile
+# data, and the number of consecutive tile ids sharing it, 0 for an entry
+# pointing to a leaf directory
+Entry = Tuple[int, int, int, int]
+
+
+def is_pmtiles(path) -> bool:
+    """Returns whether a tiles template names a PMTiles archive."""
+    return str(path).endswith(PMTILES_SUFFIX)
+
+
+def is_lonlat(bounds) -> bool:
+    """Returns whether [minx, miny, maxx, maxy] bounds are in lon/lat."""
+    minx, miny, maxx, maxy = bounds
+    return -180 <= minx <= maxx <= 180 and -90 <= miny <= maxy <= 90
+
+
+def zxy_to_tileid(z: int, x: int, y: int) -> int:
+    """
+    Returns the PMTiles id of tile z/x/y: the number of tiles of the lower
+    zooms plus the position of the tile along the Hilbert curve of its zoom.
+    """
+    tile_id = ((1 << (2 * z)) - 1) // 3
+    for a in range(z - 1, -1, -1):
+        s = 1 << a
+        rx = 1 if x & s else 0
+        ry = 1 if y & s else 0
+        tile_id += ((3 * rx) ^ ry) << (2 * a)
+        # rotate the quadrant
+        if ry == 0:
+            if rx == 1:
+                x = s - 1 - (x & (s - 1))
+                y = s - 1 - (y & (s - 1))
+            x, y = y, x
+    return tile_id
+
+
+def read_varint(buffer, position: int) -> Tuple[int, int]:
+    """Returns the varint at position of buffer, and the position after it."""
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def serialize_directory(entries: List[Entry], compression: int) -> bytes:
+    """
+    Serializes directory entries as the columns of their tile id deltas,
+    run lengths, lengths and offsets, the offset of an entry whose data
+    follows the data of the previous one written as 0.
+    """
+    parts = [varint(len(entries))]
+    last_id = 0
+    for tile_id, _, _, _ in entries:
+        parts.append(varint(tile_id - last_id))
+        last_id = tile_id
+    parts += [varint(entry[3]) for entry in entries]
+    parts += [varint(entry[2]) for entry in entries]
+    end = None
+    for _, offset, length, _ in entries:
+        parts.append(varint(0 if offset == end else offset + 1))
+        end = offset + length
+    return compress(b"".join(parts), compression)
+
+
+def deserialize_directory(data: bytes) -> Tuple[list, list, list, list]:
+    """
+    Returns the tile ids, offsets, lengths and run lengths of the entries
+    of a decompressed directory.
+    """
+    count, position = read_varint(data, 0)
+    columns = []
+    for _ in range(4):
+        column = []
+        for _ in range(count):
+            value, position = read_varint(data, position)
+            column.append(value)
+        columns.append(column)
+    deltas, run_lengths, lengths, offsets = columns
+    tile_id = 0
+    tile_ids = []
+    for delta in deltas:
+        tile_id += delta
+        tile_ids.append(tile_id)
+    for i, offset in enumerate(offsets):
+        offsets[i] = offsets[i - 1] + lengths[i - 1] if offset == 0 else offset - 1
+    return tile_ids, offsets, lengths, run_lengths
+
+
+def compress(data: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_GZIP:
+        return gzip.compress(data, mtime=0)
+    return data
+
+
+def decompress(data: bytes, compression: int) -> bytes:
+    if compression == COMPRESSION_GZIP:
+        return gzip.decompress(data)
+    if compression == COMPRESSION_NONE:
+        return data
+    raise ValueError(f"Unsupported PMTiles compression: {compression}")
+
+
+def build_directories(entries: List[Entry], compression: int) -> Tuple[bytes, bytes]:
+    """
+    Returns the root directory of the entries, and their leaf directories
+    when the root directory would not fit in ROOT_SIZE.
+    """
+    root = serialize_directory(entries, compression)
+    leaves: List[bytes] = []
+    leaf_size = LEAF_SIZE
+    while HEADER_SIZE + len(root) > ROOT_SIZE:
+        root_entries = []
+        leaves = []
+        offset = 0
+        for i in range(0, len(entries), leaf_size):
+            leaf = serialize_directory(entries[i : i + leaf_size], compression)
+            root_entries.append((entries[i][0], offset, len(leaf), 0))
+            leaves.append(leaf)
+            offset += len(leaf)
+        root = serialize_directory(root_entries, compression)
+        leaf_size *= 2
+    return root, b"".join(leaves)
+
+
+class PMTiles:
+    """
+    A tileset stored in a PMTiles v3 archive, a single file of tiles that
+    can be served from object storage or static disk.
+
+    Tiles are written in the order of their PMTiles tile id, along a Hilbert
+    curve, so that nearby tiles are close in the archive. Identical tiles
+    are stored once, and consecutive tile ids holding the same tile share
+    one run-length encoded directory entry. Tiles are added in any order to
+    a temporary file next to the archive, which is written on close.
+
+    A reader maps the archive in memory and looks up each tile by bisecting
+    the root directory, and a leaf directory for large archives, reading
+    only the directories and tiles it needs.
+
+    Attributes:
+        path (str): The path of the archive
+        header (dict): The fields of the header of the archive, when read
+        tiles (int): The number of tiles added
+        blobs (int): The number of distinct tiles added
+    """
+
+    def __init__(self, path: str, mode: str = "r", compression: int = COMPRESSION_GZIP):
+        """
+        Open a PMTiles archive
+
+        Args:
+            path (str): The path of the archive
+            mode (str): "r" to read the tiles, "w" to write a new archive
+            compression (int): The compression of the directories and the
+            metadata written, COMPRESSION_GZIP or COMPRESSION_NONE
+        """
+        if mode not in ("r", "w"):
+            raise ValueError(f"Invalid mode: {mode}, expected 'r' or 'w'")
+        if compression not in (COMPRESSION_NONE, COMPRESSION_GZIP):
+            raise ValueError(f"Unsupported PMTiles compression: {compression}")
+        self.path = str(path)
+        self.mode = mode
+        self.compression = compression
+        self.tiles = 0
+        self.blobs = 0
+        if mode == "r":
+            self._file = open(self.path, "rb")
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, *values = HEADER.unpack_from(self._mmap, 0)
+            if magic != b"PMTiles" or version != 3:
+                self.close()
+                raise ValueError(f"{self.path} is not a PMTiles v3 archive")
+            self.header = dict(zip(HEADER_FIELDS, values))
+            self._root = self._directory(
+                self.header["root_dir_offset"], self.header["root_dir_length"]
+            )
+            self._leaves: dict = {}
+        else:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._data = open(self.path + ".tmp", "wb")
+            self._data_length = 0
+            # the offset and length in the temporary file of each distinct
+            # tile, by hash, and the tile of each tile id
+            self._blobs: dict = {}
+            self._tiles: dict = {}
+            self._metadata = {}
+            self._tile_type = 0
+            self._zooms = [0, 0]
+            # the whole world, unless the TileJSON bounds are geographic
+            self._bounds = list(WORLD_BOUNDS)
+            self._center = [0.0, 0.0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *args):
+        self.close(abort=exc_type is not None)
+
+    def write_metadata(self, tile_json: TileModel, tile_format: str):
+        """
+        Store the TileJSON of the tileset as the metadata of the archive,
+        with the format of the tiles, and its zoom range and center zoom in
+        the header.
+
+        Args:
+            tile_json (TileModel): The TileJSON of the tileset
+            tile_format (str): The format of the tiles, "pbf", "json" or
+            "parquet"
+        """
+        self._metadata = {
+            **json.loads(tile_json.model_dump_json(exclude_none=True)),
+            "format": tile_format,
+        }
+        self._tile_type = TILE_TYPES.get(tile_format, 0)
+        self._zooms = [tile_json.minzoom or 0, tile_json.maxzoom or 0]
+        bounds = tile_json.bounds
+        if bounds is not None and is_lonlat(bounds[:4]):
+            self._bounds = list(bounds[:4])
+            center = tile_json.center
+            if center is not None and is_lonlat([*center[:2], *center[:2]]):
+                self._center = list(center[:2])
+            else:
+                self._center = [
+                    (bounds[0] + bounds[2]) / 2,
+                    (bounds[1] + bounds[3]) / 2,
+                ]
+
+    def metadata(self) -> dict:
+        """Returns the metadata of the archive."""
+        data = self._mmap[
+            self.header["metadata_offset"] : self.header["metadata_offset"]
+            + self.header["metadata_length"]
+        ]
+        return json.loads(decompress(data, self.header["internal_compression"]))
+
+    def add_tile(self, z: int, x: int, y: int, data: bytes):
+        """
+        Add a tile, replacing any tile of the same coordinates.
+
+        Args:
+            z (int): The zoom level of the tile
+            x (int): The x coordinate of the tile
+            y (int): The y coordinate of the tile
+            data (bytes): The encoded tile
+        """
+        digest = hashlib.md5(data).digest()
+        blob = self._blobs.get(digest)
+        if blob is None:
+            blob = self._blobs[digest] = (self._data_length, len(data))
+            self._data.write(data)
+            self._data_length += len(data)
+        self._tiles[zxy_to_tileid(z, x, y)] = blob
+        self.tiles += 1
+        self.blobs = len(self._blobs)
+
+    def _directory(self, offset: int, length: int):
+        data = self._mmap[offset : offset + length]
+        return deserialize_directory(
+            decompress(data, self.header["internal_compression"])
+        )
+
+    def _leaf(self, offset: int, length: int):
+        leaf = self._leaves.get(offset)
+        if leaf is None:
+            if len(self._leaves) >= LEAF_CACHE_SIZE:
+                del self._leaves[next(iter(self._leaves))]
+            leaf = self._leaves[offset] = self._directory(
+                self.header["leaf_dirs_offset"] + offset, length
+            )
+        return leaf
+
+    def get_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """
+        Returns the encoded tile z/x/y, or None when the archive has no such
+        tile.
+        """
+        tile_id = zxy_to_tileid(z, x, y)
+        tile_ids, offsets, lengths, run_lengths = self._root
+        # the root and leaf directories are at most three levels deep
+        for _ in range(4):
+            i = bisect_right(tile_ids, tile_id) - 1
+            if i < 0:
+                return None
+            if run_lengths[i] == 0:
+                tile_ids, offsets, lengths, run_lengths = self._leaf(
+                    offsets[i], lengths[i]
+                )
+                continue
+            if tile_id >= tile_ids[i] + run_lengths[i]:
+                return None
+            start = self.header["tile_data_offset"] + offsets[i]
+            return decompress(
+                self._mmap[start : start + lengths[i]], self.header["tile_compression"]
+            )
+        return None
+
+    def _write_archive(self):
+        # the distinct tiles are written in the order of the tile ids first
+        # holding them, and consecutive ids holding the same tile share an
+        # entry
+        entries: List[list] = []
+        offsets: dict = {}
+        order = []
+        data_length = 0
+        for tile_id in sorted(self._tiles):
+            blob = self._tiles[tile_id]
+            offset = offsets.get(blob)
+            if offset is None:
+                offset = offsets[blob] = data_length
+                order.append(blob)
+                data_length += blob[1]
+            last = entries[-1] if entries else None
+            if last is not None and last[1] == offset and last[0] + last[3] == tile_id:
+                last[3] += 1
+            else:
+                entries.append([tile_id, offset, blob[1], 1])
+        entries = [tuple(entry) for entry in entries]
+
+        root, leaves = build_directories(entries, self.compression)
+        metadata = compress(
+            json.dumps(self._metadata).encode("utf-8"), self.compression
+        )
+        metadata_offset = HEADER_SIZE + len(root)
+        leaves_offset = metadata_offset + len(metadata)
+        tile_data_offset = leaves_offset + len(leaves)
+        header = HEADER.pack(
+            b"PMTiles",
+            3,
+            HEADER_SIZE,
+            len(root),
+            metadata_offset,
+            len(metadata),
+            leaves_offset,
+            len(leaves),
+            tile_data_offset,
+            data_length,
+            len(self._tiles),
+            len(entries),
+            len(order),
+            1,
+            self.compression,
+            COMPRESSION_NONE,
+            self._tile_type,
+            *self._zooms,
+            *(round(value * 1e7) for value in self._bounds),
+            self._zooms[0],
+            *(round(value * 1e7) for value in self._center),
+        )
+        self._data.close()
+        with open(self.path, "wb") as f, open(self.path + ".tmp", "rb") as data:
+            f.write(header + root + metadata + leaves)
+            if self._data_length > 0:
+                with mmap.mmap(data.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                    for offset, length in order:
+                        f.write(source[offset : offset + length])
+        os.remove(self.path + ".tmp")
+
+    def close(self, abort: bool = False):
+        """
+        Write the archive when writing, and close the file.
+
+        Args:
+            abort (bool): Flag to indicate that writing failed, to remove
+            the temporary file without writing the archive, leaving any
+            earlier archive as it was
+        """
+        if self.mode == "w":
+            if not self._data.closed:
+                if abort:
+                    self._data.close()
+                    os.remove(self.path + ".tmp")
+                else:
+                    self._write_archive()
+        else:
+            if not self._mmap.closed:
+                self._mmap.close()
+            self._file.close()
@@ -1,17 +1,37 @@
+import os
+from typing import Optional
 from .tilemodel import TileModel
+from .microjson2vt.instrumentation import Instrumentation
+
+# file next to metadata.json listing the tiles with content of a sparse
+# tileset, see TileOccupancy
+OCCUPANCY_FILE = "occupancy.json"
+# file next to metadata.json recording the tiles and input features of a
+# tileset, see TileManifest
+MANIFEST_FILE = "manifest.json"
 
 
 class TileHandler:
     """
     Class to handle the generation of tiles from MicroJSON data
     """
+
     tile_json: TileModel
     pbf: bool
     parquet: bool
+    sparse: bool
     id_counter: int
     id_set: set
+    instrumentation: Optional[Instrumentation]
+    tile_stats: Optional[dict]
 
-    def __init__(self, tileobj: TileModel, pbf: bool = False, parquet: bool = False):
+    def __init__(
+        self,
+        tileobj: TileModel,
+        pbf: bool = False,
+        parquet: bool = False,
+        sparse: bool = False,
+    ):
         """
         Initialize the TileHandler with a TileJSON configuration and optional
         PBF flag
@@ -19,11 +39,45 @@ class TileHandler:
         Args:
         tileobj (TileModel): TileJSON configuration
         pbf (bool): Flag to indicate whether to encode the tiles in PBF
+        sparse (bool): Flag to indicate whether to skip empty tiles
 
         """
         # read the tilejson file to string
         self.tile_json = tileobj
         self.pbf = pbf
         self.parquet = parquet
+        self.sparse = sparse
         self.id_counter = 0
         self.id_set = set()
+        # stage timings of the last run, when instrumented
+        self.instrumentation = None
+        # the number of tiles of the last run, and how many were distinct
+        self.tile_stats = None
+
+    def tiles_root(self) -> str:
+        """
+        Get the directory holding the tileset, the part of the tile path
+        template before the zoom level
+
+        Returns:
+            str: The tileset directory
+        """
+        return os.path.dirname(str(self.tile_json.tiles[0]).split("{z}")[0])
+
+    def occupancy_path(self) -> str:
+        """
+        Get the path of the occupancy file of the tileset
+
+        Returns:
+            str: The path to the occupancy file
+        """
+        return os.path.join(self.tiles_root(), OCCUPANCY_FILE)
+
+    def manifest_path(self) -> str:
+        """
+        Get the path of the manifest file of the tileset
+
+        Returns:
+            str: The path to the manifest file
+        """
+        return os.path.join(self.tiles_root(), MANIFEST_FILE)
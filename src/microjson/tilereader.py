@@ -1,5 +1,8 @@
 from typing import Any
 from .tilehandler import TileHandler
+from .microjson2vt.occupancy import TileOccupancy
+from .mbtiles import MBTiles, is_mbtiles
+from .pmtiles import PMTiles, is_pmtiles
 import mapbox_vector_tile  # type: ignore
 import json
 import os
@@ -12,7 +15,9 @@ class TileReader(TileHandler):
 
     def tiles2microjson(self, zlvl: int = 0) -> dict[str, Any]:
         """
-        Generate MicroJSON data from tiles in form of JSON or PBF files.
+        Generate MicroJSON data from tiles in form of JSON or PBF files, or
+        of an MBTiles file or PMTiles archive when the tiles template ends in
+        .mbtiles or .pmtiles.
         Get the TileJSON configuration and the PBF flag from the class
         attributes.
         Check that zlvl is within the maxzoom and minzoom of the tilejson
@@ -69,86 +74,126 @@ class TileReader(TileHandler):
         # initialize the microjson data
         microjson_data = {"type": "FeatureCollection", "features": []}
 
-        # read the tiles and extract the geometries
-        for x in range(ntiles):
-            for y in range(ntiles):
-                xstart = xstarts[x]
-                xstop = xstops[x]
-                ystart = ystarts[y]
-                ystop = ystops[y]
-                # format path template with tile coordinates
-                tile_file = tilepath.format(z=zlvl, x=x, y=y)
-
-                if not os.path.exists(str(tile_file)):
-                    continue
-
-                with open(
-                    str(tile_file), "rb" if str(tile_file).endswith(".pbf") else "r"
-                ) as f:
-                    tile_data = f.read()
-
-                # decode the tile data
-                if self.pbf:
-                    tile_data = mapbox_vector_tile.decode(
-                        tile_data,
-                        default_options={"geojson": True, "y_coord_down": True},
-                    )
-                else:
-                    tile_data = json.loads(tile_data)
-
-                # dump to file
-                # filename = f"tilevt11_{x}_{y}_{zlvl}.json"
-
-                # with open(filename, "w") as f:
-                #    json.dump(tile_data, f)
-
-                tile_data = tile_data["geojsonLayer"]
-
-                # extract the geometries
-                if "features" in tile_data.keys():
-                    for feature in tile_data["features"]:
-                        # Transform the coordinates to the global coordinate
-                        # system please note that the coordinates may be in
-                        # up to 5 nested lists transform the coordinates in
-                        # place
-                        if "geometry" in feature:
-                            geom = feature["geometry"]
-                            coord = geom["coordinates"]
-                            if "type" in geom:
-                                if geom["type"] == "Point":
-                                    geom["coordinates"] = project(
-                                        coord, xstart, ystart, xstop, ystop
-                                    )
-                                elif geom["type"] == "LineString":
-                                    geom["coordinates"] = [
-                                        project(coord, xstart, ystart, xstop, ystop)
-                                        for coord in geom["coordinates"]
-                                    ]
-                                elif geom["type"] == "Polygon":
-                                    geom["coordinates"] = [
-                                        [
+        # a sparse tileset lists its tiles, no need to look for each of them
+        occupancy = None
+        store = None
+        if is_mbtiles(tilepath) or is_pmtiles(tilepath):
+            # as does an MBTiles file, and the tiles of a PMTiles archive are
+            # looked up in its directories
+            if not os.path.exists(tilepath):
+                return microjson_data
+            store = MBTiles(tilepath) if is_mbtiles(tilepath) else PMTiles(tilepath)
+        elif os.path.exists(self.occupancy_path()):
+            occupancy = TileOccupancy.load(self.occupancy_path())
+
+        # the store is closed even when a tile fails to decode
+        try:
+            if isinstance(store, MBTiles):
+                occupancy = set((zlvl, x, y) for x, y in store.tile_coords(zlvl))
+
+            # read the tiles and extract the geometries
+            for x in range(ntiles):
+                for y in range(ntiles):
+                    xstart = xstarts[x]
+                    xstop = xstops[x]
+                    ystart = ystarts[y]
+                    ystop = ystops[y]
+                    # format path template with tile coordinates
+                    tile_file = tilepath.format(z=zlvl, x=x, y=y)
+
+                    if occupancy is not None:
+                        if (zlvl, x, y) not in occupancy:
+                            continue
+                    elif not os.path.exists(str(tile_file)):
+                        continue
+
+                    if store is not None:
+                        tile_data = store.get_tile(zlvl, x, y)
+                        if tile_data is None:
+                            continue
+                    else:
+                        with open(
+                            str(tile_file),
+                            "rb" if str(tile_file).endswith(".pbf") else "r",
+                        ) as f:
+                            tile_data = f.read()
+
+                    # decode the tile data
+                    if self.pbf:
+                        tile_data = mapbox_vector_tile.decode(
+                            tile_data,
+                            default_options={"geojson": True, "y_coord_down": True},
+                        )
+                    else:
+                        tile_data = json.loads(tile_data)
+
+                    # dump to file
+                    # filename = f"tilevt11_{x}_{y}_{zlvl}.json"
+
+                    # with open(filename, "w") as f:
+                    #    json.dump(tile_data, f)
+
+                    # a tile of a tileset with several vector layers holds one
+                    # layer of each name
+                    if self.pbf:
+                        layers = list(tile_data.values())
+                    else:
+                        layers = [tile_data["geojsonLayer"]]
+
+                    # extract the geometries
+                    for layer in layers:
+                        for feature in layer.get("features", []):
+                            # Transform the coordinates to the global coordinate
+                            # system please note that the coordinates may be in
+                            # up to 5 nested lists transform the coordinates in
+                            # place
+                            if "geometry" in feature:
+                                geom = feature["geometry"]
+                                coord = geom["coordinates"]
+                                if "type" in geom:
+                                    if geom["type"] == "Point":
+                                        geom["coordinates"] = project(
+                                            coord, xstart, ystart, xstop, ystop
+                                        )
+                                    elif geom["type"] == "LineString":
+                                        geom["coordinates"] = [
                                             project(coord, xstart, ystart, xstop, ystop)
-                                            for coord in ring
+                                            for coord in geom["coordinates"]
                                         ]
-                                        for ring in geom["coordinates"]
-                                    ]
-                                elif geom["type"] == "MultiPolygon":
-                                    geom["coordinates"] = [
-                                        [
+                                    elif geom["type"] == "Polygon":
+                                        geom["coordinates"] = [
                                             [
                                                 project(
                                                     coord, xstart, ystart, xstop, ystop
                                                 )
                                                 for coord in ring
                                             ]
-                                            for ring in poly
+                                            for ring in geom["coordinates"]
                                         ]
-                                        for poly in geom["coordinates"]
-                                    ]
-                                else:
-                                    continue
-
-                            # add the feature to the microjson data
-                            microjson_data["features"].append(feature)  # type: ignore
-
+                                    elif geom["type"] == "MultiPolygon":
+                                        geom["coordinates"] = [
+                                            [
+                                                [
+                                                    project(
+                                                        coord,
+                                                        xstart,
+                                                        ystart,
+                                                        xstop,
+                                                        ystop,
+                                                    )
+                                                    for coord in ring
+                                                ]
+                                                for ring in poly
+                                            ]
+                                            for poly in geom["coordinates"]
+                                        ]
+                                    else:
+                                        continue
+
+                                # add the feature to the microjson data
+                                features = microjson_data["features"]
+                                features.append(feature)  # type: ignore
+        finally:
+            if store is not None:
+                store.close()
         return microjson_data
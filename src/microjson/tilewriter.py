@@ -1,11 +1,21 @@
+import io
+import itertools
 import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from .microjson2vt.convert import get_projector
 from .microjson2vt.microjson2vt import microjson2vt
+from .microjson2vt.instrumentation import Instrumentation
+from .microjson2vt.occupancy import TileOccupancy
+from .manifest import TileManifest, digest, feature_keys, geometry_bounds
+from .mbtiles import MBTiles, is_mbtiles
+from .pmtiles import PMTiles, is_pmtiles
 from .tilehandler import TileHandler
 from .model import MicroJSON
 import json
 from pydantic import ValidationError
 
-from typing import List, Union
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
 from pathlib import Path
 import logging
 from shapely.geometry import Polygon
@@ -123,13 +133,229 @@ def extract_fields_ranges_enums(microjson_file: str):
     return field_names, field_ranges, field_enums
 
 
-class TileWriter(TileHandler):
+# formats of the tiles written by encode_tiles
+TILE_FORMATS = ("pbf", "json", "parquet")
+# tiles encoded by a worker process per task, so that pickling the tasks and
+# their results is amortised over several tiles
+ENCODE_CHUNK_SIZE = 16
+# threads writing the tile files of TileWriter when there are several workers
+WRITE_THREADS = 4
+# how TileWriter stores a tile file identical to an earlier one
+LINK_DUPLICATES = ("hard", "symbolic", None)
+
+
+def tile_payload(tile: dict, tile_format: str) -> dict:
+    """
+    Returns the parts of a tile of microjson2vt read by encode_tile, so that
+    only these are pickled for a worker process.
+
+    Args:
+        tile (dict): The tile
+        tile_format (str): The format it is encoded in
+
+    Returns:
+        dict: The payload of the tile
+    """
+    if tile_format == "json":
+        # the whole tile is written
+        return tile
+    if tile_format == "pbf" and "layers" in tile:
+        return {"z": tile["z"], "layers": tile["layers"]}
+    payload = {"z": tile["z"], "features": tile["features"]}
+    if "layers" in tile:
+        payload["layers"] = tile["layers"]
+    return payload
+
+
+def encode_tile(tile: dict, tile_format: str) -> bytes:
+    """
+    Encodes a tile of microjson2vt, or its payload, as the content of a tile
+    file.
+
+    Args:
+        tile (dict): The tile
+        tile_format (str): "pbf" for a Mapbox Vector Tile, "json" or
+        "parquet"
+
+    Returns:
+        bytes: The encoded tile
+    """
+    if tile_format == "pbf":
+        # Using vt2pbf to encode tile data to PBF, writing the
+        # same bytes as protobuf without building its messages
+        return vt2pbf(tile, encoder="wire")
+    if tile_format == "parquet":
+        import geopandas as gpd
+
+        layers = tile.get("layers")
+        encoded_data = gpd.GeoDataFrame({"features": tile["features"]})
+
+        # drop metadata columns
+        encoded_data["new_geometry"] = encoded_data["features"].apply(
+            lambda x: x["geometry"]
+        )
+        columns = ["new_geometry"]
+        if layers is not None:
+            encoded_data["layer"] = [
+                name for name, features in layers.items() for _ in features
+            ]
+            columns.append("layer")
+        buffer = io.BytesIO()
+        encoded_data[columns].to_parquet(buffer)
+        return buffer.getvalue()
+    if tile_format == "json":
+        if "layers" in tile:
+            # the features are written once, in their layers
+            tile = {key: value for key, value in tile.items() if key != "features"}
+        return json.dumps(tile).encode()
+    raise ValueError(
+        f"Invalid tile format: {tile_format}, expected one of {TILE_FORMATS}"
+    )
+
+
+def _encode_chunk(tiles, tile_format, instrumentation):
+    encoded = []
+    for tile in tiles:
+        if instrumentation is not None:
+            start = instrumentation.start()
+        encoded.append(encode_tile(tile, tile_format))
+        if instrumentation is not None:
+            instrumentation.stop(start, "encode", tile["z"])
+    return encoded, None if instrumentation is None else instrumentation.stages
+
+
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    """Yields lists of size items of an iterable, the last one shorter."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def iter_encoded_tiles(
+    tiles: Iterable[dict],
+    tile_format: str = "pbf",
+    workers: int = 1,
+    instrumentation: Optional[Instrumentation] = None,
+    executor: Optional[Executor] = None,
+) -> Iterator[Tuple[dict, bytes]]:
+    """
+    Encodes a stream of tiles of microjson2vt as the contents of tile files,
+    in worker processes when there are several workers, and yields each
+    tile with its encoded contents in the order of the tiles.
+
+    The tiles are read as the workers need them: chunks of
+    ENCODE_CHUNK_SIZE tiles, holding only the payload read by encode_tile,
+    are sent to the workers, with at most two chunks per worker in flight,
+    so only these tiles are held in memory.
+
+    Args:
+        tiles (Iterable[dict]): The tiles
+        tile_format (str): "pbf", "json" or "parquet", see encode_tile
+        workers (int): Number of processes encoding the tiles, 1 to encode
+        them in this process
+        instrumentation (Optional[Instrumentation]): Records the time spent
+        encoding each tile, as the "encode" stage
+        executor (Optional[Executor]): Pool of the workers, to share between
+        calls, else one is started for the call when workers is over 1
+
+    Yields:
+        Tuple[dict, bytes]: Each tile and its encoded contents
+    """
+    if tile_format not in TILE_FORMATS:
+        raise ValueError(
+            f"Invalid tile format: {tile_format}, expected one of {TILE_FORMATS}"
+        )
+    if executor is None and workers <= 1:
+        for tile in tiles:
+            encoded, _ = _encode_chunk(
+                [tile_payload(tile, tile_format)], tile_format, instrumentation
+            )
+            yield tile, encoded[0]
+        return
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    pending: deque = deque()
+
+    def finish_chunk():
+        chunk, future = pending.popleft()
+        encoded, stages = future.result()
+        if instrumentation is not None:
+            instrumentation.merge(stages)
+        return zip(chunk, encoded)
+
+    try:
+        for chunk in batched(tiles, ENCODE_CHUNK_SIZE):
+            payloads = [tile_payload(tile, tile_format) for tile in chunk]
+            future = executor.submit(
+                _encode_chunk, payloads, tile_format, instrumentation
+            )
+            pending.append((chunk, future))
+            if len(pending) >= 2 * max(workers, 1):
+                yield from finish_chunk()
+        while pending:
+            yield from finish_chunk()
+    finally:
+        for _, future in pending:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+
+
+def encode_tiles(
+    tiles: List[dict],
+    tile_format: str = "pbf",
+    workers: int = 1,
+    instrumentation: Optional[Instrumentation] = None,
+    executor: Optional[Executor] = None,
+) -> List[bytes]:
+    """
+    Encodes tiles of microjson2vt as the contents of tile files, in worker
+    processes when there are several workers, see iter_encoded_tiles.
+
+    Args:
+        tiles (List[dict]): The tiles
+        tile_format (str): "pbf", "json" or "parquet", see encode_tile
+        workers (int): Number of processes encoding the tiles, 1 to encode
+        them in this process
+        instrumentation (Optional[Instrumentation]): Records the time spent
+        encoding each tile, as the "encode" stage
+        executor (Optional[Executor]): Pool of the workers, to share between
+        calls, else one is started for the call when workers is over 1
 
+    Returns:
+        List[bytes]: The encoded tiles, in the order of the tiles
+    """
+    return [
+        encoded
+        for _, encoded in iter_encoded_tiles(
+            tiles, tile_format, workers, instrumentation, executor
+        )
+    ]
+
+
+class TileWriter(TileHandler):
     def microjson2tiles(
         self,
         microjson_data_path: Union[str, Path],
         validate: bool = False,
         tolerance_key: str = "default",
+        max_features_per_tile: Optional[int] = None,
+        feature_priority: str = "area",
+        min_polygon_area: float = 0,
+        small_polygons: str = "drop",
+        dissolve_max_zoom: Optional[int] = None,
+        dissolve_by: Optional[str] = None,
+        dissolve_sum: Optional[List[str]] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        layer_property: Optional[str] = None,
+        workers: int = 1,
+        link_duplicates: Optional[str] = "hard",
+        incremental: bool = False,
     ) -> List[str]:
         """
         Generate tiles in form of JSON or PBF files from MicroJSON data.
@@ -139,12 +365,50 @@ class TileWriter(TileHandler):
             MicroJSON data file
             validate (bool): Flag to indicate whether to validate
             the MicroJSON data
+            max_features_per_tile (Optional[int]): Maximum number of
+            features in a tile, None for no limit
+            feature_priority (str): Ranking of the features kept in a
+            tile over the limit, "area" or "hash"
+            min_polygon_area (float): Smallest polygon part kept in a tile,
+            in square tile units, 0 to keep all
+            small_polygons (str): Whether smaller polygons are dropped,
+            "drop", or replaced by their centroid, "point"
+            dissolve_max_zoom (Optional[int]): Highest zoom at which the
+            polygons of a group are merged, None for none
+            dissolve_by (Optional[str]): Property grouping the merged
+            polygons, None to merge all polygons of a tile
+            dissolve_sum (Optional[List[str]]): Numeric properties summed
+            over the merged polygons
+            instrumentation (Optional[Instrumentation]): Records the time
+            spent in each stage, also kept as the instrumentation attribute
+            of the writer
+            layer_property (Optional[str]): Property naming the vector
+            layer of a feature when the tileset has several, None to use
+            its featureClass
+            workers (int): Number of processes encoding the tiles, see
+            iter_encoded_tiles; with more than one, the tile files are
+            also written by WRITE_THREADS threads while the next tiles are
+            cut and encoded
+            link_duplicates (Optional[str]): How a tile file identical to
+            an earlier one is stored, "hard" as a hard link to it,
+            "symbolic" as a symbolic link, or None as a copy. The tile_stats
+            attribute of the writer holds the share of duplicate tiles
+            incremental (bool): Flag to indicate whether to only cut again
+            the tiles reached by the features changed since the last run,
+            according to its manifest, see TileManifest, and to keep the
+            files of the unchanged tiles. Only for tiles written to a
+            directory
 
         Returns:
-            List[str]: List of paths to the generated tiles
+            List[str]: List of paths to the generated tiles, for an
+            MBTiles file or PMTiles archive the path of the file followed by
+            z/x/y. An incremental run only returns the tiles it wrote
         """
 
-        def save_tile(tile_data, z, x, y, tiles_path_template):
+        # the directories of the tiles already created
+        directories = set()
+
+        def save_tile(tile_data, z, x, y, tiles_path_template, original=None):
             """
             Save a single tile to a file based on the template path.
 
@@ -154,21 +418,39 @@ class TileWriter(TileHandler):
                 x: The x coordinate of the tile
                 y: The y coordinate of the tile
                 tiles_path_template: The template path for the tiles
+                original: The path of an identical tile already saved, to
+                link to instead of writing the tile data again
 
             Returns:
                 str: The path to the saved tile
             """
             # Format the path template with actual tile coordinates
             tile_path = str(tiles_path_template).format(z=z, x=x, y=y)
-            os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+            directory = os.path.dirname(tile_path)
+            if directory not in directories:
+                os.makedirs(directory, exist_ok=True)
+                directories.add(directory)
 
-            # Save the tile data (this assumes tile_data is already in the
-            # correct format, e.g., PBF or JSON)
-            if tile_path.endswith(".parquet"):
-                tile_data.to_parquet(tile_path)
-            else:
-                with open(tile_path, "wb" if tile_path.endswith(".pbf") else "w") as f:
-                    f.write(tile_data)
+            # replace, rather than write through, a link of an earlier run
+            try:
+                os.unlink(tile_path)
+            except FileNotFoundError:
+                pass
+            if original is not None:
+                try:
+                    if link_duplicates == "hard":
+                        os.link(original, tile_path)
+                    else:
+                        target = os.path.relpath(original, directory or ".")
+                        os.symlink(target, tile_path)
+                    return tile_path
+                except OSError:
+                    # the file system does not support links
+                    pass
+
+            # Save the tile data, already encoded by encode_tiles
+            with open(tile_path, "wb") as f:
+                f.write(tile_data)
 
             # return the path to the saved tile
             return tile_path
@@ -211,80 +493,408 @@ class TileWriter(TileHandler):
             else:
                 return int(data)
 
+        if link_duplicates not in LINK_DUPLICATES:
+            raise ValueError(
+                f"Invalid link_duplicates: {link_duplicates}, "
+                f"expected one of {LINK_DUPLICATES}"
+            )
+        tiles_path_template = self.tile_json.tiles[0]
+        if incremental and (
+            is_mbtiles(tiles_path_template) or is_pmtiles(tiles_path_template)
+        ):
+            raise ValueError(
+                "Incremental tiling is only supported for tiles written to a "
+                "directory"
+            )
+        timer = self.instrumentation = instrumentation
+
         # Load the MicroJSON data
+        if timer is not None:
+            start = timer.start()
         with open(microjson_data_path, "r") as file:
             microjson_data = json.load(file)
+        if timer is not None:
+            timer.stop(start, "load", bytes_in=os.path.getsize(microjson_data_path))
 
         # Validate the MicroJSON data
         if validate:
+            if timer is not None:
+                start = timer.start()
             try:
                 MicroJSON.model_validate(microjson_data)
             except ValidationError as e:
                 logger.error(f"MicroJSON data validation failed: {e}")
                 return []
+            finally:
+                if timer is not None:
+                    timer.stop(start, "validate")
 
-        # TODO currently only supports one tile layer
-        # calculate maxzoom and minzoom from layer and global tilejson
-
+        # calculate maxzoom and minzoom from the layers and global tilejson
+        vector_layers = self.tile_json.vector_layers
         maxzoom = min(
-            self.tile_json.maxzoom, self.tile_json.vector_layers[0].maxzoom
+            self.tile_json.maxzoom, max(layer.maxzoom for layer in vector_layers)
         )  # type: ignore
         minzoom = max(
-            self.tile_json.minzoom, self.tile_json.vector_layers[0].minzoom
+            self.tile_json.minzoom, min(layer.minzoom for layer in vector_layers)
         )  # type: ignore
 
+        # with several layers, each feature goes to the layer named by its
+        # featureClass or layer_property, and all layers share one index
+        layer_by = None
+        layer_zooms = {}
+        if len(vector_layers) > 1:
+            layer_zooms = {
+                layer.id: [layer.minzoom, layer.maxzoom] for layer in vector_layers
+            }
+            layer_by = layer_property or "featureClass"
+            features = []
+            for feature in microjson_data.get("features", []):
+                properties = feature.get("properties") or {}
+                if layer_property is None:
+                    properties = {
+                        **properties,
+                        "featureClass": feature.get("featureClass"),
+                    }
+                if properties.get(layer_by) in layer_zooms:
+                    features.append({**feature, "properties": properties})
+            microjson_data = {**microjson_data, "features": features}
+
         # Options for geojson2vt from TileJSON
         options = {
             "maxZoom": maxzoom,  # max zoom in the final tileset
-            "indexMaxZoom": self.tile_json.maxzoom,  # tile index max zoom
+            # only index the root tile, the tiles are cut by iter_tiles
+            "indexMaxZoom": 0,
             "indexMaxPoints": 0,  # max number of points per tile, 0 if none
             "bounds": self.tile_json.bounds,
             "tolerance_function": tolerance_key,  # Pass the string key
+            "sparse": self.sparse,  # skip empty tiles
+            "maxFeaturesPerTile": max_features_per_tile,
+            "featurePriority": feature_priority,
+            "minPolygonArea": min_polygon_area,
+            "smallPolygons": small_polygons,
+            "dissolveMaxZoom": dissolve_max_zoom,
+            "dissolveBy": dissolve_by,
+            "dissolveSum": dissolve_sum or [],
+            "instrumentation": timer,
+            "layerBy": layer_by,
+            "layerZooms": layer_zooms,
+            # vt2pbf encodes the int32 arrays of a tile at once
+            "arrayGeometry": self.pbf,
         }
 
         # Convert GeoJSON to intermediate vector tiles
+        if timer is not None:
+            start = timer.start()
         tile_index = microjson2vt(microjson_data, options)
+        if timer is not None:
+            timer.stop(start, "index")
 
         # Placeholder for the tile paths
         generated_tiles = []
+        # the tiles with content of a sparse tileset
+        occupancy = TileOccupancy() if self.sparse else None
 
         # get tilepath from tilejson self.tile_json.tiles
         # extract the folder from the filepath
 
-        for tileno in tile_index.tiles:
-            atile = tile_index.tiles[tileno]
-            x, y, z = atile["x"], atile["y"], atile["z"]
-            # if z is less than minzoom, or greater than maxzoom, skip the tile
-            if z < minzoom or z > maxzoom:
-                continue
-            tile_data = tile_index.get_tile(z, x, y)
-
-            for item in tile_data["features"]:
-                if "id" in item:
-                    item["id"] = int(item["id"])
-
-            # add name to the tile_data
-            tile_data["name"] = "tile"
-
-            if self.pbf:
-                # Using vt2pbf to encode tile data to PBF
-                encoded_data = vt2pbf(tile_data)
-            elif self.parquet:
-                import geopandas as gpd
-
-                encoded_data = gpd.GeoDataFrame(tile_data)
-
-                # drop metadata columns
-                encoded_data["new_geometry"] = encoded_data["features"].apply(
-                    lambda x: x["geometry"]
-                )
-                encoded_data = encoded_data[["new_geometry"]]
-
+        tile_format = "pbf" if self.pbf else "parquet" if self.parquet else "json"
+        # a tiles template ending in .mbtiles or .pmtiles names one MBTiles
+        # file or PMTiles archive holding all tiles, instead of one file per
+        # tile
+        store = None
+        if is_mbtiles(tiles_path_template):
+            store = MBTiles(tiles_path_template, "w")
+        elif is_pmtiles(tiles_path_template):
+            store = PMTiles(tiles_path_template, "w")
+        if store is not None:
+            store.write_metadata(self.tile_json, tile_format)
+
+        def tile_file(key):
+            z, x, y = (int(part) for part in key.split("/"))
+            return str(tiles_path_template).format(z=z, x=x, y=y)
+
+        # the manifest of a tileset written to a directory records the hash
+        # of each tile and the box of each input feature, so that a later
+        # run only cuts the tiles that the changed features reach
+        manifest = previous = None
+        # the tiles to cut, None for all
+        affected = None
+        # the content hash of each tile of the tileset, by z/x/y
+        tile_hashes = {}
+        # the first unchanged tile of each content, to link new tiles to
+        existing = {}
+        if store is None and microjson_data.get("type") == "FeatureCollection":
+            features = microjson_data.get("features") or []
+            settings = TileManifest.settings_hash(
+                {
+                    "tilejson": self.tile_json.model_dump(mode="json"),
+                    "format": tile_format,
+                    "sparse": self.sparse,
+                    "link_duplicates": link_duplicates,
+                    "tolerance_key": tolerance_key,
+                    "max_features_per_tile": max_features_per_tile,
+                    "feature_priority": feature_priority,
+                    "min_polygon_area": min_polygon_area,
+                    "small_polygons": small_polygons,
+                    "dissolve_max_zoom": dissolve_max_zoom,
+                    "dissolve_by": dissolve_by,
+                    "dissolve_sum": dissolve_sum,
+                    "layer_property": layer_property,
+                }
+            )
+            if os.path.exists(self.manifest_path()):
+                previous = TileManifest.load(self.manifest_path())
+            if previous is not None and previous.settings != settings:
+                # the tiles were cut differently, the boxes are of no use
+                previous = TileManifest(settings, previous.tiles)
+                reusable = False
             else:
-                encoded_data = json.dumps(tile_data)
+                reusable = previous is not None
+
+            keys = feature_keys(features)
+            old_keys = [key for key, _ in previous.features] if reusable else []
+            old_set, new_set = set(old_keys), set(keys)
+            # features in another order would be in another order in the
+            # tiles as well
+            if [key for key in keys if key in old_set] != [
+                key for key in old_keys if key in new_set
+            ]:
+                reusable = False
+            if incremental and not reusable:
+                logger.info(
+                    "No manifest of the same tiling and feature order, "
+                    "cutting all tiles"
+                )
 
-            generated_tiles.append(
-                save_tile(encoded_data, z, x, y, self.tile_json.tiles[0])
+            projector = get_projector(options)
+            old_boxes = dict(previous.features) if reusable else {}
+            boxes = []
+            for key, feature in zip(keys, features):
+                if key in old_boxes:
+                    boxes.append(old_boxes[key])
+                    continue
+                box = geometry_bounds(feature.get("geometry"))
+                if box is not None:
+                    xs = projector.project_x(box[0]), projector.project_x(box[2])
+                    ys = projector.project_y(box[1]), projector.project_y(box[3])
+                    box = [min(xs), min(ys), max(xs), max(ys)]
+                boxes.append(box)
+            manifest = TileManifest(settings, tile_hashes, list(zip(keys, boxes)))
+
+            if incremental and reusable:
+                # the tiles reached by the added and the removed features
+                changed = [
+                    box for key, box in zip(keys, boxes) if key not in old_set and box
+                ] + [
+                    box for key, box in previous.features if key not in new_set and box
+                ]
+                affected = set()
+                if changed:
+                    affected.update(tile_index.covering_tiles(*zip(*changed)))
+                if not self.sparse:
+                    # empty tiles are cut below each tile with features
+                    affected.update(
+                        (z + 1, cx, cy)
+                        for z, x, y in list(affected)
+                        if z < maxzoom
+                        for cx in (2 * x, 2 * x + 1)
+                        for cy in (2 * y, 2 * y + 1)
+                    )
+                stale = set()
+                for key, tile_hash in previous.tiles.items():
+                    z, x, y = (int(part) for part in key.split("/"))
+                    if (z, x, y) in affected:
+                        stale.add(tile_hash)
+                        continue
+                    tile_hashes[key] = tile_hash
+                    existing.setdefault(tile_hash, (z, x, y))
+                    if occupancy is not None:
+                        occupancy.add(z, x, y)
+                if link_duplicates == "symbolic":
+                    # a link to a tile written again would change with it, so
+                    # the links of its content are replaced by copies first
+                    for key, tile_hash in previous.tiles.items():
+                        path = tile_file(key)
+                        if tile_hash in stale and os.path.islink(path):
+                            with open(path, "rb") as f:
+                                data = f.read()
+                            os.unlink(path)
+                            with open(path, "wb") as f:
+                                f.write(data)
+
+        def prepared_tiles():
+            # tiles are streamed depth-first, so only one branch of the
+            # pyramid is held in memory at a time, and their ids are
+            # normalised here, in the order of the tiles, whatever the
+            # number of workers
+            for tile_data in tile_index.iter_tiles(minzoom, maxzoom, affected):
+                if self.sparse and len(tile_data["features"]) == 0:
+                    # only holds features of layers outside their zoom range
+                    continue
+
+                for item in tile_data["features"]:
+                    if "id" in item:
+                        item["id"] = int(item["id"])
+
+                # add name to the tile_data
+                tile_data["name"] = "tile"
+                yield tile_data
+
+        # with several workers, the tiles are encoded by a pool of
+        # processes and the tile files written by a pool of threads, while
+        # the next tiles are cut
+        executor = None
+        writer = None
+        if workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers)
+            if store is None:
+                writer = ThreadPoolExecutor(max_workers=WRITE_THREADS)
+        writes: deque = deque()
+        # the writes in flight of the first tile of each content, which the
+        # links to it wait for
+        writing = {}
+
+        def timed_save(encoded_data, z, x, y, original, original_write):
+            start = timer.start() if timer is not None else None
+            if original_write is not None:
+                original_write.result()
+            save_tile(encoded_data, z, x, y, tiles_path_template, original)
+            return None if start is None else timer.elapsed(start)
+
+        def finish_write():
+            z, counts, future, first = writes.popleft()
+            if first is not None:
+                del writing[first]
+            measurement = future.result()
+            if timer is not None:
+                timer.record("write", z, {**measurement, **counts})
+
+        # the first tile of each content, by hash of the encoded tile
+        distinct = {}
+        distinct_bytes = 0
+        total_bytes = 0
+        cut = 0
+        unchanged = 0
+
+        failed = True
+        try:
+            encoded_tiles = iter_encoded_tiles(
+                prepared_tiles(), tile_format, workers, timer, executor
+            )
+            for tile_data, encoded_data in encoded_tiles:
+                x, y, z = tile_data["x"], tile_data["y"], tile_data["z"]
+                tile_hash = digest(encoded_data)
+                first = distinct.get(tile_hash) or existing.get(tile_hash)
+                if first is None:
+                    first = distinct[tile_hash] = (z, x, y)
+                duplicate = first != (z, x, y)
+                total_bytes += len(encoded_data)
+                if not duplicate:
+                    distinct_bytes += len(encoded_data)
+                counts = {"bytes_out": len(encoded_data), "duplicates": int(duplicate)}
+                cut += 1
+                if manifest is not None:
+                    key = f"{z}/{x}/{y}"
+                    tile_hashes[key] = tile_hash
+                    if affected is not None and previous.tiles.get(key) == tile_hash:
+                        # the file of the last run holds the same tile
+                        unchanged += 1
+                        if occupancy is not None:
+                            occupancy.add(z, x, y)
+                        continue
+                # an archive stores identical tiles once itself, tile files
+                # identical to an earlier one are linked to it
+                original = None
+                if duplicate and link_duplicates is not None:
+                    original = str(tiles_path_template).format(
+                        z=first[0], x=first[1], y=first[2]
+                    )
+
+                if writer is not None:
+                    # the paths are returned in the order of the tiles, not
+                    # of the writes
+                    generated_tiles.append(
+                        str(tiles_path_template).format(z=z, x=x, y=y)
+                    )
+                    future = writer.submit(
+                        timed_save,
+                        encoded_data,
+                        z,
+                        x,
+                        y,
+                        original,
+                        writing.get(first) if original is not None else None,
+                    )
+                    if not duplicate:
+                        writing[first] = future
+                    writes.append((z, counts, future, None if duplicate else first))
+                    if len(writes) > 4 * WRITE_THREADS:
+                        finish_write()
+                else:
+                    if timer is not None:
+                        start = timer.start()
+                    if store is not None:
+                        store.add_tile(z, x, y, encoded_data)
+                        generated_tiles.append(f"{tiles_path_template}/{z}/{x}/{y}")
+                    else:
+                        generated_tiles.append(
+                            save_tile(
+                                encoded_data, z, x, y, tiles_path_template, original
+                            )
+                        )
+                    if timer is not None:
+                        timer.stop(start, "write", z, **counts)
+                if occupancy is not None:
+                    occupancy.add(z, x, y)
+            while writes:
+                finish_write()
+            failed = False
+        finally:
+            if writer is not None:
+                writer.shutdown()
+            if executor is not None:
+                executor.shutdown()
+            if store is not None:
+                # a failed run leaves no tileset with only some of the tiles
+                store.close(abort=failed)
+
+        # remove the tiles of the last run that are gone
+        deleted = 0
+        if previous is not None:
+            for key in previous.tiles:
+                if key not in tile_hashes:
+                    try:
+                        os.unlink(tile_file(key))
+                        deleted += 1
+                    except FileNotFoundError:
+                        pass
+        if manifest is not None:
+            os.makedirs(self.tiles_root(), exist_ok=True)
+            manifest.save(self.manifest_path())
+
+        self.tile_stats = {
+            "tiles": cut,
+            "distinct_tiles": len(distinct),
+            "duplicate_ratio": 1 - len(distinct) / cut if cut else 0.0,
+            "bytes": total_bytes,
+            "distinct_bytes": distinct_bytes,
+            "unchanged": unchanged,
+            "deleted": deleted,
+        }
+        logger.info(
+            f"{cut} tiles, {len(distinct)} distinct, "
+            f"{self.tile_stats['duplicate_ratio']:.1%} duplicates"
+        )
+        if affected is not None:
+            logger.info(
+                f"{len(generated_tiles)} tiles written, {unchanged} unchanged, "
+                f"{deleted} deleted"
             )
 
+        # record which tiles exist, so that readers need not look for the
+        # missing ones, an MBTiles file or PMTiles archive lists its own tiles
+        if self.sparse and store is None:
+            os.makedirs(self.tiles_root(), exist_ok=True)
+            occupancy.save(self.occupancy_path())
+
         return generated_tiles
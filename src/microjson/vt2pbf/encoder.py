@@ -1,8 +1,38 @@
+from .config import EXTEND
 from .service.tile import Tile
+from .service.wire import encode_tile
 
+ENCODERS = ("protobuf", "wire")
 
-def vt2pbf(vector_tile: dict, layer_name: str = 'geojsonLayer', extend: int = None) -> bytes:
+
+def vt2pbf(
+    vector_tile: dict,
+    layer_name: str = "geojsonLayer",
+    extend: int = None,
+    encoder: str = "protobuf",
+) -> bytes:
+    """
+    Encodes a tile of microjson2vt as a Mapbox Vector Tile.
+
+    The 'protobuf' encoder builds the tile with the protobuf messages of
+    mapbox_vector_tile, the 'wire' encoder writes the same bytes directly,
+    which is faster.
+    """
+    # a tile with layers, see the layerBy option of microjson2vt, is encoded
+    # with one layer of each name holding features
+    layers = vector_tile.get("layers")
+    if layers is None:
+        layers = {layer_name: vector_tile["features"]}
+    else:
+        layers = {name: features for name, features in layers.items() if features}
+    if encoder == "wire":
+        return encode_tile(
+            {str(name): features for name, features in layers.items()}, extend or EXTEND
+        )
+    if encoder != "protobuf":
+        raise ValueError(f"Invalid encoder: {encoder}, expected one of {ENCODERS}")
     tile = Tile(extend=extend)
-    tile.add_layer(layer_name, features=vector_tile['features'])
+    for name, features in layers.items():
+        tile.add_layer(str(name), features=features)
     pbf_string = tile.serialize_to_bytestring()
     return pbf_string
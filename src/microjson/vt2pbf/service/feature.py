@@ -1,5 +1,8 @@
 from typing import List, Union
 
+import numpy as np
+
+from ...microjson2vt.transform import FeatureRings, TileRings
 from ...vt2pbf.exceptions import WrongFeatureTypeError
 
 
@@ -13,16 +16,87 @@ def zigzag(delta: Union[int, float]) -> int:
     return (delta << 1) ^ (delta >> 31)
 
 
+def encode_rings(rings: TileRings) -> tuple:
+    """
+    Encodes the geometry of all features of a TileRings at once: a MoveTo
+    command for each ring, then a LineTo command for lines and polygons,
+    and a ClosePath command for polygons, with the zigzag encoded deltas
+    from the previous vertex of the feature.
+
+    Returns:
+        tuple: The array of encoded integers, and the start of each feature
+        in it followed by the end of the last one
+    """
+    coords = rings.coords.astype(np.int64)
+    ring_offsets = rings.ring_offsets
+    ring_types = np.repeat(rings.types, np.diff(rings.feature_offsets))
+    point = ring_types == 1
+    line = ~point
+    polygon = ring_types == 3
+
+    # the closing vertex of polygon rings is not encoded
+    encode = np.ones(len(coords), dtype=bool)
+    encode[ring_offsets[1:][polygon] - 1] = False
+    xy = coords[encode]
+    counts = np.diff(ring_offsets) - polygon
+    vertex_offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    # the cursor starts at 0, 0 for each feature
+    deltas = np.diff(xy, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    firsts = vertex_offsets[rings.feature_offsets[:-1]]
+    deltas[firsts] = xy[firsts]
+    deltas = (deltas << 1) ^ (deltas >> 31)
+
+    sizes = 2 * counts + 1 + line + polygon
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+    encoded = np.empty(starts[-1], dtype=np.int64)
+    encoded[starts[:-1]] = np.where(point, (counts << 3) | 1, command(1, 1))
+    encoded[starts[:-1][line] + 3] = ((counts[line] - 1) << 3) | 2
+    encoded[starts[1:][polygon] - 1] = command(7, 1)
+
+    ring = np.repeat(np.arange(len(counts)), counts)
+    vertex = np.arange(len(xy)) - vertex_offsets[ring]
+    positions = starts[ring] + 1 + 2 * vertex + ((vertex > 0) & line[ring])
+    encoded[positions] = deltas[:, 0]
+    encoded[positions + 1] = deltas[:, 1]
+    return encoded, starts[rings.feature_offsets].tolist()
+
+
+def encode_geometry(
+    feature_type: int, raw_geometry: List[List[List[int]]]
+) -> List[int]:
+    x = 0
+    y = 0
+    result = []
+    for ring in raw_geometry:
+        count = len(ring) if feature_type == 1 else 1
+        result.append(command(1, count))
+
+        line_count = len(ring) - 1 if feature_type == 3 else len(ring)
+        for i in range(line_count):
+            if i == 1 and feature_type != 1:
+                result.append(command(2, line_count - 1))
+            dx = ring[i][0] - x
+            dy = ring[i][1] - y
+            result.append(zigzag(dx))
+            result.append(zigzag(dy))
+            x += dx
+            y += dy
+        if feature_type == 3:
+            result.append(command(7, 1))  # closepath
+    return result
+
+
 class Feature:
-    REQUIRED_FIELDS = {'geometry', 'type', 'tags'}
+    REQUIRED_FIELDS = {"geometry", "type", "tags"}
 
     def __init__(self, layer, feature_type: int, feature_id: int = None):
         """
-            Leading the mapbox proto spec, feature type must follow next schema:
-                 UNKNOWN = 0;
-                 POINT = 1;
-                 LINESTRING = 2;
-                 POLYGON = 3;
+        Leading the mapbox proto spec, feature type must follow next schema:
+             UNKNOWN = 0;
+             POINT = 1;
+             LINESTRING = 2;
+             POLYGON = 3;
         """
         self._layer = layer
         self._layer_pbf = layer.layer_pbf
@@ -68,31 +142,26 @@ class Feature:
             else:
                 instance.uint_value = value
         else:
-            raise WrongFeatureTypeError(f'{value} type is not support, must be one of [bool, str, int, float]')
+            raise WrongFeatureTypeError(
+                f"{value} type is not support, must be one of [bool, str, int, float]"
+            )
 
     def add_geometry(self, geometry: Union[List[List[int]], List[List[List[int]]]]):
+        if isinstance(geometry, FeatureRings):
+            # the geometry of all features of the tile is encoded at once
+            rings = geometry.rings
+            if rings.encoded is None:
+                rings.encoded = encode_rings(rings)
+            encoded, offsets = rings.encoded
+            self.feature.geometry.extend(
+                encoded[offsets[geometry.index] : offsets[geometry.index + 1]].tolist()
+            )
+            return
         geometry = [geometry] if self.feature_type == 1 else geometry
         encoded_geometry = self._encode_feature_geometry(geometry)
         self.feature.geometry.extend(encoded_geometry)
 
-    def _encode_feature_geometry(self, raw_geometry: List[List[List[int]]]) -> List[int]:
-        x = 0
-        y = 0
-        result = []
-        for ring in raw_geometry:
-            count = len(ring) if self.feature_type == 1 else 1
-            result.append(command(1, count))
-
-            line_count = len(ring) - 1 if self.feature_type == 3 else len(ring)
-            for i in range(line_count):
-                if i == 1 and self.feature_type != 1:
-                    result.append(command(2, line_count - 1))
-                dx = ring[i][0] - x
-                dy = ring[i][1] - y
-                result.append(zigzag(dx))
-                result.append(zigzag(dy))
-                x += dx
-                y += dy
-            if self.feature_type == 3:
-                result.append(command(7, 1))  # closepath
-        return result
+    def _encode_feature_geometry(
+        self, raw_geometry: List[List[List[int]]]
+    ) -> List[int]:
+        return encode_geometry(self.feature_type, raw_geometry)
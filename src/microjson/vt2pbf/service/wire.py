@@ -0,0 +1,390 @@
+import struct
+from typing import Dict, List, Union
+
+import numpy as np
+
+from ...microjson2vt.transform import FeatureRings
+from ...vt2pbf.config import VERSION
+from ...vt2pbf.exceptions import InvalidFeatureError, WrongFeatureTypeError
+from ...vt2pbf.service.feature import Feature, encode_geometry, encode_rings
+
+# field keys, the field number and wire type, of the vector tile messages
+TILE_LAYER = b"\x1a"
+LAYER_NAME = b"\x0a"
+LAYER_FEATURE = b"\x12"
+LAYER_KEY = b"\x1a"
+LAYER_VALUE = b"\x22"
+LAYER_EXTENT = b"\x28"
+LAYER_VERSION = b"\x78"
+FEATURE_ID = b"\x08"
+FEATURE_TAGS = b"\x12"
+FEATURE_TYPE = b"\x18"
+FEATURE_GEOMETRY = b"\x22"
+VALUE_STRING = b"\x0a"
+VALUE_DOUBLE = b"\x19"
+VALUE_UINT = b"\x28"
+VALUE_SINT = b"\x30"
+VALUE_BOOL = b"\x38"
+# the keys of the fields of a feature message, then of the feature itself
+FEATURE_KEYS = (
+    LAYER_FEATURE + FEATURE_ID + FEATURE_TAGS + FEATURE_TYPE + FEATURE_GEOMETRY
+)
+# the varints of the feature types
+TYPE_VALUES = bytes(range(0x80))
+
+# values at or above each bound take one more byte as a varint
+VARINT_BOUNDS = np.left_shift(1, 7 * np.arange(1, 10, dtype=np.uint64), dtype=np.uint64)
+# the varints of the lengths and indices of most fields, looked up
+SMALL_VARINTS = [bytes([i]) for i in range(0x80)] + [
+    bytes([(i & 0x7F) | 0x80, i >> 7]) for i in range(0x80, 0x4000)
+]
+# layers with fewer features are written feature by feature, as the fixed
+# cost of gathering them with numpy is higher
+GATHER_MIN_FEATURES = 128
+
+
+def varint(value: int) -> bytes:
+    if 0 <= value < len(SMALL_VARINTS):
+        return SMALL_VARINTS[value]
+    if value < 0:
+        raise ValueError(f"{value} can not be encoded as an unsigned varint")
+    result = bytearray()
+    while value > 0x7F:
+        result.append((value & 0x7F) | 0x80)
+        value >>= 7
+    result.append(value)
+    return bytes(result)
+
+
+def encode_varints(values) -> tuple:
+    """
+    Encodes non-negative integers as consecutive varints, all at once.
+
+    Returns:
+        tuple: The encoded bytes, and the offset of each value in them
+        followed by their length
+    """
+    values = np.asarray(values, dtype=np.uint64)
+    sizes = np.searchsorted(VARINT_BOUNDS, values, side="right") + 1
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    encoded = np.empty(offsets[-1], dtype=np.uint8)
+    for i in range(int(sizes.max(initial=0))):
+        has_byte = sizes > i
+        low_bits = (values[has_byte] >> np.uint64(7 * i)) & np.uint64(0x7F)
+        more = (sizes[has_byte] > i + 1).astype(np.uint64) << np.uint64(7)
+        encoded[offsets[:-1][has_byte] + i] = low_bits | more
+    return encoded.tobytes(), offsets
+
+
+def field(key: bytes, payload: bytes) -> bytes:
+    return key + varint(len(payload)) + payload
+
+
+def gather(buffer: np.ndarray, starts: np.ndarray, lengths: np.ndarray) -> bytes:
+    """
+    Returns the pieces of a buffer given by their starts and lengths, one
+    after the other.
+    """
+    ends = np.cumsum(lengths)
+    index = np.repeat(starts - (ends - lengths), lengths) + np.arange(
+        ends[-1] if len(ends) else 0
+    )
+    return buffer[index].tobytes()
+
+
+def encode_value(value: Union[bool, str, int, float]) -> bytes:
+    if isinstance(value, bool):
+        return VALUE_BOOL + (b"\x01" if value else b"\x00")
+    elif isinstance(value, str):
+        return field(VALUE_STRING, value.encode("utf-8"))
+    elif isinstance(value, float):
+        return VALUE_DOUBLE + struct.pack("<d", value)
+    elif isinstance(value, int):
+        if value < 0:
+            return VALUE_SINT + varint((value << 1) ^ (value >> 63))
+        return VALUE_UINT + varint(value)
+    raise WrongFeatureTypeError(
+        f"{value} type is not support, must be one of [bool, str, int, float]"
+    )
+
+
+def encode_layer(
+    name: str, features: List[dict], extent: int, rings_cache: dict
+) -> bytes:
+    """
+    Encodes a layer of features in the Vector Tile wire format, with its
+    fields in the order written by the protobuf encoder of Tile.
+    """
+    key_indices: Dict[str, int] = {}
+    value_indices: dict = {}
+    ids = []
+    has_ids = []
+    types = []
+    tags: List[int] = []
+    feature_tags = [0]
+    # the geometry of each feature, as a range of one of the buffers, or of
+    # the values of the geometry given as lists
+    buffers = []
+    geometry_buffers = []
+    geometry_starts = []
+    geometry_ends = []
+    values: List[int] = []
+    for feature_info in features:
+        if not Feature.REQUIRED_FIELDS.issubset(feature_info):
+            raise InvalidFeatureError(
+                f"Feature must provide all required fields: {Feature.REQUIRED_FIELDS}"
+            )
+        feature_id = feature_info.get("id")
+        has_ids.append(feature_id is not None)
+        ids.append(0 if feature_id is None else feature_id)
+        types.append(feature_info["type"])
+        for k, v in feature_info["tags"].items():
+            if v is None:
+                continue
+            tags.append(key_indices.setdefault(k, len(key_indices)))
+            tags.append(value_indices.setdefault(v, len(value_indices)))
+        feature_tags.append(len(tags))
+
+        geometry = feature_info["geometry"]
+        if isinstance(geometry, FeatureRings):
+            # the geometry of all features of the tile is encoded at once
+            rings = geometry.rings
+            cached = rings_cache.get(id(rings))
+            if cached is None:
+                encoded, starts = encode_rings(rings)
+                encoded, offsets = encode_varints(encoded)
+                cached = rings_cache[id(rings)] = (
+                    rings,
+                    encoded,
+                    offsets[starts].tolist(),
+                )
+            _, encoded, offsets = cached
+            if len(buffers) == 0 or buffers[-1] is not encoded:
+                buffers.append(encoded)
+            geometry_buffers.append(len(buffers) - 1)
+            geometry_starts.append(offsets[geometry.index])
+            geometry_ends.append(offsets[geometry.index + 1])
+        else:
+            geometry = [geometry] if feature_info["type"] == 1 else geometry
+            geometry_buffers.append(-1)
+            geometry_starts.append(len(values))
+            values.extend(encode_geometry(feature_info["type"], geometry))
+            geometry_ends.append(len(values))
+
+    if min(ids, default=0) < 0:
+        raise ValueError("Feature ids must not be negative")
+    parts = [field(LAYER_NAME, name.encode("utf-8"))]
+    if len(features) < GATHER_MIN_FEATURES:
+        parts.append(
+            join_features(
+                ids,
+                has_ids,
+                types,
+                tags,
+                feature_tags,
+                buffers,
+                geometry_buffers,
+                geometry_starts,
+                geometry_ends,
+                values,
+            )
+        )
+    else:
+        parts.append(
+            gather_features(
+                ids,
+                has_ids,
+                types,
+                tags,
+                feature_tags,
+                buffers,
+                geometry_buffers,
+                geometry_starts,
+                geometry_ends,
+                values,
+            )
+        )
+    for k in key_indices:
+        parts.append(field(LAYER_KEY, k.encode("utf-8")))
+    for v in value_indices:
+        parts.append(field(LAYER_VALUE, encode_value(v)))
+    parts += (LAYER_EXTENT, varint(extent), LAYER_VERSION, varint(VERSION))
+    return b"".join(parts)
+
+
+def join_features(
+    ids,
+    has_ids,
+    types,
+    tags,
+    feature_tags,
+    buffers,
+    geometry_buffers,
+    geometry_starts,
+    geometry_ends,
+    values,
+) -> bytes:
+    """
+    Returns the feature messages of a layer, written one after the other.
+    """
+    parts = []
+    for i, feature_type in enumerate(types):
+        message = []
+        if has_ids[i]:
+            message += (FEATURE_ID, varint(ids[i]))
+        if feature_tags[i + 1] > feature_tags[i]:
+            packed = b"".join(map(varint, tags[feature_tags[i] : feature_tags[i + 1]]))
+            message += (FEATURE_TAGS, varint(len(packed)), packed)
+        message += (FEATURE_TYPE, varint(feature_type))
+        start, end = geometry_starts[i], geometry_ends[i]
+        if geometry_buffers[i] == -1:
+            geometry = b"".join(map(varint, values[start:end]))
+        else:
+            geometry = buffers[geometry_buffers[i]][start:end]
+        if geometry:
+            message += (FEATURE_GEOMETRY, varint(len(geometry)), geometry)
+        message = b"".join(message)
+        parts += (LAYER_FEATURE, varint(len(message)), message)
+    return b"".join(parts)
+
+
+def gather_features(
+    ids,
+    has_ids,
+    types,
+    tags,
+    feature_tags,
+    buffers,
+    geometry_buffers,
+    geometry_starts,
+    geometry_ends,
+    values,
+) -> bytes:
+    """
+    Returns the feature messages of a layer. The ids, tags and geometry of
+    all features are encoded as varints at once, then the messages are
+    gathered from them with their field keys and lengths.
+    """
+    has_ids = np.array(has_ids, dtype=np.int64)
+    ids, id_offsets = encode_varints(ids)
+    id_lengths = np.diff(id_offsets) * has_ids
+    tags, tag_offsets = encode_varints(tags)
+    tag_offsets = tag_offsets[feature_tags]
+    tag_lengths = np.diff(tag_offsets)
+    has_tags = (tag_lengths > 0).astype(np.int64)
+
+    values, value_offsets = encode_varints(values)
+    geometry_buffers = np.array(geometry_buffers, dtype=np.int64)
+    geometry_starts = np.array(geometry_starts, dtype=np.int64)
+    geometry_ends = np.array(geometry_ends, dtype=np.int64)
+    lists = geometry_buffers == -1
+    geometry_starts[lists] = value_offsets[geometry_starts[lists]]
+    geometry_ends[lists] = value_offsets[geometry_ends[lists]]
+    buffers.append(values)
+    geometry_buffers[lists] = len(buffers) - 1
+    buffer_starts = np.cumsum([0] + [len(buffer) for buffer in buffers])
+    geometry_lengths = geometry_ends - geometry_starts
+    geometry_starts += buffer_starts[geometry_buffers]
+    has_geometry = (geometry_lengths > 0).astype(np.int64)
+
+    tag_sizes, tag_size_offsets = encode_varints(tag_lengths)
+    tag_size_lengths = np.diff(tag_size_offsets) * has_tags
+    geometry_sizes, geometry_size_offsets = encode_varints(geometry_lengths)
+    geometry_size_lengths = np.diff(geometry_size_offsets) * has_geometry
+    message_lengths = (
+        has_ids
+        + id_lengths
+        + has_tags
+        + tag_size_lengths
+        + tag_lengths
+        + 2
+        + has_geometry
+        + geometry_size_lengths
+        + geometry_lengths
+    )
+    message_sizes, message_size_offsets = encode_varints(message_lengths)
+
+    # the pieces of each feature, as starts and lengths in one buffer of
+    # the field keys, the type values and the encoded varints
+    sources = [
+        FEATURE_KEYS,
+        TYPE_VALUES,
+        message_sizes,
+        ids,
+        tag_sizes,
+        tags,
+        geometry_sizes,
+        *buffers,
+    ]
+    bases = np.cumsum([0] + [len(source) for source in sources]).tolist()
+    (
+        keys,
+        type_values,
+        message_sizes,
+        ids,
+        tag_sizes,
+        tags,
+        geometry_sizes,
+        geometries,
+    ) = bases[:8]
+    ones = np.ones(len(types), dtype=np.int64)
+    starts = np.column_stack(
+        [
+            keys + 0 * ones,
+            message_sizes + message_size_offsets[:-1],
+            keys + 1 * ones,
+            ids + id_offsets[:-1],
+            keys + 2 * ones,
+            tag_sizes + tag_size_offsets[:-1],
+            tags + tag_offsets[:-1],
+            keys + 3 * ones,
+            type_values + np.array(types, dtype=np.int64),
+            keys + 4 * ones,
+            geometry_sizes + geometry_size_offsets[:-1],
+            geometries + geometry_starts,
+        ]
+    )
+    lengths = np.column_stack(
+        [
+            ones,
+            np.diff(message_size_offsets),
+            has_ids,
+            id_lengths,
+            has_tags,
+            tag_size_lengths,
+            tag_lengths,
+            ones,
+            ones,
+            has_geometry,
+            geometry_size_lengths,
+            geometry_lengths,
+        ]
+    )
+    source = np.frombuffer(
+        b"".join(
+            source if isinstance(source, bytes) else bytes(source) for source in sources
+        ),
+        dtype=np.uint8,
+    )
+    return gather(source, starts.ravel(), lengths.ravel())
+
+
+def encode_tile(layers: Dict[str, List[dict]], extent: int) -> bytes:
+    """
+    Encodes the layers of a tile in the Vector Tile wire format directly,
+    without building protobuf messages. The tile is byte for byte the one
+    serialized by Tile.
+
+    Args:
+        layers (dict): The features of each layer, by name
+        extent (int): The extent of the layers
+
+    Returns:
+        bytes: The encoded tile
+    """
+    rings_cache: dict = {}
+    result = bytearray()
+    for name, features in layers.items():
+        result += field(TILE_LAYER, encode_layer(name, features, extent, rings_cache))
+    return bytes(result)
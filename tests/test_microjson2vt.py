@@ -0,0 +1,984 @@
+import json
+import math
+import random
+import tracemalloc
+import numpy as np
+import mapbox_vector_tile
+import pytest
+from microjson.microjson2vt.microjson2vt import microjson2vt, to_Id
+from microjson.microjson2vt.cache import ZoomCache
+from microjson.microjson2vt.clip import clip_line, clip_points, clip_rings
+from microjson.microjson2vt.feature import Slice
+from microjson.microjson2vt.instrumentation import Instrumentation
+from microjson.microjson2vt.occupancy import TileOccupancy
+from microjson.microjson2vt.simplify import get_sq_seg_dist, rank_vertices, simplify
+from microjson.microjson2vt.spatialindex import FeatureIndex
+from microjson.vt2pbf import vt2pbf
+
+
+def ring(rnd, cx, cy, r, k):
+    points = [
+        [
+            cx + r * math.cos(2 * math.pi * j / k) * rnd.uniform(0.6, 1),
+            cy + r * math.sin(2 * math.pi * j / k) * rnd.uniform(0.6, 1),
+        ]
+        for j in range(k)
+    ]
+    return points + [points[0]]
+
+
+@pytest.fixture
+def mixed_data():
+    """A feature collection with every geometry type, spread over 1000x1000"""
+    rnd = random.Random(1)
+    features = []
+    for i in range(240):
+        cx, cy = rnd.uniform(0, 1000), rnd.uniform(0, 1000)
+        r = rnd.uniform(2, 60)
+        kind = i % 6
+        if kind == 0:
+            geometry = {
+                "type": "Polygon",
+                "coordinates": [ring(rnd, cx, cy, r, rnd.randint(5, 40))],
+            }
+        elif kind == 1:
+            geometry = {
+                "type": "Polygon",
+                "coordinates": [
+                    ring(rnd, cx, cy, r, 30),
+                    ring(rnd, cx, cy, r / 3, 8)[::-1],
+                ],
+            }
+        elif kind == 2:
+            geometry = {
+                "type": "MultiPolygon",
+                "coordinates": [
+                    [ring(rnd, cx, cy, r, 12)],
+                    [ring(rnd, cx + 150, cy, r, 9)],
+                ],
+            }
+        elif kind == 3:
+            geometry = {"type": "Point", "coordinates": [cx, cy]}
+        elif kind == 4:
+            geometry = {
+                "type": "MultiPoint",
+                "coordinates": [[cx, cy], [cx + 200, cy + 100], [cx - 3, cy + 400]],
+            }
+        else:
+            geometry = {
+                "type": "LineString",
+                "coordinates": [
+                    [rnd.uniform(0, 1000), rnd.uniform(0, 1000)]
+                    for _ in range(rnd.randint(2, 8))
+                ],
+            }
+        features.append(
+            {
+                "type": "Feature",
+                "id": i,
+                "geometry": geometry,
+                "properties": {"class": i % 7},
+            }
+        )
+    return {"type": "FeatureCollection", "features": features}
+
+
+def assert_same_tiles(expected, actual, coords):
+    for z, x, y in coords:
+        a = expected.get_tile(z, x, y)
+        b = actual.get_tile(z, x, y)
+        if a is None or b is None:
+            assert a is None and b is None
+            continue
+        for key in ("numPoints", "numSimplified", "numFeatures"):
+            assert a[key] == b[key]
+        assert a["features"] == b["features"]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"bounds": [0, 0, 1000, 1000], "maxZoom": 5, "indexMaxZoom": 3},
+        {
+            "bounds": [0, 0, 1000, 1000],
+            "maxZoom": 4,
+            "indexMaxZoom": 4,
+            "indexMaxPoints": 100,
+        },
+        {"maxZoom": 3, "indexMaxZoom": 3},
+    ],
+)
+def test_columnar_backend_matches_slice_backend(mixed_data, options):
+    options = {"indexMaxPoints": 0, **options}
+    expected = microjson2vt(mixed_data, {**options, "backend": "slice"})
+    actual = microjson2vt(mixed_data, {**options, "backend": "columnar"})
+
+    assert expected.stats == actual.stats
+    assert expected.tile_coords == actual.tile_coords
+    coords = [(c["z"], c["x"], c["y"]) for c in expected.tile_coords]
+    # drill down below the index
+    coords += [(5, 3, 7), (4, 10, 2), (5, 31, 31)]
+    assert_same_tiles(expected, actual, coords)
+
+
+def test_columnar_point_fast_path():
+    rng = np.random.default_rng(3)
+    # points on the tile edges of every zoom, plus random ones
+    grid = np.linspace(0, 1000, 33)
+    coordinates = [[x, y] for x in grid[::4] for y in grid] + rng.uniform(
+        0, 1000, (300, 2)
+    ).tolist()
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Point", "coordinates": c},
+            "properties": {"n": i},
+        }
+        for i, c in enumerate(coordinates)
+    ]
+    features += [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "MultiPoint",
+                "coordinates": rng.uniform(0, 1000, (5, 2)).tolist(),
+            },
+            "properties": {"n": -i},
+        }
+        for i in range(20)
+    ]
+    data = {"type": "FeatureCollection", "features": features}
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 5,
+        "indexMaxZoom": 4,
+        "indexMaxPoints": 0,
+        "generateId": True,
+    }
+    expected = microjson2vt(data, {**options, "backend": "slice"})
+    actual = microjson2vt(data, {**options, "backend": "columnar"})
+
+    assert actual._backend.points_only
+    assert expected.tile_coords == actual.tile_coords
+    coords = [(c["z"], c["x"], c["y"]) for c in expected.tile_coords]
+    coords += [(5, 8, 8), (5, 31, 0), (5, 16, 15)]
+    for z, x, y in coords:
+        a = expected.get_tile(z, x, y)
+        b = actual.get_tile(z, x, y)
+        assert len(a["features"]) == len(b["features"])
+        for f, g in zip(a["features"], b["features"]):
+            assert (f["id"], f["tags"]) == (g["id"], g["tags"])
+            # the slice backend keeps the MultiPoint vertices of lower zooms
+            # outside the buffered tile
+            assert g["geometry"] == [
+                p for p in f["geometry"] if all(-64 <= c <= 4096 + 64 for c in p)
+            ]
+
+
+def test_invalid_backend(mixed_data):
+    with pytest.raises(ValueError):
+        microjson2vt(mixed_data, {"backend": "unknown"})
+
+
+def test_clipped_linestring():
+    data = {
+        "type": "Feature",
+        "geometry": {
+            "type": "LineString",
+            "coordinates": [
+                [100, 100],
+                [100, 900],
+                [900, 900],
+                [900, 100],
+                [400, 100],
+            ],
+        },
+        "properties": {},
+    }
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 2,
+        "indexMaxZoom": 2,
+        "indexMaxPoints": 0,
+    }
+    index = microjson2vt(data, options)
+
+    # the line leaves the top-left quadrant and comes back into it
+    tile = index.get_tile(1, 0, 0)
+    assert len(tile["features"]) == 1
+    assert tile["features"][0]["type"] == 2
+    assert len(tile["features"][0]["geometry"]) == 2
+
+
+def test_polygon_winding():
+    # counter-clockwise outer ring in tile coordinates (y down)
+    data = {
+        "type": "Feature",
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[0, 0], [0, 100], [100, 100], [100, 0], [0, 0]]],
+        },
+        "properties": {},
+    }
+    for backend in ("slice", "columnar"):
+        options = {"bounds": [0, 0, 1000, 1000], "maxZoom": 0, "backend": backend}
+        tile = microjson2vt(data, options).get_tile(0, 0, 0)
+        outer = tile["features"][0]["geometry"][0]
+        area = sum(
+            (outer[i][0] - outer[i - 1][0]) * (outer[i][1] + outer[i - 1][1])
+            for i in range(len(outer))
+        )
+        assert area < 0
+
+
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_lazy_simplify_matches_eager(mixed_data, backend):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 6,
+        "indexMaxZoom": 3,
+        "indexMaxPoints": 0,
+        "backend": backend,
+    }
+    expected = microjson2vt(mixed_data, options)
+    actual = microjson2vt(mixed_data, {**options, "lazySimplify": True})
+
+    # only the zooms cut during the first pass are simplified, and they are
+    # released once the pass is done
+    cache = actual._backend.zoom_cache
+    assert cache.stats["computed"] == 4
+    assert len(cache) == 0
+
+    assert expected.tile_coords == actual.tile_coords
+    coords = [(c["z"], c["x"], c["y"]) for c in expected.tile_coords]
+    coords += [(6, 12, 30), (5, 3, 7), (6, 63, 0)]
+    assert_same_tiles(expected, actual, coords)
+
+
+def test_zoom_cache_budget():
+    cache = ZoomCache(lambda z: [z] * 10, len, max_bytes=25)
+    assert cache.get(1) == [1] * 10
+    cache.get(2)
+    cache.get(1)
+    # over budget, the least recently used zoom is evicted
+    cache.get(3)
+    assert 2 not in cache and 1 in cache and 3 in cache
+    assert cache.stats == {"computed": 3, "evicted": 1}
+    assert cache.size == 20
+
+    cache.release(2)
+    assert list(cache._zooms) == [3]
+    cache.release()
+    assert len(cache) == 0 and cache.size == 0
+
+
+def rdp(coords, sq_tolerance):
+    """Plain recursive Ramer-Douglas-Peucker, the reference for simplify"""
+    (ax, ay), (bx, by) = coords[0], coords[-1]
+    max_sq_dist, index = 0, None
+    for i in range(1, len(coords) - 1):
+        sq_dist = get_sq_seg_dist(coords[i][0], coords[i][1], ax, ay, bx, by)
+        if sq_dist > max_sq_dist:
+            max_sq_dist, index = sq_dist, i
+    if index is None or max_sq_dist <= sq_tolerance:
+        return [coords[0], coords[-1]]
+    return rdp(coords[: index + 1], sq_tolerance)[:-1] + rdp(
+        coords[index:], sq_tolerance
+    )
+
+
+def test_rank_vertices():
+    # the peak splits the line first, the others are ranked on each side
+    importance = rank_vertices([0, 1, 2, 3, 4, 5], [0, 0.1, 2, 0, 0, 0])
+    assert importance[0] == importance[-1] == float("inf")
+    assert importance[2] == pytest.approx(4)
+    assert importance[1] == pytest.approx(0.81 / 2)
+    assert importance[3] == pytest.approx(16 / 13)
+    # collinear with its neighbours once the peak is kept
+    assert importance[4] == 0
+
+    rnd = random.Random(2)
+    for _ in range(200):
+        coords = [[rnd.random(), rnd.random()] for _ in range(rnd.randint(4, 30))]
+        for sq_tolerance in (1e-4, 1e-3, 1e-2, 1e-1):
+            expected = rdp(coords, sq_tolerance)
+            if len(expected) > 3:
+                assert simplify(coords, sq_tolerance) == expected
+
+
+@pytest.mark.parametrize("axis", [0, 1])
+def test_clip_rings_matches_clip_line(axis):
+    rnd = random.Random(axis)
+    rings = []
+    for i in range(300):
+        n = rnd.randint(1, 12)
+        # snap some vertices onto the band edges
+        ring = [
+            [rnd.choice([rnd.random(), 0.25, 0.75]), rnd.random()] for _ in range(n)
+        ]
+        if i % 3 == 0:
+            ring.append(ring[0])
+        rings.append(ring)
+    kinds = [i % 3 for i in range(len(rings))]  # 0 points, 1 line, 2 polygon
+    ring_offsets = np.cumsum([0] + [len(ring) for ring in rings])
+    coords = np.array([p for ring in rings for p in ring], dtype=np.float64)
+    if axis == 1:
+        coords = coords[:, ::-1].copy()
+    kinds = np.array(kinds)
+    out, offsets, source = clip_rings(
+        coords, ring_offsets, 0.25, 0.75, axis, kinds == 2, kinds == 0
+    )
+
+    expected = []
+    for r, kind in enumerate(kinds):
+        flat = np.zeros((ring_offsets[r + 1] - ring_offsets[r], 3))
+        flat[:, :2] = coords[ring_offsets[r] : ring_offsets[r + 1]]
+        pieces = []
+        if kind == 0:
+            points = Slice([])
+            clip_points(flat.ravel().tolist(), points, 0.25, 0.75, axis)
+            pieces = [points] if len(points) > 0 else []
+        else:
+            clip_line(flat.ravel().tolist(), pieces, 0.25, 0.75, axis, kind == 2, False)
+        for piece in pieces:
+            expected.append((r, [piece[i : i + 2] for i in range(0, len(piece), 3)]))
+
+    actual = [
+        (source[i], out[offsets[i] : offsets[i + 1]].tolist())
+        for i in range(len(source))
+    ]
+    assert actual == expected
+
+
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_parallel_matches_serial(mixed_data, backend):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 6,
+        "indexMaxZoom": 5,
+        "indexMaxPoints": 20,
+        "backend": backend,
+    }
+    expected = microjson2vt(mixed_data, options)
+    actual = microjson2vt(mixed_data, {**options, "workers": 2, "parallelZoom": 2})
+
+    assert expected.stats == actual.stats
+    assert expected.total == actual.total
+    assert expected.tile_coords == actual.tile_coords
+    assert list(expected.tiles) == list(actual.tiles)
+    coords = [(c["z"], c["x"], c["y"]) for c in expected.tile_coords]
+    coords += [(6, 12, 30), (6, 40, 10)]
+    assert_same_tiles(expected, actual, coords)
+
+
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_iter_tiles(mixed_data, backend):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 4,
+        "indexMaxZoom": 4,
+        "indexMaxPoints": 0,
+        "backend": backend,
+    }
+    expected = microjson2vt(mixed_data, options)
+    index = microjson2vt(mixed_data, {**options, "indexMaxZoom": 0})
+
+    tiles = list(index.iter_tiles(1, 4))
+    # nothing is kept in the index but the root tile
+    assert len(index.tiles) == 1
+    assert [(t["z"], t["x"], t["y"]) for t in tiles] == [
+        (c["z"], c["x"], c["y"]) for c in expected.tile_coords if c["z"] >= 1
+    ]
+    for tile in tiles:
+        expected_tile = expected.get_tile(tile["z"], tile["x"], tile["y"])
+        assert tile["features"] == expected_tile["features"]
+
+    assert len(list(index.iter_tiles(0, 2))) == sum(
+        expected.stats[f"z{z}"] for z in range(3)
+    )
+
+
+@pytest.mark.parametrize("priority", ["area", "hash"])
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_max_features_per_tile(mixed_data, backend, priority):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 4,
+        "indexMaxZoom": 4,
+        "indexMaxPoints": 0,
+        "backend": backend,
+    }
+    full = microjson2vt(mixed_data, options)
+    thinned = microjson2vt(
+        mixed_data,
+        {**options, "maxFeaturesPerTile": 30, "featurePriority": priority},
+    )
+    assert thinned.tile_coords == full.tile_coords
+    for c in full.tile_coords:
+        expected = full.get_tile(c["z"], c["x"], c["y"])["features"]
+        actual = thinned.get_tile(c["z"], c["x"], c["y"])["features"]
+        assert len(actual) == min(len(expected), 30)
+        # the kept features are unchanged and in their original order
+        it = iter(expected)
+        assert all(feature in it for feature in actual)
+        if len(expected) <= 30:
+            assert actual == expected
+
+    # the same features are kept every time
+    again = microjson2vt(
+        mixed_data,
+        {**options, "maxFeaturesPerTile": 30, "featurePriority": priority},
+    )
+    assert again.get_tile(0, 0, 0) == thinned.get_tile(0, 0, 0)
+
+
+def test_feature_priority(mixed_data):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 2,
+        "maxFeaturesPerTile": 10,
+        "featurePriority": lambda features: [
+            tags.get("class", 0) for tags in features["tags"]
+        ],
+    }
+    tile = microjson2vt(mixed_data, options).get_tile(0, 0, 0)
+    assert [feature["tags"]["class"] for feature in tile["features"]] == [6] * 10
+    with pytest.raises(ValueError):
+        microjson2vt(mixed_data, {**options, "featurePriority": "unknown"})
+
+
+@pytest.mark.parametrize("small_polygons", ["drop", "point"])
+def test_min_polygon_area(mixed_data, small_polygons):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 4,
+        "indexMaxZoom": 4,
+        "indexMaxPoints": 0,
+        "minPolygonArea": 2000,
+        "smallPolygons": small_polygons,
+    }
+    expected = microjson2vt(mixed_data, {**options, "backend": "slice"})
+    actual = microjson2vt(mixed_data, {**options, "backend": "columnar"})
+    assert expected.tile_coords == actual.tile_coords
+    coords = [(c["z"], c["x"], c["y"]) for c in expected.tile_coords]
+    assert_same_tiles(expected, actual, coords)
+
+    full = microjson2vt(mixed_data, {**options, "minPolygonArea": 0})
+    before = {f["id"]: f for f in full.get_tile(0, 0, 0)["features"]}
+    after = {f["id"]: f for f in actual.get_tile(0, 0, 0)["features"]}
+    small = [id_ for id_, f in before.items() if f["type"] == 3 and id_ not in after]
+    if small_polygons == "point":
+        collapsed = [
+            id_
+            for id_, f in after.items()
+            if f["type"] == 1 and before[id_]["type"] == 3
+        ]
+        assert len(collapsed) > 0 and small == []
+        for id_ in collapsed:
+            assert after[id_]["tags"] == before[id_]["tags"]
+            # one point for each polygon of a MultiPolygon
+            assert len(after[id_]["geometry"]) == (2 if int(id_) % 6 == 2 else 1)
+    else:
+        assert len(small) > 0
+        assert all(f["type"] == before[id_]["type"] for id_, f in after.items())
+    # every polygon is kept where it is large enough
+    last = microjson2vt(mixed_data, {**options, "minPolygonArea": 1})
+    assert_same_tiles(full, last, [(4, 5, 5), (4, 9, 2)])
+
+
+def test_dissolve(mixed_data):
+    options = {"bounds": [0, 0, 1000, 1000], "maxZoom": 3, "indexMaxZoom": 1}
+    full = microjson2vt(mixed_data, options)
+    dissolved = microjson2vt(
+        mixed_data,
+        {
+            **options,
+            "dissolveMaxZoom": 1,
+            "dissolveBy": "class",
+            "dissolveSum": ["class"],
+        },
+    )
+    for z, x, y in [(0, 0, 0), (1, 1, 0)]:
+        before = full.get_tile(z, x, y)["features"]
+        after = dissolved.get_tile(z, x, y)["features"]
+        assert [f for f in after if f["type"] != 3] == [
+            f for f in before if f["type"] != 3
+        ]
+        polygons = [f for f in before if f["type"] == 3]
+        merged = [f for f in after if f["type"] == 3]
+        classes = {f["tags"]["class"] for f in polygons}
+        assert sorted(f["tags"]["class"] for f in merged) == sorted(classes)
+        assert sum(f["tags"]["count"] for f in merged) == len(polygons)
+        for f in merged:
+            assert "id" not in f
+            assert f["tags"]["class_sum"] == f["tags"]["class"] * f["tags"]["count"]
+    # deeper tiles are left as they are
+    assert dissolved.get_tile(2, 1, 1) == full.get_tile(2, 1, 1)
+
+    # overlapping squares become one outer ring
+    squares = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [
+                        [[x, x], [x + 100, x], [x + 100, x + 100], [x, x + 100], [x, x]]
+                    ],
+                },
+                "properties": {"n": x},
+            }
+            for x in (100, 150, 600)
+        ],
+    }
+    tile = microjson2vt(
+        squares, {**options, "dissolveMaxZoom": 0, "dissolveSum": ["n"]}
+    ).get_tile(0, 0, 0)
+    assert len(tile["features"]) == 1
+    feature = tile["features"][0]
+    assert feature["tags"] == {"count": 3, "n_sum": 850}
+    assert len(feature["geometry"]) == 2
+    for ring in feature["geometry"]:
+        area = sum(
+            (ring[i][0] - ring[i - 1][0]) * (ring[i][1] + ring[i - 1][1])
+            for i in range(len(ring))
+        )
+        assert area < 0
+
+
+def test_layers(mixed_data):
+    options = {"bounds": [0, 0, 1000, 1000], "maxZoom": 3, "indexMaxZoom": 1}
+    full = microjson2vt(mixed_data, options)
+    layered = microjson2vt(
+        mixed_data,
+        {**options, "layerBy": "class", "layerZooms": {5: [0, 3], 0: [2, 3]}},
+    )
+    for z, x, y in [(0, 0, 0), (1, 1, 0), (2, 1, 2), (3, 2, 5)]:
+        before = full.get_tile(z, x, y)["features"]
+        tile = layered.get_tile(z, x, y)
+        # the listed layers first, the others in the order of their features
+        names = [5, 0] if z >= 2 else [5]
+        names += list(dict.fromkeys(f["tags"]["class"] for f in before))
+        names = list(dict.fromkeys(n for n in names if z >= 2 or n != 0))
+        assert list(tile["layers"]) == names
+        for name, features in tile["layers"].items():
+            assert features == [f for f in before if f["tags"]["class"] == name]
+        assert tile["features"] == [f for n in names for f in tile["layers"][n]]
+
+    # polygons are merged within their layer
+    dissolved = microjson2vt(
+        mixed_data, {**options, "layerBy": "class", "dissolveMaxZoom": 0}
+    ).get_tile(0, 0, 0)
+    for name, features in dissolved["layers"].items():
+        merged = [f for f in features if f["type"] == 3]
+        assert len(merged) == 1
+        assert merged[0]["tags"]["count"] == sum(
+            f["type"] == 3 and f["tags"]["class"] == name
+            for f in full.get_tile(0, 0, 0)["features"]
+        )
+
+
+def without_duplicates(feature):
+    if feature["type"] == 1:
+        return feature["geometry"]
+    rings = []
+    for ring in feature["geometry"]:
+        ring = [p for i, p in enumerate(ring) if i == 0 or p != ring[i - 1]]
+        if len(ring) >= (4 if feature["type"] == 3 else 2):
+            rings.append(ring)
+    return rings
+
+
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_array_geometry(mixed_data, backend):
+    # a ring and a line with vertices closer than a pixel at zoom 0
+    mixed_data["features"] += [
+        {
+            "type": "Feature",
+            "geometry": {"type": "Polygon", "coordinates": [square]},
+            "properties": {"class": 7},
+        }
+        for square in (
+            [[500, 500], [500.01, 500], [600, 500], [600, 600], [500, 600], [500, 500]],
+            [[10, 10], [10.01, 10], [10.01, 10.01], [10, 10.01], [10, 10]],
+        )
+    ]
+    mixed_data["features"].append(
+        {
+            "type": "Feature",
+            "geometry": {"type": "LineString", "coordinates": [[1, 1], [1.01, 1]]},
+            "properties": {"class": 7},
+        }
+    )
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 5,
+        "indexMaxZoom": 2,
+        "indexMaxPoints": 0,
+        "tolerance": 0,
+        "backend": backend,
+    }
+    lists = microjson2vt(mixed_data, options)
+    arrays = microjson2vt(mixed_data, {**options, "arrayGeometry": True})
+
+    coords = [(c["z"], c["x"], c["y"]) for c in lists.tile_coords]
+    for z, x, y in coords + [(5, 3, 7), (4, 10, 2)]:
+        expected = []
+        for feature in lists.get_tile(z, x, y)["features"]:
+            geometry = without_duplicates(feature)
+            if len(geometry) > 0:
+                expected.append({**feature, "geometry": geometry})
+        actual = arrays.get_tile(z, x, y)["features"]
+        assert [f["geometry"].tolist() for f in actual] == [
+            f["geometry"] for f in expected
+        ]
+        for f, g in zip(actual, expected):
+            assert (f["type"], f["tags"]) == (g["type"], g["tags"])
+            assert f.get("id") == g.get("id")
+            # it iterates like the lists
+            assert [r.tolist() for r in f["geometry"]] == g["geometry"]
+            assert len(f["geometry"]) == len(g["geometry"])
+        # the arrays are encoded as the lists would be
+        for f in actual + expected:
+            f.pop("id", None)
+        assert vt2pbf({"features": actual}) == vt2pbf({"features": expected})
+
+    tile = arrays.get_tile(0, 0, 0)
+    assert tile["features"][0]["geometry"].rings.coords.dtype == np.int32
+    before = lists.get_tile(0, 0, 0)["features"]
+    squares = [f["geometry"] for f in before if f["tags"]["class"] == 7]
+    after = [
+        f["geometry"].tolist() for f in tile["features"] if f["tags"]["class"] == 7
+    ]
+    # the duplicate vertex is dropped, the sub-pixel square and line are left out
+    assert len(squares) == 3 and len(after) == 1
+    assert len(after[0][0]) == len(squares[0][0]) - 1
+
+
+@pytest.mark.parametrize("array_geometry", [False, True])
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_wire_encoder(mixed_data, backend, array_geometry):
+    for i, feature in enumerate(mixed_data["features"]):
+        feature["properties"].update(
+            {"name": f"cell {i % 5}", "area": i / 4, "offset": -i, "live": i % 2 == 0}
+        )
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 4,
+        "indexMaxZoom": 4,
+        "indexMaxPoints": 0,
+        "backend": backend,
+        "arrayGeometry": array_geometry,
+    }
+    index = microjson2vt(mixed_data, options)
+    sizes = set()
+    for c in index.tile_coords:
+        tile = index.get_tile(c["z"], c["x"], c["y"])
+        sizes.add(len(tile["features"]) >= 128)
+        # the ids are encoded as integers, as by the TileWriter
+        for feature in tile["features"]:
+            feature["id"] = int(feature["id"])
+        # the same bytes as the protobuf encoder, for large and small layers
+        wire = vt2pbf(tile, encoder="wire")
+        assert wire == vt2pbf(tile)
+        decoded = mapbox_vector_tile.decode(wire)["geojsonLayer"]
+        assert decoded["extent"] == 4096
+        assert [f["id"] for f in decoded["features"]] == [
+            f["id"] for f in tile["features"]
+        ]
+        for f, g in zip(decoded["features"], tile["features"]):
+            assert f["properties"] == g["tags"]
+    assert sizes == {False, True}
+
+    with pytest.raises(ValueError):
+        vt2pbf(index.get_tile(0, 0, 0), encoder="json")
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_instrumentation(mixed_data, backend, workers):
+    calls = []
+    timer = Instrumentation(lambda stage, z, measurement: calls.append(stage))
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 4,
+        "indexMaxZoom": 4,
+        "indexMaxPoints": 0,
+        "backend": backend,
+        "workers": workers,
+        "parallelZoom": 1,
+    }
+    index = microjson2vt(mixed_data, {**options, "instrumentation": timer})
+    report = timer.report()
+
+    assert report["convert"]["calls"] == 1
+    assert report["convert"]["features_out"] == len(mixed_data["features"])
+    assert sorted(report["simplify"]["zooms"]) == [0, 1, 2, 3, 4]
+    # the tiles of the worker processes are counted as well, and each
+    # worker creates the root tile of its subtree again
+    roots = index.stats["z1"] if workers > 1 else 0
+    assert report["create_tile"]["calls"] == index.total + roots
+    for z in range(5):
+        zoom = report["create_tile"]["zooms"][z]
+        assert zoom["calls"] == index.stats[f"z{z}"] + (roots if z == 1 else 0)
+        assert zoom["wall"] >= 0 and zoom["cpu"] >= 0
+    assert report["split"]["features_in"] == sum(
+        zoom["features_in"] for zoom in report["split"]["zooms"].values()
+    )
+    if workers == 1:
+        assert len(calls) == sum(stage["calls"] for stage in report.values())
+
+    index.get_tile(2, 1, 1)
+    assert timer.report()["transform"]["zooms"][2]["calls"] == 1
+    # disabled instrumentation does not change the tiles
+    plain = microjson2vt(mixed_data, options)
+    assert plain.instrumentation is None
+    assert plain.get_tile(2, 1, 1) == index.get_tile(2, 1, 1)
+
+
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_sparse(mixed_data, backend):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 5,
+        "indexMaxZoom": 5,
+        "indexMaxPoints": 0,
+        "backend": backend,
+    }
+    dense = microjson2vt(mixed_data, options)
+    sparse = microjson2vt(mixed_data, {**options, "sparse": True})
+
+    non_empty = [
+        c
+        for c in dense.tile_coords
+        if dense.tiles[to_Id(c["z"], c["x"], c["y"])]["numFeatures"] > 0
+    ]
+    assert len(non_empty) < len(dense.tile_coords)
+    assert sparse.tile_coords == non_empty
+    for c in dense.tile_coords:
+        tile = (c["z"], c["x"], c["y"])
+        assert (tile in sparse.occupancy) == (c in non_empty)
+    # only a sparse index records which tiles have content
+    assert dense.occupancy is None
+    assert_same_tiles(dense, sparse, [(c["z"], c["x"], c["y"]) for c in non_empty])
+
+    streamed = microjson2vt(mixed_data, {**options, "sparse": True, "indexMaxZoom": 0})
+    tiles = list(streamed.iter_tiles())
+    assert [(t["z"], t["x"], t["y"]) for t in tiles] == [
+        (c["z"], c["x"], c["y"]) for c in non_empty
+    ]
+
+
+def test_feature_index():
+    rnd = np.random.default_rng(2)
+    min_x = rnd.uniform(0, 1, 1000)
+    min_y = rnd.uniform(0, 1, 1000)
+    max_x = min_x + rnd.uniform(0, 0.05, 1000)
+    max_y = min_y + rnd.uniform(0, 0.05, 1000)
+    index = FeatureIndex(min_x, min_y, max_x, max_y, node_size=8)
+    assert len(index) == 1000
+    for _ in range(50):
+        x1, y1 = rnd.uniform(0, 1, 2)
+        x2, y2 = x1 + rnd.uniform(0, 0.3), y1 + rnd.uniform(0, 0.3)
+        expected = np.flatnonzero(
+            (min_x <= x2) & (max_x >= x1) & (min_y <= y2) & (max_y >= y1)
+        )
+        assert index.query(x1, y1, x2, y2).tolist() == expected.tolist()
+    # edges touching the query box count
+    assert index.query(max_x[7], max_y[7], 2, 2).tolist().count(7) == 1
+    assert FeatureIndex([], [], [], []).query(0, 0, 1, 1).tolist() == []
+
+
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_drill_down(mixed_data, backend):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 5,
+        "indexMaxPoints": 0,
+        "backend": backend,
+    }
+    full = microjson2vt(mixed_data, {**options, "indexMaxZoom": 5})
+    drilled = microjson2vt(mixed_data, {**options, "indexMaxZoom": 1})
+    coords = [
+        (c["z"], c["x"], c["y"])
+        for c in full.tile_coords
+        if full.tiles[to_Id(c["z"], c["x"], c["y"])]["numFeatures"] > 0
+    ]
+    assert_same_tiles(full, drilled, coords[::-1])
+    # only the requested tiles were added, each drilled from a zoom 1 tile
+    assert drilled.total == len(coords)
+    assert len(drilled._source_indexes) == drilled.stats["z1"]
+    assert drilled.get_tile(6, 0, 0) is None
+
+
+@pytest.mark.parametrize(
+    "limits", [{"tileCacheSize": 10}, {"tileCacheBytes": 200 * 1024}]
+)
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_tile_cache(mixed_data, backend, limits):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 5,
+        "indexMaxZoom": 2,
+        "indexMaxPoints": 0,
+        "backend": backend,
+    }
+    full = microjson2vt(mixed_data, {**options, "indexMaxZoom": 5})
+    cached = microjson2vt(mixed_data, {**options, **limits})
+    coords = [
+        (c["z"], c["x"], c["y"])
+        for c in full.tile_coords
+        if full.tiles[to_Id(c["z"], c["x"], c["y"])]["numFeatures"] > 0
+    ]
+    coords = random.Random(4).sample(coords, 100)
+    assert_same_tiles(full, cached, coords + coords[:20])
+
+    assert cached.stats["evicted"] > 0
+    assert cached.stats["hits"] + cached.stats["misses"] == 120
+    assert len(cached.tiles) == len(cached._tile_cache)
+    assert len(cached.tile_coords) == len(cached.tiles)
+    if "tileCacheSize" in limits:
+        assert len(cached.tiles) <= 10
+    else:
+        assert cached._tile_cache.size <= 200 * 1024
+
+    # the most recently used tile is kept
+    z, x, y = coords[0]
+    cached.get_tile(z, x, y)
+    hits = cached.stats["hits"]
+    cached.get_tile(z, x, y)
+    assert cached.stats["hits"] == hits + 1
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_tile_cache_empty_tiles(mixed_data, backend, sparse):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 5,
+        "indexMaxZoom": 2,
+        "indexMaxPoints": 0,
+        "backend": backend,
+        "sparse": sparse,
+    }
+    plain = microjson2vt(mixed_data, options)
+    cached = microjson2vt(mixed_data, {**options, "tileCacheSize": 10})
+    coords = [(z, x, y) for z in range(6) for x in range(1 << z) for y in range(1 << z)]
+    random.Random(5).shuffle(coords)
+    for z, x, y in coords:
+        cached.get_tile(z, x, y)
+    assert cached.stats["evicted"] > 0
+    # empty tiles are the same whether their ancestors were evicted or not,
+    # empty tiles without the sparse option and None with it
+    tiles = [plain.get_tile(z, x, y) for z, x, y in coords]
+    empty = [tile for tile in tiles if tile is None or tile["numFeatures"] == 0]
+    assert empty and all((tile is None) == sparse for tile in empty)
+    assert_same_tiles(plain, cached, coords)
+
+
+@pytest.mark.parametrize("lazy", [False, True])
+@pytest.mark.parametrize("backend", ["slice", "columnar"])
+def test_edit_features(mixed_data, backend, lazy):
+    options = {
+        "bounds": [0, 0, 1000, 1000],
+        "maxZoom": 4,
+        "indexMaxZoom": 4,
+        "indexMaxPoints": 0,
+        "backend": backend,
+        "lazySimplify": lazy,
+    }
+    features = mixed_data["features"]
+    moved = {**features[5], "geometry": {"type": "Point", "coordinates": [10, 10]}}
+
+    def collection(features):
+        return {"type": "FeatureCollection", "features": features}
+
+    before = microjson2vt(collection(features[:-1]), options)
+    after = microjson2vt(
+        collection(features[:5] + [moved, features[6]] + features[8:]), options
+    )
+
+    edited = microjson2vt(collection(features[:-1]), {**options, "indexMaxZoom": 2})
+    for c in edited.tile_coords:
+        edited.get_tile(c["z"], c["x"], c["y"])
+    dirty = edited.add_feature(features[-1])
+    dirty += edited.replace_feature(5, moved)
+    dirty += edited.remove_feature("7")
+    with pytest.raises(KeyError):
+        edited.remove_feature(7)
+    coords = [(c["z"], c["x"], c["y"]) for c in after.tile_coords]
+    assert_same_tiles(after, edited, coords)
+
+    # every changed tile is reported, but not the whole pyramid
+    dirty = {(c["z"], c["x"], c["y"]) for c in dirty}
+    changed = {
+        (c["z"], c["x"], c["y"])
+        for c in after.tile_coords
+        if before.get_tile(c["z"], c["x"], c["y"])["features"]
+        != after.get_tile(c["z"], c["x"], c["y"])["features"]
+    }
+    assert changed and changed <= dirty
+    assert len(dirty) < len(after.tile_coords)
+
+
+def test_tile_occupancy():
+    occupancy = TileOccupancy()
+    tiles = [(0, 0, 0), (3, 7, 0), (3, 0, 7), (3, 2, 5), (10, 1023, 1023)]
+    for tile in tiles:
+        occupancy.add(*tile)
+
+    assert all(tile in occupancy for tile in tiles)
+    assert (3, 5, 2) not in occupancy
+    assert (3, 8, 0) not in occupancy
+    assert (4, 0, 0) not in occupancy
+    assert occupancy.count(3) == 3
+    assert sorted(occupancy.tiles(3)) == [(0, 7), (2, 5), (7, 0)]
+
+    # the bytes of high zooms are held sparsely
+    deep = [(18, 262143, 262143), (18, 5, 9), (18, 4, 9)]
+    for tile in deep:
+        occupancy.add(*tile)
+    occupancy.add(18, 7, 7)
+    occupancy.discard(18, 7, 7)
+    assert len(occupancy.bitmaps[18]) == 2
+    assert all(tile in occupancy for tile in deep)
+    assert (18, 7, 7) not in occupancy
+    assert occupancy.count(18) == 3
+    assert sorted(occupancy.tiles(18)) == [(4, 9), (5, 9), (262143, 262143)]
+
+    restored = TileOccupancy.from_dict(json.loads(json.dumps(occupancy.to_dict())))
+    assert restored.bitmaps == occupancy.bitmaps
+    assert list(restored.tiles(10)) == [(1023, 1023)]
+    assert sorted(restored.tiles(18)) == sorted(occupancy.tiles(18))
+
+
+@pytest.mark.parametrize("sparse", [False, True])
+def test_deep_tile_memory(sparse):
+    data = {
+        "type": "FeatureCollection",
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {
+                    "type": "Polygon",
+                    "coordinates": [[[1, 1], [2, 1], [2, 2], [1, 2], [1, 1]]],
+                },
+                "properties": {},
+            }
+        ],
+    }
+    options = {"bounds": [0, 0, 1000, 1000], "maxZoom": 18, "sparse": sparse}
+    tracemalloc.start()
+    try:
+        index = microjson2vt(data, options)
+        assert index.get_tile(16, 98, 98) is not None
+        assert index.get_tile(18, 393, 393) is not None
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    assert peak < 64 * 1024 * 1024
+    if sparse:
+        assert (18, 393, 393) in index.occupancy
+    else:
+        assert index.occupancy is None
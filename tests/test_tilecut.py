@@ -1,18 +1,45 @@
 # Generate a MicroJSON file using the polygon generator
+import json
 import os
 import random
 import shutil
+import stat
 import string
+import mapbox_vector_tile
 import microjson as mj
 import pytest
-from microjson.tilewriter import getbounds, TileWriter
+from microjson.examples.benchmark import (
+    DEFAULT_MAXZOOMS,
+    compare_results,
+    run_benchmarks,
+    write_dataset,
+)
+from microjson.mbtiles import MBTiles
+from microjson.microjson2vt.instrumentation import Instrumentation
+from microjson.microjson2vt.microjson2vt import AVAILABLE_TOLERANCE_FUNCTIONS
+from microjson.microjson2vt.occupancy import TileOccupancy
+from microjson.tilereader import TileReader
+from microjson import tilewriter
+from microjson.tilewriter import (
+    ENCODE_CHUNK_SIZE,
+    encode_tile,
+    encode_tiles,
+    getbounds,
+    iter_encoded_tiles,
+    TileWriter,
+)
+from microjson.pmtiles import (
+    COMPRESSION_GZIP,
+    COMPRESSION_NONE,
+    PMTiles,
+    zxy_to_tileid,
+)
 from microjson.polygen import assign_meta_types_and_values, generate_polygons
 
 
 @pytest.fixture
 def tempfolder():
-    tempfolder = "tmp{}".format("".join(
-        random.choices(string.ascii_lowercase, k=6)))
+    tempfolder = "tmp{}".format("".join(random.choices(string.ascii_lowercase, k=6)))
     os.makedirs(tempfolder, exist_ok=True)
     yield tempfolder
     shutil.rmtree(tempfolder, ignore_errors=True)
@@ -23,16 +50,15 @@ def test_tilecut(tempfolder):
     # Create folder with random name, a string of 6 characters
     microjson_data_path = f"{tempfolder}/polygons.json"
     # Parameters
-    GRID_SIZE = 50000      # Total size of the grid
-    CELL_SIZE = 500        # Size of each cell
-    MIN_VERTICES = 5       # Minimum number of vertices per polygon
-    MAX_VERTICES = 32      # Maximum number of vertices per polygon
-    N_VARIANTS = 40         # Number of possible values for each meta key
-    N_KEYS = 10            # Number of meta keys
+    GRID_SIZE = 50000  # Total size of the grid
+    CELL_SIZE = 500  # Size of each cell
+    MIN_VERTICES = 5  # Minimum number of vertices per polygon
+    MAX_VERTICES = 32  # Maximum number of vertices per polygon
+    N_VARIANTS = 40  # Number of possible values for each meta key
+    N_KEYS = 10  # Number of meta keys
 
     # Assign data types and generate 4 values for each meta key
-    meta_types, meta_values_options = assign_meta_types_and_values(
-        N_KEYS, N_VARIANTS)
+    meta_types, meta_values_options = assign_meta_types_and_values(N_KEYS, N_VARIANTS)
 
     # Generate the feature collection
     feature_collection = generate_polygons(
@@ -42,7 +68,7 @@ def test_tilecut(tempfolder):
         MAX_VERTICES,
         meta_types,
         meta_values_options,
-        microjson_data_path
+        microjson_data_path,
     )
 
     # Check that the feature collection was created
@@ -67,9 +93,7 @@ def test_tilecut(tempfolder):
     maxbounds[0] = 0
     maxbounds[1] = 0
 
-    center = [0,
-              (maxbounds[0] + maxbounds[2]) / 2,
-              (maxbounds[1] + maxbounds[3]) / 2]
+    center = [0, (maxbounds[0] + maxbounds[2]) / 2, (maxbounds[1] + maxbounds[3]) / 2]
 
     tileobj = mj.tilemodel.TileModel(
         tilejson="3.0.0",
@@ -103,3 +127,623 @@ def test_tilecut(tempfolder):
 
     # Check that the tiles were created
     assert len(tiles) > 0
+
+
+def test_sparse_tiles(tempfolder):
+    # a few squares in one corner of a large field
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [
+                    [[x, y], [x + 50, y], [x + 50, y + 50], [x, y + 50], [x, y]]
+                ],
+            },
+            "properties": {"name": f"square{x}_{y}"},
+        }
+        for x in range(0, 400, 100)
+        for y in range(0, 400, 100)
+    ]
+    microjson_data_path = f"{tempfolder}/squares.json"
+    with open(microjson_data_path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+    def tile_model(path):
+        return mj.tilemodel.TileModel(
+            tilejson="3.0.0",
+            tiles=[f"{tempfolder}/{path}/{{z}}/{{x}}/{{y}}.pbf"],
+            name="Sparse tiles",
+            minzoom=0,
+            maxzoom=4,
+            bounds=[0, 0, 4000, 4000],
+            center=[0, 2000, 2000],
+            vector_layers=[
+                mj.tilemodel.TileLayer(id="squares", fields={}, minzoom=0, maxzoom=4)
+            ],
+        )
+
+    dense = TileWriter(tile_model("dense"), pbf=True).microjson2tiles(
+        microjson_data_path
+    )
+    writer = TileWriter(tile_model("sparse"), pbf=True, sparse=True)
+    sparse = writer.microjson2tiles(
+        microjson_data_path, instrumentation=Instrumentation()
+    )
+
+    # only the tiles covering the corner are written
+    assert 0 < len(sparse) < len(dense)
+    assert len(sparse) == 1 + 1 + 1 + 1 + 4
+    occupancy = TileOccupancy.load(writer.occupancy_path())
+    assert writer.occupancy_path() == f"{tempfolder}/sparse/occupancy.json"
+    for path in sparse:
+        z, x, y = [int(p) for p in path[:-4].split("/")[-3:]]
+        assert (z, x, y) in occupancy
+
+    report = writer.instrumentation.report()
+    for stage in ("load", "index", "convert", "create_tile", "encode", "write"):
+        assert report[stage]["calls"] > 0
+    assert report["write"]["calls"] == len(sparse)
+    assert report["write"]["bytes_out"] == sum(os.path.getsize(p) for p in sparse)
+    assert sorted(report["encode"]["zooms"]) == [0, 1, 2, 3, 4]
+
+    for zlvl in range(5):
+        expected = TileReader(tile_model("dense"), pbf=True).tiles2microjson(zlvl)
+        actual = TileReader(tile_model("sparse"), pbf=True).tiles2microjson(zlvl)
+        assert actual == expected
+
+
+@pytest.mark.parametrize("layer_property", [None, "kind"])
+def test_multiple_layers(tempfolder, layer_property):
+    # nested squares of three classes, and one of no layer
+    features = []
+    for x in range(0, 4000, 1000):
+        for y in range(0, 4000, 1000):
+            for kind, size in (("tissue", 900), ("cell", 300), ("nucleus", 100)):
+                features.append(
+                    {
+                        "type": "Feature",
+                        "geometry": {
+                            "type": "Polygon",
+                            "coordinates": [
+                                [
+                                    [x, y],
+                                    [x + size, y],
+                                    [x + size, y + size],
+                                    [x, y + size],
+                                    [x, y],
+                                ]
+                            ],
+                        },
+                        "properties": {"kind": kind, "size": size},
+                        "featureClass": kind,
+                    }
+                )
+    features[0]["featureClass"] = features[0]["properties"]["kind"] = "other"
+    microjson_data_path = f"{tempfolder}/layers.json"
+    with open(microjson_data_path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+    zooms = {"tissue": (0, 2), "cell": (1, 3), "nucleus": (2, 4)}
+    tile_model = mj.tilemodel.TileModel(
+        tilejson="3.0.0",
+        tiles=[f"{tempfolder}/tiles/{{z}}/{{x}}/{{y}}.pbf"],
+        name="Layers",
+        minzoom=0,
+        maxzoom=10,
+        bounds=[0, 0, 4000, 4000],
+        center=[0, 2000, 2000],
+        vector_layers=[
+            mj.tilemodel.TileLayer(id=id_, fields={}, minzoom=low, maxzoom=high)
+            for id_, (low, high) in zooms.items()
+        ],
+    )
+    writer = TileWriter(tile_model, pbf=True)
+    tiles = writer.microjson2tiles(microjson_data_path, layer_property=layer_property)
+
+    # the tileset spans the zooms of its layers
+    assert len(tiles) == sum(4**z for z in range(5))
+    sizes = {}
+    for path in tiles:
+        z = int(path.split("/")[-3])
+        with open(path, "rb") as f:
+            tile = mapbox_vector_tile.decode(f.read())
+        visible = {id_ for id_, (low, high) in zooms.items() if low <= z <= high}
+        assert set(tile) <= visible
+        for id_, layer in tile.items():
+            for feature in layer["features"]:
+                assert feature["properties"]["kind"] == id_
+                sizes.setdefault(id_, set()).add(feature["properties"]["size"])
+    # the feature of no layer is left out
+    assert sizes == {"tissue": {900}, "cell": {300}, "nucleus": {100}}
+
+    microjson_data = TileReader(tile_model, pbf=True).tiles2microjson(2)
+    kinds = [feature["properties"]["kind"] for feature in microjson_data["features"]]
+    assert sorted(set(kinds)) == ["cell", "nucleus", "tissue"]
+
+
+def test_benchmark(tempfolder):
+    first = write_dataset("lines", 50, 3, f"{tempfolder}/first.json")
+    second = write_dataset("lines", 50, 3, f"{tempfolder}/second.json")
+    assert first == second
+    with open(f"{tempfolder}/first.json") as f, open(f"{tempfolder}/second.json") as g:
+        assert f.read() == g.read()
+
+    results = run_benchmarks(
+        tempfolder,
+        scales=[30],
+        formats=["json", "pbf"],
+        maxzooms=[1, 2],
+        tolerances=["default"],
+        isolate=False,
+    )
+    assert len(results["results"]) == 3 * 2 * 2
+    for result in results["results"]:
+        assert result["tiles"] == (5 if result["maxzoom"] == 1 else 21)
+        assert result["output_bytes"] > 0
+        assert 0 <= result["duplicate_ratio"] < 1
+        assert result["features_per_second"] > 0
+        assert {"load", "index", "encode", "write"} <= set(result["stages"])
+    # the results are plain JSON, to compare with later runs
+    results = json.loads(json.dumps(results))
+    comparison = compare_results(results, results)
+    assert len(comparison) == 12
+    assert not any(row["regression"] for row in comparison)
+    # by default, every tolerance function runs at several maxzooms
+    results = run_benchmarks(
+        tempfolder, scales=[30], kinds=["lines"], formats=["json"], isolate=False
+    )
+    cases = {(row["maxzoom"], row["tolerance"]) for row in results["results"]}
+    assert cases == {
+        (maxzoom, tolerance)
+        for maxzoom in DEFAULT_MAXZOOMS
+        for tolerance in AVAILABLE_TOLERANCE_FUNCTIONS
+    }
+    assert len(DEFAULT_MAXZOOMS) > 1
+    # only the tiles of the runs are removed
+    assert sorted(os.listdir(tempfolder)) == ["first.json", "second.json"]
+
+
+@pytest.mark.parametrize("tile_format", ["pbf", "json", "parquet"])
+def test_encode_tiles(tempfolder, tile_format):
+    microjson_data_path = f"{tempfolder}/lines.json"
+    side = write_dataset("lines", 200, 5, microjson_data_path)["side"]
+    bounds = [0, 0, side, side]
+
+    def write(workers):
+        tile_model = mj.tilemodel.TileModel(
+            tilejson="3.0.0",
+            tiles=[f"{tempfolder}/{workers}/{{z}}/{{x}}/{{y}}.{tile_format}"],
+            name="Lines",
+            minzoom=0,
+            maxzoom=4,
+            bounds=bounds,
+            center=[0, bounds[2] / 2, bounds[3] / 2],
+            vector_layers=[
+                mj.tilemodel.TileLayer(id="lines", fields={}, minzoom=0, maxzoom=4)
+            ],
+        )
+        writer = TileWriter(
+            tile_model, pbf=tile_format == "pbf", parquet=tile_format == "parquet"
+        )
+        instrumentation = Instrumentation()
+        paths = writer.microjson2tiles(
+            microjson_data_path, instrumentation=instrumentation, workers=workers
+        )
+        report = instrumentation.report()
+        assert report["encode"]["calls"] == report["write"]["calls"] == len(paths)
+        contents = []
+        for path in paths:
+            with open(path, "rb") as f:
+                relpath = os.path.relpath(path, f"{tempfolder}/{workers}")
+                contents.append((relpath, f.read()))
+        return contents
+
+    # the tiles encoded in worker processes are the same, in the same order
+    serial = write(1)
+    assert {path.split(os.sep)[0] for path, _ in serial} == {"0", "1", "2", "3", "4"}
+    assert write(2) == serial
+
+    with pytest.raises(ValueError):
+        encode_tiles([], "svg")
+
+    # the tiles are read as the workers need them
+    read = []
+
+    def tiles():
+        for i in range(1000):
+            read.append(i)
+            yield {"z": 0, "features": []}
+
+    encoded = iter_encoded_tiles(tiles(), "pbf", workers=2)
+    assert next(encoded)[0] == {"z": 0, "features": []}
+    assert len(read) == 2 * 2 * ENCODE_CHUNK_SIZE
+    assert len(list(encoded)) == 999
+
+
+def write_squares(folder):
+    """
+    Writes a few squares in one corner of a square covering the field, so
+    that only the tiles inside it are the same, and returns the path.
+    """
+    features = [
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [
+                    [[x, y], [x + 50, y], [x + 50, y + 50], [x, y + 50], [x, y]]
+                ],
+            },
+            "properties": {"name": f"square{x}_{y}"},
+        }
+        for x in range(0, 400, 100)
+        for y in range(0, 400, 100)
+    ]
+    features.append(
+        {
+            "type": "Feature",
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [[[0, 0], [4000, 0], [4000, 4000], [0, 4000], [0, 0]]],
+            },
+            "properties": {"name": "field"},
+        }
+    )
+    microjson_data_path = f"{folder}/squares.json"
+    with open(microjson_data_path, "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+    return microjson_data_path
+
+
+def squares_model(tiles):
+    return mj.tilemodel.TileModel(
+        tilejson="3.0.0",
+        tiles=[tiles],
+        name="Squares",
+        minzoom=0,
+        maxzoom=3,
+        bounds=[0, 0, 4000, 4000],
+        center=[0, 2000, 2000],
+        vector_layers=[
+            mj.tilemodel.TileLayer(id="squares", fields={}, minzoom=0, maxzoom=3)
+        ],
+    )
+
+
+@pytest.mark.parametrize("pbf", [True, False])
+def test_mbtiles(tempfolder, pbf):
+    microjson_data_path = write_squares(tempfolder)
+    extension = "pbf" if pbf else "json"
+
+    files = squares_model(f"{tempfolder}/files/{{z}}/{{x}}/{{y}}.{extension}")
+    mbtiles_path = f"{tempfolder}/squares.mbtiles"
+    mbtiles = squares_model(mbtiles_path)
+    paths = TileWriter(files, pbf=pbf).microjson2tiles(microjson_data_path)
+    tiles = TileWriter(mbtiles, pbf=pbf).microjson2tiles(microjson_data_path)
+    assert len(tiles) == len(paths) == 1 + 4 + 16 + 64
+    # no directory of tiles
+    assert sorted(os.listdir(tempfolder)) == [
+        "files",
+        "squares.json",
+        "squares.mbtiles",
+    ]
+
+    with MBTiles(mbtiles_path) as store:
+        for path, tile in zip(paths, tiles):
+            z, x, y = [int(p) for p in tile.split("/")[-3:]]
+            with open(path, "rb") as f:
+                assert store.get_tile(z, x, y) == f.read()
+        assert store.get_tile(4, 0, 0) is None
+        assert sorted(store.tile_coords(1)) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+        # the tiles inside the field are stored once, JSON tiles hold their
+        # coordinates
+        images = store.connection.execute("SELECT COUNT(*) FROM images").fetchone()
+        assert (images[0] < len(tiles)) == pbf
+        metadata = store.metadata()
+    assert metadata["format"] == extension
+    assert (metadata["minzoom"], metadata["maxzoom"]) == ("0", "3")
+    assert metadata["bounds"] == "0.0,0.0,4000.0,4000.0"
+    assert json.loads(metadata["json"])["vector_layers"][0]["id"] == "squares"
+
+    for zlvl in range(4 if pbf else 0):
+        expected = TileReader(files, pbf=True).tiles2microjson(zlvl)
+        actual = TileReader(mbtiles, pbf=True).tiles2microjson(zlvl)
+        assert len(actual["features"]) > 0
+        assert actual == expected
+
+
+def test_mbtiles_rewrite(tempfolder):
+    mbtiles_path = f"{tempfolder}/tiles.mbtiles"
+    with MBTiles(mbtiles_path, "w") as store:
+        store.add_tile(3, 1, 1, b"old")
+    # writing again replaces the tiles of the earlier tileset
+    with MBTiles(mbtiles_path, "w") as store:
+        store.add_tile(0, 0, 0, b"new")
+        # the earlier tileset is kept until the new one is complete
+        with MBTiles(mbtiles_path) as earlier:
+            assert earlier.get_tile(3, 1, 1) == b"old"
+    assert os.listdir(tempfolder) == ["tiles.mbtiles"]
+    with MBTiles(mbtiles_path) as store:
+        assert store.get_tile(3, 1, 1) is None
+        assert list(store.tile_coords(3)) == []
+        assert store.get_tile(0, 0, 0) == b"new"
+        images = store.connection.execute("SELECT COUNT(*) FROM images").fetchone()
+        assert images[0] == 1
+
+
+def test_mbtiles_closed_on_error(tempfolder, monkeypatch):
+    mbtiles_path = f"{tempfolder}/tiles.mbtiles"
+    with MBTiles(mbtiles_path, "w") as store:
+        store.add_tile(0, 0, 0, b"not a tile")
+    closed = []
+    close = MBTiles.close
+    monkeypatch.setattr(MBTiles, "close", lambda self: closed.append(close(self)))
+    with pytest.raises(Exception):
+        TileReader(squares_model(mbtiles_path), pbf=True).tiles2microjson(0)
+    assert len(closed) == 1
+
+
+def test_pmtiles(tempfolder):
+    microjson_data_path = write_squares(tempfolder)
+    files = squares_model(f"{tempfolder}/files/{{z}}/{{x}}/{{y}}.pbf")
+    pmtiles_path = f"{tempfolder}/squares.pmtiles"
+    pmtiles = squares_model(pmtiles_path)
+    paths = TileWriter(files, pbf=True).microjson2tiles(microjson_data_path)
+    tiles = TileWriter(pmtiles, pbf=True).microjson2tiles(
+        microjson_data_path, workers=2
+    )
+    assert len(tiles) == len(paths) == 1 + 4 + 16 + 64
+    # no temporary file is left
+    assert sorted(os.listdir(tempfolder)) == [
+        "files",
+        "squares.json",
+        "squares.pmtiles",
+    ]
+
+    with PMTiles(pmtiles_path) as archive:
+        for path, tile in zip(paths, tiles):
+            z, x, y = [int(p) for p in tile.split("/")[-3:]]
+            with open(path, "rb") as f:
+                assert archive.get_tile(z, x, y) == f.read()
+        assert archive.get_tile(4, 0, 0) is None
+        header = archive.header
+        assert header["addressed_tiles_count"] == len(tiles)
+        # the tiles inside the field are stored once, and the runs of them
+        # along the Hilbert curve share an entry
+        assert header["tile_contents_count"] < header["tile_entries_count"]
+        assert header["tile_entries_count"] < len(tiles)
+        assert (header["clustered"], header["tile_type"]) == (1, 1)
+        assert (header["min_zoom"], header["max_zoom"]) == (0, 3)
+        # the bounds of the squares are not geographic
+        assert (header["min_lon_e7"], header["max_lat_e7"]) == (-1800000000, 850511287)
+        metadata = archive.metadata()
+    assert metadata["format"] == "pbf"
+    assert metadata["vector_layers"][0]["id"] == "squares"
+
+    for zlvl in range(4):
+        expected = TileReader(files, pbf=True).tiles2microjson(zlvl)
+        actual = TileReader(pmtiles, pbf=True).tiles2microjson(zlvl)
+        assert len(actual["features"]) > 0
+        assert actual == expected
+
+
+def test_pmtiles_lonlat_bounds(tempfolder):
+    tile_model = squares_model(f"{tempfolder}/world.pmtiles")
+    tile_model.bounds = [-10.5, 40, 20, 60.25]
+    tile_model.center = [5, 50, 2]
+    with PMTiles(tile_model.tiles[0], "w") as archive:
+        archive.write_metadata(tile_model, "pbf")
+        archive.add_tile(0, 0, 0, b"tile")
+    with PMTiles(tile_model.tiles[0]) as archive:
+        header = archive.header
+    assert [
+        header[key] for key in ("min_lon_e7", "min_lat_e7", "max_lon_e7", "max_lat_e7")
+    ] == [-105000000, 400000000, 200000000, 602500000]
+    assert (header["center_lon_e7"], header["center_lat_e7"]) == (50000000, 500000000)
+
+
+@pytest.mark.parametrize("extension", ["pmtiles", "mbtiles"])
+def test_store_failed_run(tempfolder, monkeypatch, extension):
+    microjson_data_path = write_squares(tempfolder)
+    path = f"{tempfolder}/squares.{extension}"
+    writer = TileWriter(squares_model(path), pbf=True)
+    writer.microjson2tiles(microjson_data_path)
+    with open(path, "rb") as f:
+        archive = f.read()
+
+    encoded = []
+
+    def failing_encode_tile(tile, tile_format):
+        if len(encoded) == 10:
+            raise RuntimeError("encoding failed")
+        encoded.append(tile)
+        return encode_tile(tile, tile_format)
+
+    monkeypatch.setattr(tilewriter, "encode_tile", failing_encode_tile)
+    with pytest.raises(RuntimeError):
+        writer.microjson2tiles(microjson_data_path)
+    # no archive with only some of the tiles, nor a temporary file, is left,
+    # and the archive of the earlier run is kept
+    assert sorted(os.listdir(tempfolder)) == ["squares.json", f"squares.{extension}"]
+    with open(path, "rb") as f:
+        assert f.read() == archive
+
+
+@pytest.mark.parametrize("compression", [COMPRESSION_GZIP, COMPRESSION_NONE])
+def test_pmtiles_leaf_directories(tempfolder, compression):
+    assert zxy_to_tileid(0, 0, 0) == 0
+    assert [zxy_to_tileid(1, x, y) for x, y in ((0, 0), (0, 1), (1, 1), (1, 0))] == [
+        1,
+        2,
+        3,
+        4,
+    ]
+    assert zxy_to_tileid(12, 3423, 1763) == 19078479
+
+    # too many distinct tiles for the root directory, added in any order
+    rnd = random.Random(2)
+    tiles = {
+        (8, x, y): f"{x}/{y}".encode() if rnd.random() < 0.7 else b"same"
+        for x in range(256)
+        for y in range(128)
+    }
+    path = f"{tempfolder}/tiles.pmtiles"
+    with PMTiles(path, "w", compression=compression) as archive:
+        for (z, x, y), data in sorted(tiles.items(), key=lambda _: rnd.random()):
+            archive.add_tile(z, x, y, data)
+    with PMTiles(path) as archive:
+        assert archive.header["leaf_dirs_length"] > 0
+        assert archive.header["root_dir_length"] + 127 <= 16384
+        assert archive.header["internal_compression"] == compression
+        for (z, x, y), data in tiles.items():
+            assert archive.get_tile(z, x, y) == data
+        assert archive.get_tile(8, 0, 128) is None
+        assert archive.get_tile(7, 0, 0) is None
+        assert archive.get_tile(9, 0, 0) is None
+
+
+@pytest.mark.parametrize(
+    "link_duplicates, workers", [("hard", 1), ("hard", 2), ("symbolic", 1), (None, 1)]
+)
+def test_link_duplicates(tempfolder, link_duplicates, workers):
+    microjson_data_path = write_squares(tempfolder)
+    tile_model = squares_model(f"{tempfolder}/tiles/{{z}}/{{x}}/{{y}}.pbf")
+    writer = TileWriter(tile_model, pbf=True)
+    # twice, the second run replacing the links of the first
+    for _ in range(2):
+        paths = writer.microjson2tiles(
+            microjson_data_path,
+            instrumentation=Instrumentation(),
+            workers=workers,
+            link_duplicates=link_duplicates,
+        )
+
+    contents = {}
+    for path in paths:
+        with open(path, "rb") as f:
+            contents[path] = f.read()
+    expected = TileWriter(
+        squares_model(f"{tempfolder}/copies/{{z}}/{{x}}/{{y}}.pbf"), pbf=True
+    ).microjson2tiles(microjson_data_path, link_duplicates=None)
+    for path, copy in zip(paths, expected):
+        with open(copy, "rb") as f:
+            assert contents[path] == f.read()
+
+    # the tiles inside the field are the same
+    stats = writer.tile_stats
+    distinct = len(set(contents.values()))
+    assert stats["tiles"] == len(paths)
+    assert stats["distinct_tiles"] == distinct < len(paths)
+    assert stats["duplicate_ratio"] == pytest.approx(1 - distinct / len(paths))
+    assert stats["distinct_bytes"] < stats["bytes"]
+    report = writer.instrumentation.report()
+    assert report["write"]["duplicates"] == len(paths) - distinct
+
+    links = [path for path in paths if os.path.islink(path)]
+    linked = [path for path in paths if os.stat(path).st_nlink > 1]
+    if link_duplicates == "symbolic":
+        assert len(links) == len(paths) - distinct and not linked
+    elif link_duplicates == "hard":
+        assert len(linked) > len(paths) - distinct and not links
+    else:
+        assert not links and not linked
+
+    with pytest.raises(ValueError):
+        writer.microjson2tiles(microjson_data_path, link_duplicates="soft")
+
+
+def tile_files(folder):
+    """Returns the relative paths of the tile files under a folder."""
+    return sorted(
+        os.path.relpath(os.path.join(root, name), folder)
+        for root, _, names in os.walk(folder)
+        for name in names
+        if name.endswith(".pbf")
+    )
+
+
+@pytest.mark.parametrize(
+    "sparse, link_duplicates, workers",
+    [(False, "hard", 2), (True, "symbolic", 1), (True, None, 1)],
+)
+def test_incremental(tempfolder, sparse, link_duplicates, workers):
+    microjson_data_path = write_squares(tempfolder)
+    with open(microjson_data_path) as f:
+        data = json.load(f)
+    folder = f"{tempfolder}/tiles"
+    tile_model = squares_model(f"{folder}/{{z}}/{{x}}/{{y}}.pbf")
+    writer = TileWriter(tile_model, pbf=True, sparse=sparse)
+    paths = writer.microjson2tiles(
+        microjson_data_path,
+        link_duplicates=link_duplicates,
+        incremental=True,
+        workers=workers,
+    )
+    assert os.path.exists(writer.manifest_path())
+    assert writer.tile_stats["unchanged"] == writer.tile_stats["deleted"] == 0
+
+    def move_square(features):
+        square = features[0]["geometry"]["coordinates"][0]
+        features[0]["geometry"]["coordinates"][0] = [[x + 3000, y] for x, y in square]
+
+    # a square moved to the other side, then the field covering all tiles
+    # removed, which drops the tiles without squares from a sparse tileset
+    for step, edit in enumerate([move_square, lambda features: features.pop()]):
+        edit(data["features"])
+        with open(microjson_data_path, "w") as f:
+            json.dump(data, f)
+        before = {path: os.lstat(path) for path in paths}
+        written = writer.microjson2tiles(
+            microjson_data_path,
+            link_duplicates=link_duplicates,
+            incremental=True,
+            workers=workers,
+        )
+        stats = writer.tile_stats
+
+        expected_folder = f"{tempfolder}/expected{step}"
+        expected = squares_model(f"{expected_folder}/{{z}}/{{x}}/{{y}}.pbf")
+        TileWriter(expected, pbf=True, sparse=sparse).microjson2tiles(
+            microjson_data_path, link_duplicates=None
+        )
+        assert tile_files(folder) == tile_files(expected_folder)
+        for path in tile_files(folder):
+            with open(os.path.join(folder, path), "rb") as f:
+                tile = f.read()
+            with open(os.path.join(expected_folder, path), "rb") as f:
+                assert tile == f.read()
+
+        # only the tiles reached by the change were written
+        assert 0 < len(written) < len(before)
+        untouched = [path for path in before if path not in written]
+        assert untouched
+        for path in untouched:
+            # links to a tile written again are replaced by copies
+            if os.path.exists(path) and not stat.S_ISLNK(before[path].st_mode):
+                after = os.lstat(path)
+                assert after.st_ino == before[path].st_ino
+                assert after.st_mtime_ns == before[path].st_mtime_ns
+        assert stats["tiles"] == len(written) + stats["unchanged"]
+        if sparse and step == 1:
+            assert stats["deleted"] > 0
+            occupancy = TileOccupancy.load(writer.occupancy_path())
+            assert sum(occupancy.count(z) for z in range(4)) == len(tile_files(folder))
+        paths = [os.path.join(folder, path) for path in tile_files(folder)]
+
+    # the order of the features is part of the tiles
+    data["features"].reverse()
+    with open(microjson_data_path, "w") as f:
+        json.dump(data, f)
+    written = writer.microjson2tiles(
+        microjson_data_path,
+        link_duplicates=link_duplicates,
+        incremental=True,
+        workers=workers,
+    )
+    assert len(written) == writer.tile_stats["tiles"]
+
+    with pytest.raises(ValueError):
+        TileWriter(squares_model(f"{tempfolder}/squares.pmtiles")).microjson2tiles(
+            microjson_data_path, incremental=True
+        )